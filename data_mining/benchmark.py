@@ -0,0 +1,272 @@
+"""
+Benchmark de Extremo a Extremo: Extracción y Clustering
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Genera (o reutiliza) una base sintética por escala con synthetic_data, ejecuta
+cada etapa de la extracción de features y del clustering multi-nivel, y mide
+para cada una tiempo de pared, tiempo de CPU y pico de memoria residente (RSS).
+Los resultados se añaden a un fichero JSON Lines y se comparan con la última
+ejecución anterior de la misma escala para detectar regresiones.
+
+Uso:
+    python benchmark.py --scales 10k 100k
+    python benchmark.py --scales 10k --stages extraction kmeans gmm --threshold 1.25
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import subprocess
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+from instrumentation import PeakMemorySampler
+from synthetic_data import SyntheticAuraGenerator, scale_users
+
+RESULTS_PATH = 'benchmark_results.jsonl'
+DATA_DIR = 'benchmark_data'
+
+CLUSTERING_STAGES = ['load', 'prepare_features', 'kmeans', 'dbscan', 'hierarchical', 'gmm', 'ensemble']
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class BenchmarkRunner:
+    """Ejecuta y mide las etapas de extracción y clustering a varias escalas"""
+
+    def __init__(self, data_dir=DATA_DIR, results_path=RESULTS_PATH, seed=42,
+                 max_workers=1, verbose=False):
+        """
+        Args:
+            data_dir: Directorio donde se guardan las bases sintéticas generadas
+            results_path: Fichero JSON Lines con el histórico de resultados
+            seed: Semilla de la generación
+            max_workers: Consultas simultáneas de FeatureExtractor
+            verbose: Mostrar la salida de cada etapa
+        """
+        self.data_dir = data_dir
+        self.results_path = results_path
+        self.seed = seed
+        self.max_workers = max_workers
+        self.verbose = verbose
+        self.run_id = uuid.uuid4().hex[:12]
+        self.commit = _git_commit()
+        self.results = []
+
+    def measure(self, scale, stage, func, rows=None):
+        """
+        Ejecuta una etapa midiendo tiempo de pared, CPU y pico de RSS
+
+        Returns:
+            Resultado de func
+        """
+        gc.collect()
+        output = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        with PeakMemorySampler() as memory, output:
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            result = func()
+            cpu = time.process_time() - cpu_start
+            wall = time.perf_counter() - wall_start
+
+        if rows is None and hasattr(result, '__len__'):
+            rows = len(result)
+        self._record(scale, stage, {
+            'wall_s': round(wall, 4),
+            'cpu_s': round(cpu, 4),
+            'peak_rss_mb': round(memory.peak_rss / 1024**2, 1),
+            'rss_delta_mb': round((memory.peak_rss - memory.start_rss) / 1024**2, 1),
+            'rows': rows,
+        })
+        return result
+
+    def _record(self, scale, stage, metrics):
+        record = {
+            'run_id': self.run_id,
+            'commit': self.commit,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'scale': scale,
+            'n_users': scale_users(scale),
+            'stage': stage,
+            **metrics,
+        }
+        self.results.append(record)
+        line = f"  {stage:<28}"
+        if 'skipped' in metrics:
+            line += f" omitida ({metrics['skipped']})"
+        else:
+            line += (f" {metrics['wall_s']:>9.3f}s  CPU {metrics['cpu_s']:>9.3f}s  "
+                     f"pico RSS {metrics['peak_rss_mb']:>8.1f} MB (+{metrics['rss_delta_mb']:.1f})")
+        print(line)
+
+    def _database(self, scale):
+        """Fichero SQLite de la escala; se genera (y se mide) solo si no existe"""
+        n_users = scale_users(scale)
+        path = os.path.join(self.data_dir, f"aura_{scale}_seed{self.seed}.db")
+        generator = SyntheticAuraGenerator(n_users, seed=self.seed)
+        if not os.path.exists(path):
+            from local_db import create_local_engine
+            os.makedirs(self.data_dir, exist_ok=True)
+            tmp_path = path + '.tmp'
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            engine = create_local_engine(tmp_path, now=generator.now)
+            row_counts = self.measure(scale, 'generate', lambda: generator.generate(engine))
+            engine.dispose()
+            os.replace(tmp_path, path)
+            self.results[-1]['rows'] = int(sum(row_counts.values()))
+        return path, generator.now
+
+    def run_extraction(self, scale, engine):
+        """Mide cada consulta de extracción, la combinación y la escritura al almacén"""
+        from extract_features import FeatureExtractor
+
+        extractor = FeatureExtractor(engine, None, max_workers=self.max_workers)
+        extractor._start_run()
+        frames = {}
+        for name, _, method in extractor._extraction_steps():
+            frames[name] = self.measure(scale, f'extract.{name}', method)
+        features = self.measure(scale, 'extract.combine', lambda: extractor._combine_features(frames))
+
+        store_root = os.path.join(self.data_dir, f'feature_store_{scale}')
+        self.measure(scale, 'store.write', lambda: extractor.save_to_store(features, root=store_root),
+                     rows=len(features))
+        return store_root
+
+    def run_clustering(self, scale, store_root, stages):
+        """Mide las etapas de MultiLevelClusteringSystem sobre el almacén generado"""
+        import matplotlib
+        matplotlib.use('Agg')
+        from clustering_system import MultiLevelClusteringSystem
+
+        system = self.measure(scale, 'load', lambda: MultiLevelClusteringSystem(store_root))
+        n_users = len(system.df)
+        self.results[-1]['rows'] = n_users
+        self.measure(scale, 'prepare_features', system.prepare_features)
+
+        calls = {
+            'kmeans': lambda: system.kmeans_clustering(n_clusters=4, visualize=False, cache_dir=None),
+            'dbscan': lambda: system.dbscan_clustering(eps=0.8, min_samples=15, visualize=False),
+            'hierarchical': lambda: system.hierarchical_clustering(n_clusters=4, visualize=False),
+            'gmm': lambda: system.gmm_clustering(n_components=4, visualize=False, state_path=None)[0],
+            'ensemble': system.ensemble_risk_score,
+        }
+        for stage in CLUSTERING_STAGES[2:]:
+            if stage not in stages:
+                continue
+            if stage == 'ensemble' and not {'kmeans', 'dbscan', 'gmm'} <= set(stages):
+                self._record(scale, stage, {'skipped': 'requiere kmeans, dbscan y gmm'})
+                continue
+            np.random.seed(self.seed)
+            self.measure(scale, stage, calls[stage], rows=n_users)
+
+    def run(self, scales, stages):
+        """Ejecuta el benchmark en cada escala y guarda los resultados"""
+        from local_db import create_local_engine
+
+        for scale in scales:
+            print(f"\n=== BENCHMARK {scale} ({scale_users(scale)} usuarios) ===")
+            path, now = self._database(scale)
+            engine = create_local_engine(path, now=now)
+            store_root = None
+            if 'extraction' in stages:
+                store_root = self.run_extraction(scale, engine)
+            engine.dispose()
+
+            if set(stages) & set(CLUSTERING_STAGES):
+                store_root = store_root or os.path.join(self.data_dir, f'feature_store_{scale}')
+                if not os.path.isdir(store_root):
+                    print("  ⚠️ Sin almacén de features: ejecuta también la etapa 'extraction'")
+                    continue
+                self.run_clustering(scale, store_root, stages)
+
+        self.save()
+        return self.results
+
+    def save(self):
+        with open(self.results_path, 'a') as f:
+            for record in self.results:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+        print(f"\nResultados añadidos a: {self.results_path}")
+
+    def compare(self, threshold=1.2, metrics=('wall_s', 'peak_rss_mb')):
+        """
+        Compara esta ejecución con la anterior más reciente de cada escala y etapa
+
+        Args:
+            threshold: Cociente actual/anterior a partir del cual hay regresión
+
+        Returns:
+            Lista de regresiones (diccionarios con escala, etapa, métrica y valores)
+        """
+        previous = {}
+        if os.path.exists(self.results_path):
+            with open(self.results_path) as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record['run_id'] != self.run_id and 'skipped' not in record:
+                        previous[(record['scale'], record['stage'])] = record
+
+        regressions = []
+        print(f"\n=== COMPARACIÓN CON LA EJECUCIÓN ANTERIOR (umbral x{threshold}) ===")
+        for record in self.results:
+            baseline = previous.get((record['scale'], record['stage']))
+            if baseline is None or 'skipped' in record:
+                continue
+            for metric in metrics:
+                before, after = baseline.get(metric), record.get(metric)
+                if not before or after is None:
+                    continue
+                ratio = after / before
+                marker = ''
+                # Por debajo de 50 ms el ruido domina
+                if ratio > threshold and not (metric == 'wall_s' and after < 0.05):
+                    marker = ' ⚠️ REGRESIÓN'
+                    regressions.append({
+                        'scale': record['scale'], 'stage': record['stage'], 'metric': metric,
+                        'before': before, 'after': after, 'ratio': round(ratio, 3),
+                        'baseline_commit': baseline.get('commit'),
+                    })
+                print(f"  {record['scale']:>5} {record['stage']:<28} {metric:<12} "
+                      f"{before:>10} -> {after:<10} x{ratio:.2f}{marker}")
+
+        if not regressions:
+            print("  Sin regresiones")
+        return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de extracción y clustering sobre datos sintéticos")
+    parser.add_argument('--scales', nargs='+', default=['10k'], help="Escalas: 10k, 100k, 1m o nº de usuarios")
+    parser.add_argument('--stages', nargs='+', default=['extraction'] + CLUSTERING_STAGES[2:],
+                        help="extraction y/o etapas de clustering (kmeans, dbscan, hierarchical, gmm, ensemble)")
+    parser.add_argument('--seed', type=int, default=42, help="Semilla de los datos sintéticos")
+    parser.add_argument('--workers', type=int, default=1, help="Consultas simultáneas de la extracción")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Directorio de las bases generadas")
+    parser.add_argument('--results', default=RESULTS_PATH, help="Histórico de resultados (JSON Lines)")
+    parser.add_argument('--threshold', type=float, default=1.2, help="Cociente de regresión")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Salir con código 1 si hay regresiones")
+    parser.add_argument('--verbose', action='store_true', help="Mostrar la salida de cada etapa")
+    args = parser.parse_args()
+
+    runner = BenchmarkRunner(
+        data_dir=args.data_dir, results_path=args.results, seed=args.seed,
+        max_workers=args.workers, verbose=args.verbose,
+    )
+    runner.run(args.scales, args.stages)
+    regressions = runner.compare(threshold=args.threshold)
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
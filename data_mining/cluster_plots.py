@@ -0,0 +1,126 @@
+"""
+Visualización de Clusters: Proyección PCA Cacheada y Diezmado de Puntos
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+- ProjectionCache: una sola proyección PCA 2D por matriz de features (clave =
+  huella del contenido), compartida por todas las visualizaciones.
+- decimate: submuestreo que conserva la densidad: reparte el presupuesto de
+  puntos por celda de una rejilla 2D y cluster, con al menos un punto por
+  grupo, de modo que regiones poco densas y outliers siguen visibles.
+- scatter_clusters: dispersión completa, diezmada o hexbin (color = cluster
+  mayoritario de cada hexágono) según el presupuesto de puntos.
+- use_headless_backend: backend Agg salvo que MPLBACKEND o un kernel de
+  Jupyter indiquen otro, para ejecutar en lote sin pantalla.
+
+Las dependencias pesadas (PCA, matplotlib) se importan solo al usarse.
+"""
+
+import os
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+
+def use_headless_backend():
+    """Selecciona Agg antes de importar pyplot si no hay un backend explícito"""
+    import matplotlib
+    if 'matplotlib.pyplot' in sys.modules:
+        return
+    if 'MPLBACKEND' not in os.environ and 'ipykernel' not in sys.modules:
+        matplotlib.use('Agg')
+
+
+class ProjectionCache:
+    """Proyecciones PCA 2D por huella de la matriz (LRU)"""
+
+    def __init__(self, max_entries=4, random_state=42):
+        self.max_entries = max_entries
+        self.random_state = random_state
+        self._entries = OrderedDict()
+
+    def get(self, X):
+        """
+        Returns:
+            Tupla (PCA ajustado, coordenadas 2D de cada fila de X)
+        """
+        from kmeans_sweep import data_fingerprint
+        from sklearn.decomposition import PCA
+
+        X = np.asarray(X)
+        key = data_fingerprint(X)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        pca = PCA(n_components=2, random_state=self.random_state)
+        entry = (pca, pca.fit_transform(X))
+        self._entries[key] = entry
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+
+def decimate(points, labels, max_points, grid_size=64, random_state=42):
+    """
+    Índices de una submuestra de como máximo ~max_points que conserva la densidad
+
+    Cada grupo (celda de la rejilla, cluster) recibe una cuota proporcional a
+    su tamaño y al menos un punto; dentro del grupo la elección es aleatoria.
+
+    Returns:
+        Índices ordenados de las filas conservadas
+    """
+    n = len(points)
+    if n <= max_points:
+        return np.arange(n)
+    rng = np.random.default_rng(random_state)
+
+    mins = points.min(axis=0)
+    spans = np.maximum(points.max(axis=0) - mins, 1e-12)
+    cells = np.minimum(((points - mins) / spans * grid_size).astype(np.int64), grid_size - 1)
+    _, label_codes = np.unique(labels, return_inverse=True)
+    _, groups = np.unique((cells[:, 0] * grid_size + cells[:, 1]) * (label_codes.max() + 1) + label_codes,
+                          return_inverse=True)
+
+    counts = np.bincount(groups)
+    # La cuota mínima de 1 por grupo se descuenta del reparto proporcional
+    rate = max(max_points - len(counts), 0) / n
+    quota = np.maximum(np.floor(counts * rate).astype(np.int64), 1)
+
+    order = np.lexsort((rng.random(n), groups))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - starts[groups[order]]
+    return np.flatnonzero(rank < quota[groups])
+
+
+def scatter_clusters(ax, points, labels, max_points=50_000, mode='auto', random_state=42):
+    """
+    Dibuja los clusters sobre ax respetando el presupuesto de puntos
+
+    Args:
+        mode: 'scatter' (todos), 'decimate', 'hexbin' o 'auto' (todos si caben
+            en max_points, si no diezmado)
+
+    Returns:
+        Artista para la barra de color y descripción de lo dibujado
+    """
+    labels = np.asarray(labels)
+    if mode == 'auto':
+        mode = 'scatter' if len(points) <= max_points else 'decimate'
+
+    if mode == 'hexbin':
+        # Color de cada hexágono: cluster más frecuente entre sus usuarios
+        _, codes = np.unique(labels, return_inverse=True)
+        artist = ax.hexbin(points[:, 0], points[:, 1], C=codes, gridsize=120, cmap='viridis', mincnt=1,
+                           reduce_C_function=lambda values: np.bincount(np.asarray(values, dtype=np.int64)).argmax())
+        return artist, f"hexbin de {len(points)} usuarios"
+
+    keep = np.arange(len(points)) if mode == 'scatter' else decimate(points, labels, max_points,
+                                                                      random_state=random_state)
+    artist = ax.scatter(points[keep, 0], points[keep, 1], c=labels[keep], cmap='viridis',
+                        alpha=0.6, s=12 if len(keep) < len(points) else None, rasterized=True)
+    if len(keep) < len(points):
+        return artist, f"{len(keep)} de {len(points)} usuarios (diezmado por densidad)"
+    return artist, f"{len(points)} usuarios"
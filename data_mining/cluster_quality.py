@@ -0,0 +1,305 @@
+"""
+Métricas de Calidad de Clustering Aproximadas con Intervalos de Confianza
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+silhouette_score sobre todos los usuarios necesita O(n²) distancias y memoria.
+Este módulo estima cada métrica con un intervalo de confianza y un tope de
+memoria configurable:
+
+- Silhouette: muestra estratificada por cluster; para cada usuario muestreado
+  se calcula su silhouette exacto frente a todos los usuarios (o frente a una
+  referencia estratificada si el nº de distancias supera max_pairs), con
+  distancias por bloques que nunca superan max_memory_mb. IC normal con la
+  varianza del muestreo estratificado.
+- Davies-Bouldin y Calinski-Harabasz: valor exacto en O(n·d) por bloques e IC
+  bootstrap de Poisson (pesos por usuario, sin copiar los datos).
+- BIC y AIC de un GMM: valor exacto e IC normal a partir de la varianza de la
+  log-verosimilitud por usuario.
+
+Uso:
+    python cluster_quality.py --data feature_store --clusters 4 --sample 5000
+"""
+
+import argparse
+
+import numpy as np
+from scipy import sparse
+from scipy.stats import norm
+from sklearn.metrics import pairwise_distances_chunked
+from sklearn.utils import gen_batches
+
+METRIC_LABELS = {
+    'silhouette': ('Silhouette Score', 'mayor es mejor, rango: -1 a 1'),
+    'davies_bouldin': ('Davies-Bouldin Index', 'menor es mejor'),
+    'calinski_harabasz': ('Calinski-Harabasz Index', 'mayor es mejor'),
+    'bic': ('BIC', 'menor es mejor'),
+    'aic': ('AIC', 'menor es mejor'),
+}
+
+
+def _estimate(value, ci_low, ci_high, method, n):
+    return {'value': float(value), 'ci_low': float(ci_low), 'ci_high': float(ci_high), 'method': method, 'n': int(n)}
+
+
+class ClusterQuality:
+    """Estimación de métricas de calidad con IC y memoria acotada"""
+
+    def __init__(self, sample_size=5000, max_pairs=200_000_000, max_memory_mb=256,
+                 n_bootstrap=30, confidence=0.95, min_per_cluster=20, random_state=42):
+        """
+        Args:
+            sample_size: Usuarios muestreados para el silhouette (todos si hay menos)
+            max_pairs: Distancias máximas del silhouette; por encima, la referencia
+                de cada usuario muestreado es una submuestra estratificada
+            max_memory_mb: Memoria máxima de cada bloque de distancias o de datos
+            n_bootstrap: Réplicas bootstrap de Davies-Bouldin y Calinski-Harabasz
+            confidence: Nivel de los intervalos de confianza
+            min_per_cluster: Usuarios mínimos por cluster en las muestras estratificadas
+            random_state: Semilla de muestras y réplicas
+        """
+        self.sample_size = sample_size
+        self.max_pairs = max_pairs
+        self.max_memory_mb = max_memory_mb
+        self.n_bootstrap = n_bootstrap
+        self.confidence = confidence
+        self.min_per_cluster = min_per_cluster
+        self.random_state = random_state
+        self._z = norm.ppf(0.5 + confidence / 2)
+
+    def _row_batches(self, n_rows, n_cols):
+        """Bloques de filas cuyo trabajo en float64 (≈4 copias) cabe en max_memory_mb"""
+        rows = max(1, int(self.max_memory_mb * 2**20 / (8 * max(n_cols, 1) * 4)))
+        return gen_batches(n_rows, rows)
+
+    def _stratified_sample(self, codes, size, rng):
+        """Índices muestreados por cluster: asignación proporcional con un mínimo por cluster"""
+        counts = np.bincount(codes)
+        if size >= len(codes):
+            return np.arange(len(codes))
+        alloc = np.minimum(counts, np.maximum(np.round(counts * size / len(codes)).astype(int),
+                                              self.min_per_cluster))
+        members = np.argsort(codes, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        chosen = [
+            members[start + rng.choice(count, take, replace=False)]
+            for start, count, take in zip(starts, counts, alloc) if take > 0
+        ]
+        return np.sort(np.concatenate(chosen))
+
+    def silhouette(self, X, labels):
+        """
+        Silhouette medio estimado por muestreo estratificado
+
+        Returns:
+            Diccionario con value, ci_low, ci_high, method y n (usuarios muestreados)
+        """
+        X = np.asarray(X, dtype=np.float64)
+        _, codes = np.unique(labels, return_inverse=True)
+        counts = np.bincount(codes)
+        n_clusters = len(counts)
+        if n_clusters < 2 or n_clusters >= len(X):
+            return None
+        rng = np.random.default_rng(self.random_state)
+
+        sample = self._stratified_sample(codes, self.sample_size, rng)
+        if len(sample) * len(X) <= self.max_pairs:
+            reference = np.arange(len(X))
+            method = 'exacto' if len(sample) == len(X) else 'muestra'
+        else:
+            reference = self._stratified_sample(codes, max(self.max_pairs // len(sample), n_clusters), rng)
+            method = 'muestra+referencia'
+
+        ref_codes = codes[reference]
+        ref_counts = np.bincount(ref_codes, minlength=n_clusters).astype(np.float64)
+        onehot = sparse.csr_matrix(
+            (np.ones(len(reference)), (np.arange(len(reference)), ref_codes)),
+            shape=(len(reference), n_clusters),
+        )
+        # Suma de distancias de cada usuario muestreado a cada cluster de la referencia
+        sums = np.vstack(list(pairwise_distances_chunked(
+            X[sample], X[reference], working_memory=self.max_memory_mb,
+            reduce_func=lambda chunk, start: np.asarray((onehot.T @ chunk.T).T),
+        )))
+
+        own = codes[sample]
+        in_reference = np.isin(sample, reference)
+        own_counts = ref_counts[own] - in_reference
+        rows = np.arange(len(sample))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a = sums[rows, own] / own_counts
+            means = sums / ref_counts
+            means[rows, own] = np.inf
+            b = means.min(axis=1)
+            values = (b - a) / np.maximum(a, b)
+        # Convención de sklearn: silhouette 0 en clusters de un solo usuario
+        values = np.where((counts[own] > 1) & np.isfinite(values), values, 0.0)
+
+        # Estimador estratificado: media de cada cluster ponderada por su tamaño
+        weights = counts / counts.sum()
+        n_h = np.bincount(own, minlength=n_clusters)
+        mean_h = np.bincount(own, weights=values, minlength=n_clusters) / np.maximum(n_h, 1)
+        value = float((weights * mean_h).sum())
+        if method == 'exacto':
+            return _estimate(value, value, value, method, len(sample))
+
+        sq = np.bincount(own, weights=(values - mean_h[own]) ** 2, minlength=n_clusters)
+        var_h = sq / np.maximum(n_h - 1, 1)
+        fpc = 1 - n_h / counts
+        se = float(np.sqrt((weights**2 * fpc * var_h / np.maximum(n_h, 1)).sum()))
+        return _estimate(value, value - self._z * se, value + self._z * se, method, len(sample))
+
+    def _dispersion(self, X, codes, n_clusters, weights=None):
+        """Davies-Bouldin y Calinski-Harabasz ponderados por usuario, por bloques de filas"""
+        w = np.ones(len(X)) if weights is None else weights
+        sizes = np.bincount(codes, weights=w, minlength=n_clusters)
+        centers = np.zeros((n_clusters, X.shape[1]))
+        for batch in self._row_batches(len(X), X.shape[1]):
+            np.add.at(centers, codes[batch], X[batch] * w[batch, None])
+        total = w.sum()
+        overall = centers.sum(axis=0) / total
+        centers = centers / np.maximum(sizes, 1e-12)[:, None]
+
+        intra = np.zeros(n_clusters)
+        within = 0.0
+        for batch in self._row_batches(len(X), X.shape[1]):
+            diff = X[batch] - centers[codes[batch]]
+            sq = np.einsum('ij,ij->i', diff, diff)
+            intra += np.bincount(codes[batch], weights=w[batch] * np.sqrt(sq), minlength=n_clusters)
+            within += float((w[batch] * sq).sum())
+
+        present = sizes > 0
+        k = int(present.sum())
+        centers, sizes, intra = centers[present], sizes[present], intra[present] / sizes[present]
+
+        between = float((sizes * ((centers - overall) ** 2).sum(axis=1)).sum())
+        ch = 1.0 if within == 0 else between * (total - k) / (within * (k - 1))
+
+        # Misma convención que sklearn.metrics.davies_bouldin_score
+        centroid_dist = np.sqrt(((centers[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2))
+        if np.allclose(intra, 0) or np.allclose(centroid_dist, 0):
+            db = 0.0
+        else:
+            centroid_dist[centroid_dist == 0] = np.inf
+            scores = (intra[:, None] + intra[None, :]) / centroid_dist
+            np.fill_diagonal(scores, -np.inf)
+            db = float(scores.max(axis=1).mean())
+        return db, ch
+
+    def dispersion_indices(self, X, labels):
+        """
+        Davies-Bouldin y Calinski-Harabasz exactos con IC bootstrap de Poisson
+
+        Returns:
+            Diccionario {'davies_bouldin': ..., 'calinski_harabasz': ...}
+        """
+        X = np.asarray(X, dtype=np.float64)
+        _, codes = np.unique(labels, return_inverse=True)
+        n_clusters = codes.max() + 1 if len(codes) else 0
+        if n_clusters < 2 or n_clusters >= len(X):
+            return {'davies_bouldin': None, 'calinski_harabasz': None}
+
+        db, ch = self._dispersion(X, codes, n_clusters)
+        rng = np.random.default_rng(self.random_state)
+        replicas = np.array([
+            self._dispersion(X, codes, n_clusters, rng.poisson(1.0, len(X)).astype(np.float64))
+            for _ in range(self.n_bootstrap)
+        ])
+        tail = (1 - self.confidence) / 2 * 100
+        low, high = np.percentile(replicas, [tail, 100 - tail], axis=0)
+        method = f'exacto+bootstrap({self.n_bootstrap})'
+        return {
+            'davies_bouldin': _estimate(db, low[0], high[0], method, len(X)),
+            'calinski_harabasz': _estimate(ch, low[1], high[1], method, len(X)),
+        }
+
+    def information_criteria(self, gmm, X):
+        """
+        BIC y AIC de un GaussianMixture ajustado con IC normal
+
+        La log-verosimilitud total es n·media(l_i); su error estándar es
+        sqrt(n·var(l_i)), y BIC/AIC heredan el doble de ese error.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        log_likelihood = np.concatenate([
+            gmm.score_samples(X[batch]) for batch in self._row_batches(len(X), X.shape[1] * gmm.n_components)
+        ])
+        n = len(X)
+        total = float(log_likelihood.sum())
+        se = 2 * float(np.sqrt(n * log_likelihood.var(ddof=1))) if n > 1 else 0.0
+        n_params = gmm._n_parameters()
+        bic = -2 * total + n_params * np.log(n)
+        aic = -2 * total + 2 * n_params
+        return {
+            'bic': _estimate(bic, bic - self._z * se, bic + self._z * se, 'exacto+normal', n),
+            'aic': _estimate(aic, aic - self._z * se, aic + self._z * se, 'exacto+normal', n),
+        }
+
+    def evaluate(self, X, labels, noise_label=None, gmm=None):
+        """
+        Todas las métricas de una partición
+
+        Args:
+            X: Matriz de features (estandarizada)
+            labels: Etiqueta de cada usuario
+            noise_label: Etiqueta que se excluye antes de medir (p. ej. -1 en DBSCAN)
+            gmm: GaussianMixture ajustado sobre X para añadir BIC y AIC
+
+        Returns:
+            Diccionario métrica -> estimación (None si no es calculable), más
+            n_evaluated y n_excluded
+        """
+        X = np.asarray(X, dtype=np.float64)
+        labels = np.asarray(labels)
+        metrics = {}
+        if gmm is not None:
+            metrics.update(self.information_criteria(gmm, X))
+
+        keep = np.ones(len(labels), dtype=bool) if noise_label is None else labels != noise_label
+        X_eval, labels_eval = X[keep], labels[keep]
+        metrics['silhouette'] = self.silhouette(X_eval, labels_eval)
+        metrics.update(self.dispersion_indices(X_eval, labels_eval))
+        metrics['n_evaluated'] = int(keep.sum())
+        metrics['n_excluded'] = int((~keep).sum())
+        return metrics
+
+
+def print_quality(metrics, confidence=0.95):
+    """Muestra las métricas con su intervalo en el formato de clustering_system"""
+    level = f"IC{confidence * 100:.0f}%"
+    for key in ('silhouette', 'davies_bouldin', 'calinski_harabasz', 'bic', 'aic'):
+        if key not in metrics:
+            continue
+        name, hint = METRIC_LABELS[key]
+        estimate = metrics[key]
+        if estimate is None:
+            print(f"{name}: no calculable (menos de 2 clusters)")
+            continue
+        decimals = 3 if key in ('silhouette', 'davies_bouldin') else 2
+        print(f"{name}: {estimate['value']:.{decimals}f} "
+              f"[{level} {estimate['ci_low']:.{decimals}f}, {estimate['ci_high']:.{decimals}f}; "
+              f"{estimate['method']}, n={estimate['n']}] ({hint})")
+    if metrics.get('n_excluded'):
+        print(f"  (métricas sobre {metrics['n_evaluated']} usuarios; {metrics['n_excluded']} outliers excluidos)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calidad de clustering K-Means con intervalos de confianza")
+    parser.add_argument('--data', default='feature_store', help="Almacén/CSV de features")
+    parser.add_argument('--clusters', type=int, default=4, help="K de K-Means")
+    parser.add_argument('--sample', type=int, default=5000, help="Usuarios muestreados para el silhouette")
+    parser.add_argument('--max-memory-mb', type=int, default=256, help="Memoria máxima por bloque")
+    parser.add_argument('--bootstrap', type=int, default=30, help="Réplicas bootstrap")
+    parser.add_argument('--seed', type=int, default=42, help="Semilla")
+    args = parser.parse_args()
+
+    from sklearn.cluster import KMeans
+    from clustering_system import MultiLevelClusteringSystem
+
+    system = MultiLevelClusteringSystem(args.data)
+    X = system.prepare_features()
+    labels = KMeans(n_clusters=args.clusters, random_state=args.seed, n_init=10).fit_predict(X)
+    quality = ClusterQuality(sample_size=args.sample, max_memory_mb=args.max_memory_mb,
+                             n_bootstrap=args.bootstrap, random_state=args.seed)
+    print("\n=== CALIDAD DE CLUSTERING ===")
+    print_quality(quality.evaluate(X, labels), quality.confidence)
@@ -1,42 +1,137 @@
-import pandas as pd
+import argparse
+import contextlib
+import os
+import time
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans, DBSCAN
-from sklearn.ensemble import IsolationForest
-from sklearn.metrics import silhouette_score
+from instrumentation import Instrumentation, instrumented
+from lazy_imports import lazy_module
+from shared_arrays import SharedArray, attach
+from streaming_anomaly import QuantileSketch
 import warnings
 
+# pandas, scikit-learn y joblib se cargan solo al usarse
+pd = lazy_module('pandas')
+joblib = lazy_module('joblib')
+
 warnings.filterwarnings('ignore')
 
+DETECTORS = ('kmeans', 'dbscan', 'isolation_forest')
+
+
+def _fit_kmeans(X, n_clusters=4, n_jobs=None):
+    """K-Means y cluster de riesgo (n_jobs = hilos de OpenMP/BLAS)"""
+    from sklearn.cluster import KMeans
+    from threadpoolctl import threadpool_limits
+    
+    limits = threadpool_limits(limits=n_jobs) if n_jobs else contextlib.nullcontext()
+    with limits:
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+        clusters = kmeans.fit_predict(X)
+    
+    # Identificar cluster de riesgo (el que tenga menor promedio de amigos/interacciones)
+    # Asumimos heurística: el centroide más cercano al origen (0,0,0...) tras escalar
+    # suele ser el de menor actividad/conexión
+    distances_to_origin = np.linalg.norm(kmeans.cluster_centers_, axis=1)
+    return {'clusters': clusters, 'risk_cluster': int(np.argmin(distances_to_origin)), 'model': kmeans}
+
+
+def _fit_dbscan(X, eps=0.5, min_samples=5, n_jobs=None, engine=None):
+    """DBSCAN con eps automático; engine permite reutilizar el grafo de vecinos"""
+    from dbscan_engine import DBSCANEngine
+    
+    if engine is None or engine.X is not X:
+        engine = DBSCANEngine(n_jobs=n_jobs).fit(X)
+    auto_eps = eps == 'auto'
+    if auto_eps:
+        eps = engine.auto_eps(min_samples)
+    return {
+        'clusters': engine.fit_predict(eps, min_samples),
+        'eps': eps,
+        'auto_eps': auto_eps,
+        'min_samples': min_samples,
+        'core_sample_indices': engine.core_sample_indices(eps, min_samples),
+        'engine': engine,
+    }
+
+
+def _fit_isolation_forest(X, contamination=0.05, n_jobs=None):
+    """Isolation Forest (n_jobs = procesos/hilos de construcción de árboles)"""
+    from sklearn.ensemble import IsolationForest
+    
+    iso = IsolationForest(contamination=contamination, random_state=42, n_jobs=n_jobs)
+    preds = iso.fit_predict(X)
+    return {'preds': preds, 'scores': iso.decision_function(X), 'model': iso}
+
+
+def risk_levels(total_votes):
+    """Nivel de riesgo a partir del nº de votos (2+ = alto, 1 = moderado)"""
+    total_votes = np.asarray(total_votes)
+    conditions = [
+        (total_votes >= 2),
+        (total_votes == 1)
+    ]
+    choices = ['ALTO RIESGO', 'RIESGO MODERADO']
+    return np.select(conditions, choices, default='BAJO RIESGO')
+
+
+_FITTERS = {'kmeans': _fit_kmeans, 'dbscan': _fit_dbscan, 'isolation_forest': _fit_isolation_forest}
+
+
+def _run_detector(name, spec, params):
+    """Ejecuta un detector en un proceso trabajador sobre la matriz compartida"""
+    X = attach(spec)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    outputs = _FITTERS[name](X, **params)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    # El grafo de vecinos de DBSCAN no vuelve al proceso principal
+    outputs.pop('engine', None)
+    return name, outputs, wall, cpu, os.getpid()
+
 class AuraRiskEnsemble:
     """
     Sistema de Clustering Ensamblado para detección de riesgo psicosocial en Aura.
     Combina K-Means, DBSCAN e Isolation Forest.
     """
     
-    def __init__(self, data):
+    # Features clave basadas en el análisis
+    # Nota: En un caso real, estas columnas deben existir en el DF de entrada
+    FEATURES = [
+        'amigos_reales', 
+        'conversaciones_activas', 
+        'dias_inactividad',
+        'engagement_promedio', 
+        'ratio_reciprocidad', 
+        'sentimiento_promedio'
+    ]
+    
+    def __init__(self, data, instrumentation=None):
+        """
+        Args:
+            data: DataFrame con las features de cada usuario
+            instrumentation: Instrumentation que registra tiempo, CPU, memoria y
+                filas de cada etapa (default: solo consola)
+        """
+        from sklearn.preprocessing import StandardScaler
+        
+        self.instrumentation = instrumentation or Instrumentation()
         self.raw_data = data
         self.scaler = StandardScaler()
         self.X_scaled = None
         self.results = pd.DataFrame()
         self.models = {}
+        self.dbscan_engine = None
+        self.detector_timings = None
+        self.detector_speedup = None
 
+    @instrumented('preprocess', message="Preprocesando datos...", inputs=lambda self: self.raw_data)
     def preprocess(self):
         """
         Preprocesamiento y normalización de datos.
         Selecciona las features clave definidas en el reporte.
         """
-        print("Preprocesando datos...")
         # Selección de features clave basadas en el análisis
         # Nota: En un caso real, estas columnas deben existir en el DF de entrada
-        features = [
-            'amigos_reales', 
-            'conversaciones_activas', 
-            'dias_inactividad',
-            'engagement_promedio', 
-            'ratio_reciprocidad', 
-            'sentimiento_promedio'
-        ]
+        features = self.FEATURES
         
         # Verificar que las columnas existan, si no, crear dummy data para demostración
         missing_cols = [col for col in features if col not in self.raw_data.columns]
@@ -48,65 +143,133 @@ class AuraRiskEnsemble:
             X = self.raw_data[features].fillna(0)
             
         self.X_scaled = self.scaler.fit_transform(X)
+        self.models['scaler'] = self.scaler
         self.results = self.raw_data.copy()
         if 'user_id' not in self.results.columns:
             self.results['user_id'] = range(len(self.results))
 
-    def run_kmeans(self, n_clusters=4):
+    @instrumented('kmeans', message="Ejecutando K-Means con k={n_clusters}...", inputs=lambda self: self.X_scaled)
+    def run_kmeans(self, n_clusters=4, n_jobs=None):
         """
         Enfoque 1: K-Means Clustering
         """
-        print(f"Ejecutando K-Means con k={n_clusters}...")
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        clusters = kmeans.fit_predict(self.X_scaled)
-        
-        # Identificar cluster de riesgo (el que tenga menor promedio de amigos/interacciones)
-        # Asumimos heurística: el centroide más cercano al origen (0,0,0...) tras escalar
-        # suele ser el de menor actividad/conexión
-        centers = kmeans.cluster_centers_
-        distances_to_origin = np.linalg.norm(centers, axis=1)
-        risk_cluster_idx = np.argmin(distances_to_origin)
-        
+        self._apply_kmeans(_fit_kmeans(self.X_scaled, n_clusters, n_jobs))
+
+    def _apply_kmeans(self, outputs):
+        clusters, risk_cluster_idx = outputs['clusters'], outputs['risk_cluster']
         self.results['kmeans_cluster'] = clusters
         self.results['vote_kmeans'] = (clusters == risk_cluster_idx).astype(int)
-        self.models['kmeans'] = kmeans
+        self.models['kmeans'] = outputs['model']
+        self.models['kmeans_risk_cluster'] = risk_cluster_idx
         print(f"  -> Cluster de riesgo identificado: {risk_cluster_idx}")
 
-    def run_dbscan(self, eps=0.5, min_samples=5):
+    @instrumented('dbscan', message="Ejecutando DBSCAN...", inputs=lambda self: self.X_scaled)
+    def run_dbscan(self, eps=0.5, min_samples=5, n_jobs=None):
         """
         Enfoque 2: DBSCAN (Density-Based Spatial Clustering of Applications with Noise)
-        Detecta outliers (ruido).
+        Detecta outliers (ruido). Con eps='auto' (opcional) el radio sale del
+        codo de la curva k-distancia; el grafo de vecinos se reutiliza entre llamadas.
         """
-        print("Ejecutando DBSCAN...")
-        dbscan = DBSCAN(eps=eps, min_samples=min_samples)
-        clusters = dbscan.fit_predict(self.X_scaled)
+        outputs = _fit_dbscan(self.X_scaled, eps, min_samples, n_jobs, engine=self.dbscan_engine)
+        self.dbscan_engine = outputs.pop('engine')
+        self._apply_dbscan(outputs)
+
+    def _apply_dbscan(self, outputs):
+        clusters = outputs['clusters']
+        if outputs['auto_eps']:
+            print(f"  -> eps automático: {outputs['eps']:.3f}")
         
         # -1 indica outlier en DBSCAN
         self.results['dbscan_cluster'] = clusters
+        self.models['dbscan'] = {'eps': outputs['eps'], 'min_samples': outputs['min_samples'],
+                                 'core_sample_indices': outputs['core_sample_indices']}
         self.results['vote_dbscan'] = (clusters == -1).astype(int)
         print(f"  -> Outliers detectados: {sum(clusters == -1)}")
 
-    def run_isolation_forest(self, contamination=0.05):
+    @instrumented('isolation_forest', message="Ejecutando Isolation Forest...", inputs=lambda self: self.X_scaled)
+    def run_isolation_forest(self, contamination=0.05, n_jobs=None):
         """
         Enfoque 3: Isolation Forest
         Detecta anomalías basado en aislamiento.
         """
-        print("Ejecutando Isolation Forest...")
-        iso = IsolationForest(contamination=contamination, random_state=42)
-        preds = iso.fit_predict(self.X_scaled)
+        self._apply_isolation_forest(_fit_isolation_forest(self.X_scaled, contamination, n_jobs))
+
+    def _apply_isolation_forest(self, outputs):
+        preds, scores = outputs['preds'], outputs['scores']
         # -1 es anomalía, 1 es normal
-        scores = iso.decision_function(self.X_scaled)
-        
         self.results['iso_pred'] = preds
         self.results['iso_score'] = scores # Score negativo = más anómalo
         self.results['vote_iso'] = (preds == -1).astype(int)
+        self.models['isolation_forest'] = outputs['model']
+        self.models['iso_score_range'] = (float(scores.min()), float(scores.max()))
+        self.models['iso_score_sketch'] = QuantileSketch().update(scores)
         print(f"  -> Anomalías detectadas: {sum(preds == -1)}")
 
+    @instrumented('detectors', message="Ejecutando K-Means, DBSCAN e Isolation Forest en procesos paralelos...",
+                  inputs=lambda self: self.X_scaled)
+    def run_detectors(self, params=None, n_jobs=None, max_workers=None, baseline_s=None):
+        """
+        Ejecuta los tres detectores a la vez en procesos trabajadores
+        
+        X_scaled se copia una sola vez a memoria compartida y cada trabajador
+        lo abre sin copias. Los votos se incorporan a results cuando han
+        terminado todos, en el mismo orden que la ejecución secuencial. Los
+        trabajadores se reutilizan entre llamadas: la primera incluye su
+        arranque y la importación de scikit-learn.
+        
+        Args:
+            params: Argumentos por detector, p. ej. {'kmeans': {'n_clusters': 5}}
+            n_jobs: Paralelismo interno por detector, p. ej.
+                {'isolation_forest': 2} (default: CPUs repartidas entre los detectores)
+            max_workers: Procesos trabajadores (default: uno por detector)
+            baseline_s: Tiempo de la ejecución secuencial para calcular la
+                aceleración (default: estimado como la suma del CPU de los detectores)
+            
+        Returns:
+            DataFrame con tiempo de pared y CPU de cada detector
+        """
+        params = params or {}
+        n_jobs = n_jobs or {}
+        unknown = (set(params) | set(n_jobs)) - set(DETECTORS)
+        if unknown:
+            raise ValueError(f"Detectores desconocidos: {sorted(unknown)}")
+        max_workers = max_workers or len(DETECTORS)
+        default_jobs = max(1, (os.cpu_count() or 1) // max_workers)
+        
+        start = time.perf_counter()
+        with SharedArray(np.asarray(self.X_scaled, dtype=np.float64)) as shared:
+            tasks = [joblib.delayed(_run_detector)(
+                name, shared.spec, {**params.get(name, {}), 'n_jobs': n_jobs.get(name, default_jobs)}
+            ) for name in DETECTORS]
+            finished = joblib.Parallel(n_jobs=max_workers)(tasks)
+        
+        timings = []
+        for name, outputs, wall, cpu, pid in finished:
+            getattr(self, f"_apply_{name}")(outputs)
+            self.instrumentation.record(name, wall, cpu, component=type(self).__name__,
+                                        rows_in=len(self.X_scaled), rows_out=len(self.X_scaled),
+                                        worker_pid=pid, quiet=True)
+            timings.append({'detector': name, 'wall_s': wall, 'cpu_s': cpu, 'worker_pid': pid})
+        # dbscan_engine no se conserva: el grafo de vecinos quedó en el trabajador
+        self.dbscan_engine = None
+        total = time.perf_counter() - start
+        
+        self.detector_timings = pd.DataFrame(timings)
+        estimated = baseline_s is None
+        if estimated:
+            baseline_s = self.detector_timings['cpu_s'].sum()
+        self.detector_speedup = baseline_s / total
+        print("  -> Tiempo por detector: " + ", ".join(
+            f"{row.detector} {row.wall_s:.2f}s (CPU {row.cpu_s:.2f}s)" for row in self.detector_timings.itertuples()))
+        print(f"  -> Total {total:.2f}s frente a {baseline_s:.2f}s en secuencial{' (estimado)' if estimated else ''}: "
+              f"aceleración x{self.detector_speedup:.2f} con {os.cpu_count()} CPUs")
+        return self.detector_timings
+
+    @instrumented('ensemble_risk', message="Calculando riesgo ensamblado...", inputs=lambda self: self.results)
     def calculate_ensemble_risk(self):
         """
         Combina los votos de los 3 modelos para determinar el nivel de riesgo.
         """
-        print("Calculando riesgo ensamblado...")
         # Suma de votos
         self.results['total_votes'] = (
             self.results['vote_kmeans'] + 
@@ -115,44 +278,121 @@ class AuraRiskEnsemble:
         )
         
         # Clasificación final
-        conditions = [
-            (self.results['total_votes'] >= 2),
-            (self.results['total_votes'] == 1)
-        ]
-        choices = ['ALTO RIESGO', 'RIESGO MODERADO']
-        self.results['risk_level'] = np.select(conditions, choices, default='BAJO RIESGO')
+        self.results['risk_level'] = risk_levels(self.results['total_votes'])
         
         return self.results['risk_level'].value_counts()
 
-    def calculate_anomaly_severity(self):
+    @instrumented('anomaly_severity', message="Calculando Índice de Severidad de Anomalía (ASI)...",
+                  inputs=lambda self: self.results)
+    def calculate_anomaly_severity(self, normalization='minmax', sketch=None):
         """
         Calcula el Índice de Severidad de Anomalía (ASI) de 0 a 100.
+        
+        Args:
+            normalization: 'minmax' (rango de iso_score de este lote) o 'sketch'
+                (percentil respecto a una distribución de referencia, igual para
+                cada usuario sea cual sea el lote)
+            sketch: QuantileSketch de referencia para 'sketch' (default: el de los
+                scores del ajuste de Isolation Forest)
         """
-        print("Calculando Índice de Severidad de Anomalía (ASI)...")
+        from scoring import anomaly_severity, quantile_severity
+        
         iso_score = self.results['iso_score']
-        min_score = iso_score.min()
-        max_score = iso_score.max()
         
-        # Normalización Min-Max invertida (más negativo = más severo)
-        # Evitar división por cero
-        if max_score == min_score:
-            severity = np.zeros(len(iso_score))
+        if normalization == 'sketch':
+            self.results['anomaly_severity_index'] = quantile_severity(
+                iso_score, sketch or self.models['iso_score_sketch'], self.results['vote_dbscan'] == 1,
+            )
+        elif normalization == 'minmax':
+            # Normalización Min-Max invertida (más negativo = más severo), +20% si
+            # DBSCAN también dice que es outlier, con cap en 100
+            self.results['anomaly_severity_index'] = anomaly_severity(
+                iso_score, iso_score.min(), iso_score.max(), self.results['vote_dbscan'] == 1,
+            )
         else:
-            severity = 100 * (1 - (iso_score - min_score) / (max_score - min_score))
-        
-        # Ajuste: Si DBSCAN también dice que es outlier, aumentamos severidad un 20%
-        severity = np.where(self.results['vote_dbscan'] == 1, severity * 1.2, severity)
-        
-        # Cap en 100
-        self.results['anomaly_severity_index'] = np.clip(severity, 0, 100)
+            raise ValueError(f"Normalización desconocida: {normalization}")
         
         return self.results[['user_id', 'risk_level', 'anomaly_severity_index']]
 
+    def scoring_model(self):
+        """
+        Modelos ajustados, sin datos de entrenamiento ni resultados, para puntuar
+        usuarios nuevos (p. ej. por shards en otros procesos: sharded_scoring.py)
+        """
+        core = self.models['dbscan']['core_sample_indices']
+        return EnsembleScoringModel(
+            self.FEATURES, self.models['scaler'], self.models['kmeans'], self.models['kmeans_risk_cluster'],
+            np.asarray(self.X_scaled)[core], self.models['dbscan']['eps'], self.models['isolation_forest'],
+            self.models['iso_score_range'],
+        )
+
+
+class EnsembleScoringModel:
+    """Votos del ensemble y ASI de usuarios nuevos con los modelos de AuraRiskEnsemble"""
+    
+    def __init__(self, features, scaler, kmeans, risk_cluster, dbscan_core_samples, dbscan_eps,
+                 isolation_forest, iso_score_range):
+        self.features = list(features)
+        self.scaler = scaler
+        self.kmeans = kmeans
+        self.risk_cluster = risk_cluster
+        self.dbscan_core_samples = dbscan_core_samples
+        self.dbscan_eps = dbscan_eps
+        self.isolation_forest = isolation_forest
+        self.iso_score_range = iso_score_range
+        self._core_tree = None
+    
+    def _dbscan_outliers(self, X):
+        """Outlier si ningún punto núcleo del ajuste está a distancia <= eps (regla de DBSCAN)"""
+        if len(self.dbscan_core_samples) == 0:
+            return np.ones(len(X), dtype=bool)
+        if self._core_tree is None:
+            from sklearn.neighbors import KDTree
+            self._core_tree = KDTree(self.dbscan_core_samples)
+        distances, _ = self._core_tree.query(X, k=1)
+        return distances[:, 0] > self.dbscan_eps
+    
+    def score_users(self, df):
+        """
+        Returns:
+            DataFrame con user_id, votos de cada detector, iso_score,
+            total_votes, risk_level y anomaly_severity_index
+        """
+        from scoring import anomaly_severity
+        
+        X = self.scaler.transform(df.reindex(columns=self.features).fillna(0))
+        clusters = self.kmeans.predict(X)
+        outliers = self._dbscan_outliers(X)
+        iso_scores = self.isolation_forest.decision_function(X)
+        result = pd.DataFrame({
+            'user_id': df['user_id'].to_numpy() if 'user_id' in df.columns else np.arange(len(df)),
+            'kmeans_cluster': clusters,
+            'vote_kmeans': (clusters == self.risk_cluster).astype(int),
+            'vote_dbscan': outliers.astype(int),
+            'iso_score': iso_scores,
+            'vote_iso': (self.isolation_forest.predict(X) == -1).astype(int),
+        })
+        result['total_votes'] = result['vote_kmeans'] + result['vote_dbscan'] + result['vote_iso']
+        result['risk_level'] = risk_levels(result['total_votes'])
+        score_min, score_max = self.iso_score_range
+        result['anomaly_severity_index'] = anomaly_severity(iso_scores, score_min, score_max, outliers)
+        return result
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ensemble de riesgo sobre datos de prueba")
+    parser.add_argument('--users', type=int, default=1000, help="Usuarios de prueba")
+    parser.add_argument('--parallel', action='store_true',
+                        help="Ejecutar los detectores a la vez en procesos con la matriz en memoria compartida")
+    parser.add_argument('--iso-jobs', type=int, default=None, help="n_jobs de Isolation Forest")
+    parser.add_argument('--compare', action='store_true',
+                        help="Con --parallel, ejecutar antes en secuencial y medir la aceleración real")
+    args = parser.parse_args()
+    
     # Generar datos dummy para probar el script
     print("Generando datos de prueba...")
     np.random.seed(42)
-    n_users = 1000
+    n_users = args.users
     data = pd.DataFrame({
         'user_id': range(n_users),
         'amigos_reales': np.random.poisson(20, n_users),
@@ -172,9 +412,20 @@ if __name__ == "__main__":
     # Ejecutar sistema
     system = AuraRiskEnsemble(data)
     system.preprocess()
-    system.run_kmeans()
-    system.run_dbscan()
-    system.run_isolation_forest()
+    if args.parallel:
+        baseline_s = None
+        if args.compare:
+            start = time.perf_counter()
+            system.run_kmeans()
+            system.run_dbscan()
+            system.run_isolation_forest(n_jobs=args.iso_jobs)
+            baseline_s = time.perf_counter() - start
+        system.run_detectors(n_jobs={'isolation_forest': args.iso_jobs} if args.iso_jobs else None,
+                             baseline_s=baseline_s)
+    else:
+        system.run_kmeans()
+        system.run_dbscan()
+        system.run_isolation_forest(n_jobs=args.iso_jobs)
     
     print("\nResumen de Riesgos:")
     print(system.calculate_ensemble_risk())
@@ -6,48 +6,109 @@ Fecha: 2025-11-28
 Implementa 5 algoritmos de clustering diferentes para detección de riesgo.
 """
 
-import pandas as pd
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans, DBSCAN
-from sklearn.mixture import GaussianMixture
-from scipy.cluster.hierarchy import dendrogram, linkage, fcluster
-from sklearn.decomposition import PCA
-from sklearn.metrics import silhouette_score, davies_bouldin_score
+from cluster_plots import ProjectionCache, scatter_clusters, use_headless_backend
+from instrumentation import Instrumentation, instrumented
+from lazy_imports import lazy_module
 import warnings
 warnings.filterwarnings('ignore')
 
+# pandas y matplotlib se cargan en el primer uso; scikit-learn, scipy y los
+# motores de cada algoritmo se importan dentro del método que los necesita
+pd = lazy_module('pandas')
+plt = lazy_module('matplotlib.pyplot', before_load=use_headless_backend)
+
+def _path_size(path):
+    """Bytes en disco de un fichero o de todos los ficheros de un directorio"""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path) if os.path.exists(path) else None
+
 class MultiLevelClusteringSystem:
     """Sistema de clustering multi-nivel para detección de riesgo"""
     
-    def __init__(self, data_path='features_riesgo_psicosocial.csv'):
+    # Features clave para detección de riesgo
+    FEATURE_COLS = [
+        'amigos_reales',
+        'conversaciones_activas',
+        'num_comunidades',
+        'engagement_promedio',
+        'dias_inactividad',
+        'posts_count',
+        'mensajes_enviados',
+        'ratio_reciprocidad_comentarios',
+        'indice_aislamiento_social',
+        'ratio_actividad_diaria',
+        'indice_conflicto_social'
+    ]
+    
+    # Por encima de este número de usuarios Ward exacto (memoria O(n²)) se
+    # sustituye por Ward sobre micro-clusters
+    EXACT_WARD_MAX_USERS = 10000
+    
+    # Puntos máximos de una dispersión; por encima se diezma o se usa hexbin
+    PLOT_MAX_POINTS = 50000
+    
+    # Etapas de run_pipeline: método, etapas de las que depende, columnas de
+    # self.df y atributos que produce, y módulos cuyo código forma parte de la clave
+    PIPELINE_STAGES = {
+        'prepare_features': ('prepare_features', (), (),
+                             ('X_scaled', 'scaler', 'feature_cols'), ()),
+        'kmeans': ('kmeans_clustering', ('prepare_features',), ('cluster_kmeans', 'nivel_riesgo_kmeans'),
+                   ('kmeans_model', 'kmeans_risk_mapping', 'quality_metrics.kmeans'),
+                   ('kmeans_sweep', 'cluster_quality')),
+        'dbscan': ('dbscan_clustering', ('prepare_features',), ('cluster_dbscan',),
+                   ('dbscan_params', 'quality_metrics.dbscan'), ('dbscan_engine', 'cluster_quality')),
+        'hierarchical': ('hierarchical_clustering', ('prepare_features',), ('cluster_jerarquico',),
+                         (), ('hierarchical_engine',)),
+        'gmm': ('gmm_clustering', ('prepare_features',), ('cluster_gmm', 'prob_cluster_*', 'prob_alto_riesgo'),
+                ('gmm_model', 'gmm_high_risk_cluster', 'quality_metrics.gmm'), ('gmm_engine', 'cluster_quality')),
+        'ensemble': ('ensemble_risk_score', ('kmeans', 'dbscan', 'gmm'), ('risk_score_*', 'nivel_riesgo_final'),
+                     ('ensemble_weights',), ('scoring',)),
+    }
+    
+    def __init__(self, data_path='features_riesgo_psicosocial.csv', quality=None, instrumentation=None):
         """
         Args:
-            data_path: Ruta al CSV con features extraídas
+            data_path: Ruta al CSV con features extraídas, o a un almacén
+                Parquet (directorio o fichero .parquet). Del almacén solo se
+                cargan user_id y FEATURE_COLS
+            quality: ClusterQuality con el que se miden las particiones
+                (default: silhouette sobre 5.000 usuarios y bloques de 256 MB)
+            instrumentation: Instrumentation que registra tiempo, CPU, memoria,
+                filas y bytes de cada etapa (default: solo consola)
         """
-        self.df = pd.read_csv(data_path)
+        from feature_store import is_feature_store_path, load_features
+        from sklearn.preprocessing import StandardScaler
+        
+        self.instrumentation = instrumentation or Instrumentation()
+        with self.instrumentation.stage('load', component=type(self).__name__,
+                                        bytes_read=_path_size(data_path)) as stage:
+            if is_feature_store_path(data_path):
+                self.df = load_features(data_path, columns=['user_id'] + self.FEATURE_COLS)
+            else:
+                self.df = pd.read_csv(data_path)
+            stage.rows_out = len(self.df)
         self.scaler = StandardScaler()
         self.X_scaled = None
         self.feature_cols = None
-        
+        self.quality = quality
+        self.quality_metrics = {}
+        self.dbscan_engine = None
+        self.projections = ProjectionCache()
+        self.kmeans_model = None
+        self.kmeans_risk_mapping = None
+        self.dbscan_params = None
+        self.gmm_model = None
+        self.gmm_high_risk_cluster = None
+        self.ensemble_weights = None
+        
+    @instrumented('prepare_features', inputs=lambda self: self.df)
     def prepare_features(self):
         """Selecciona y normaliza features para clustering"""
-        # Features clave para detección de riesgo
-        self.feature_cols = [
-            'amigos_reales',
-            'conversaciones_activas',
-            'num_comunidades',
-            'engagement_promedio',
-            'dias_inactividad',
-            'posts_count',
-            'mensajes_enviados',
-            'ratio_reciprocidad_comentarios',
-            'indice_aislamiento_social',
-            'ratio_actividad_diaria',
-            'indice_conflicto_social'
-        ]
+        self.feature_cols = list(self.FEATURE_COLS)
         
         # Asegurar que las columnas existen
         available_cols = [col for col in self.feature_cols if col in self.df.columns]
@@ -60,49 +121,54 @@ class MultiLevelClusteringSystem:
         
         return self.X_scaled
     
-    def kmeans_clustering(self, n_clusters=4, visualize=True):
+    @instrumented('kmeans', message="\n=== K-MEANS CLUSTERING ===", inputs=lambda self: self.X_scaled)
+    def kmeans_clustering(self, n_clusters=4, visualize=True, k_range=range(2, 11),
+                          algorithm='auto', n_jobs=None, cache_dir='.kmeans_cache'):
         """
         Sistema 1: K-Means para segmentación de riesgo estándar
         
         Args:
             n_clusters: Número de clusters (default: 4 = Bajo, Moderado, Alto, Crítico)
             visualize: Si mostrar gráficos
+            k_range: K candidatos del método del codo
+            algorithm: 'full', 'minibatch' o 'auto' (mini-batch con muchos usuarios)
+            n_jobs: Procesos del barrido de K (default: uno por K hasta el nº de CPUs)
+            cache_dir: Caché de modelos y métricas por huella de datos (None = sin caché)
             
         Returns:
             Array con etiquetas de cluster
         """
-        print("\n=== K-MEANS CLUSTERING ===")
+        from kmeans_sweep import KMeansSweep
+        
+        sweep = KMeansSweep(algorithm=algorithm, n_jobs=n_jobs, cache_dir=cache_dir)
         
-        # Método del codo para encontrar K óptimo
+        # Método del codo: todos los K en paralelo (o desde caché), incluido el elegido
         if visualize:
-            inertias = []
-            K_range = range(2, 11)
-            for k in K_range:
-                kmeans_temp = KMeans(n_clusters=k, random_state=42, n_init=10)
-                kmeans_temp.fit(self.X_scaled)
-                inertias.append(kmeans_temp.inertia_)
+            results = sweep.run(self.X_scaled, sorted(set(k_range) | {n_clusters}))
+            sweep.report()
+            elbow = results[results['k'].isin(k_range)]
             
-            plt.figure(figsize=(10, 5))
-            plt.plot(K_range, inertias, 'bo-')
-            plt.xlabel('Número de Clusters (K)')
-            plt.ylabel('Inercia')
-            plt.title('Método del Codo para K-Means')
-            plt.grid(True)
+            fig, ax = plt.subplots(figsize=(10, 5))
+            ax.plot(elbow['k'], elbow['inertia'], 'bo-')
+            ax.set_xlabel('Número de Clusters (K)')
+            ax.set_ylabel('Inercia')
+            ax.set_title('Método del Codo para K-Means')
+            ax.grid(True)
+            ax_silhouette = ax.twinx()
+            ax_silhouette.plot(elbow['k'], elbow['silhouette'], 'rs--', alpha=0.6)
+            ax_silhouette.set_ylabel('Silhouette (muestra)', color='r')
             plt.savefig('kmeans_elbow.png')
+            plt.close(fig)
             print("Gráfico del codo guardado en 'kmeans_elbow.png'")
         
-        # Entrenar K-Means con K óptimo
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        clusters = kmeans.fit_predict(self.X_scaled)
+        # Modelo del K elegido: el del barrido, sin reentrenar
+        kmeans = sweep.model(self.X_scaled, n_clusters)
+        clusters = kmeans.labels_
         
         self.df['cluster_kmeans'] = clusters
         
-        # Métricas de calidad
-        silhouette = silhouette_score(self.X_scaled, clusters)
-        davies_bouldin = davies_bouldin_score(self.X_scaled, clusters)
-        
-        print(f"Silhouette Score: {silhouette:.3f} (mayor es mejor, rango: -1 a 1)")
-        print(f"Davies-Bouldin Index: {davies_bouldin:.3f} (menor es mejor)")
+        # Métricas de calidad (estimadas con intervalo de confianza)
+        self.report_quality('kmeans', clusters)
         
         # Interpretar clusters
         print("\n--- Perfil de Clusters ---")
@@ -119,6 +185,8 @@ class MultiLevelClusteringSystem:
         }
         
         self.df['nivel_riesgo_kmeans'] = self.df['cluster_kmeans'].map(risk_mapping)
+        self.kmeans_model = kmeans
+        self.kmeans_risk_mapping = risk_mapping
         
         print("\n--- Distribución de Usuarios por Nivel de Riesgo ---")
         print(self.df['nivel_riesgo_kmeans'].value_counts())
@@ -128,22 +196,42 @@ class MultiLevelClusteringSystem:
         
         return clusters
     
-    def dbscan_clustering(self, eps=0.5, min_samples=10, visualize=True):
+    @instrumented('dbscan', message="\n=== DBSCAN CLUSTERING ===", inputs=lambda self: self.X_scaled)
+    def dbscan_clustering(self, eps=0.5, min_samples=10, visualize=True,
+                          eps_grid=None, min_samples_grid=None):
         """
         Sistema 2: DBSCAN para detección de anomalías
         
         Args:
-            eps: Radio de vecindad
+            eps: Radio de vecindad, o 'auto' (opcional: codo de la curva k-distancia)
             min_samples: Mínimo de puntos para formar cluster
             visualize: Si mostrar gráficos
+            eps_grid: eps a comparar antes de ajustar (None con min_samples_grid =
+                eps automático x 0.75 / 1 / 1.25)
+            min_samples_grid: min_samples a comparar; si ninguna rejilla se indica
+                solo se ajusta la combinación pedida
             
         Returns:
             Array con etiquetas de cluster (-1 = outlier)
         """
-        print("\n=== DBSCAN CLUSTERING ===")
+        from dbscan_engine import DBSCANEngine
+        
+        # El índice espacial y el grafo de radio se reutilizan entre llamadas
+        if self.dbscan_engine is None or self.dbscan_engine.X is not self.X_scaled:
+            self.dbscan_engine = DBSCANEngine().fit(self.X_scaled)
+        engine = self.dbscan_engine
         
-        dbscan = DBSCAN(eps=eps, min_samples=min_samples, metric='euclidean')
-        clusters = dbscan.fit_predict(self.X_scaled)
+        if eps == 'auto':
+            eps = engine.auto_eps(min_samples)
+            print(f"eps automático (codo k-distancia, min_samples={min_samples}): {eps:.3f}")
+        
+        if eps_grid is not None or min_samples_grid is not None:
+            engine.grid(eps_values=eps_grid, min_samples_values=min_samples_grid or [min_samples])
+            engine.report()
+        
+        clusters = engine.fit_predict(eps, min_samples)
+        self.dbscan_params = {'eps': eps, 'min_samples': min_samples,
+                              'core_sample_indices': engine.core_sample_indices(eps, min_samples)}
         
         self.df['cluster_dbscan'] = clusters
         
@@ -153,6 +241,9 @@ class MultiLevelClusteringSystem:
         print(f"Número de clusters detectados: {len(set(clusters)) - (1 if -1 in clusters else 0)}")
         print(f"⚠️ Outliers detectados (usuarios en riesgo anómalo): {len(outliers)}")
         
+        # Métricas de calidad sobre los usuarios agrupados (sin outliers)
+        self.report_quality('dbscan', clusters, noise_label=-1)
+        
         if len(outliers) > 0:
             print("\n--- Características de Outliers ---")
             print(outliers[self.feature_cols].describe())
@@ -162,43 +253,48 @@ class MultiLevelClusteringSystem:
         
         return clusters
     
-    def hierarchical_clustering(self, n_clusters=4, visualize=True):
+    @instrumented('hierarchical', message="\n=== HIERARCHICAL CLUSTERING ===", inputs=lambda self: self.X_scaled)
+    def hierarchical_clustering(self, n_clusters=4, visualize=True, method='auto', random_state=42):
         """
         Sistema 3: Clustering Jerárquico para taxonomía de perfiles
         
         Args:
             n_clusters: Número de clusters finales
             visualize: Si mostrar dendrograma
+            method: 'exact' (Ward sobre todos los usuarios), 'scalable' (Ward
+                sobre micro-clusters BIRCH y asignación por centroide) o 'auto'
+                (exacto hasta EXACT_WARD_MAX_USERS usuarios)
+            random_state: Semilla del modo escalable
             
         Returns:
             Array con etiquetas de cluster
         """
-        print("\n=== HIERARCHICAL CLUSTERING ===")
-        
-        # Usar una muestra si hay muchos usuarios (dendrograma es costoso)
-        if len(self.df) > 1000:
-            sample_indices = np.random.choice(len(self.df), 1000, replace=False)
-            X_sample = self.X_scaled[sample_indices]
-            print("⚠️ Usando muestra de 1000 usuarios para dendrograma")
+        from scipy.cluster.hierarchy import dendrogram, linkage, fcluster
+        from hierarchical_engine import ScalableWardClustering
+        
+        if method == 'auto':
+            method = 'exact' if len(self.df) <= self.EXACT_WARD_MAX_USERS else 'scalable'
+        
+        if method == 'scalable':
+            model = ScalableWardClustering(n_clusters=n_clusters, random_state=random_state)
+            clusters = model.fit_predict(self.X_scaled)
+            linkage_matrix = model.linkage_
+            print(f"Ward sobre {len(model.subcluster_centers_)} micro-clusters "
+                  f"({len(self.df)} usuarios asignados por centroide más cercano)")
         else:
-            X_sample = self.X_scaled
-        
-        # Calcular linkage
-        linkage_matrix = linkage(X_sample, method='ward')
+            linkage_matrix = linkage(self.X_scaled, method='ward')
+            clusters = fcluster(linkage_matrix, t=n_clusters, criterion='maxclust')
         
         if visualize:
             plt.figure(figsize=(15, 8))
             dendrogram(linkage_matrix, truncate_mode='lastp', p=30)
             plt.title('Dendrograma de Clustering Jerárquico')
-            plt.xlabel('Índice de Usuario (o Cluster)')
+            plt.xlabel('Índice de Usuario (o Cluster)' if method == 'exact' else 'Micro-cluster (o Cluster)')
             plt.ylabel('Distancia')
             plt.savefig('hierarchical_dendrogram.png')
+            plt.close()
             print("Dendrograma guardado en 'hierarchical_dendrogram.png'")
         
-        # Aplicar clustering a todo el dataset
-        linkage_full = linkage(self.X_scaled, method='ward')
-        clusters = fcluster(linkage_full, t=n_clusters, criterion='maxclust')
-        
         self.df['cluster_jerarquico'] = clusters
         
         print(f"\nDistribución de clusters jerárquicos:")
@@ -206,27 +302,39 @@ class MultiLevelClusteringSystem:
         
         return clusters
     
-    def gmm_clustering(self, n_components=4, visualize=True):
+    @instrumented('gmm', message="\n=== GAUSSIAN MIXTURE MODEL ===", inputs=lambda self: self.X_scaled)
+    def gmm_clustering(self, n_components=4, visualize=True, n_components_range=None,
+                       covariance_types=('full',), n_init=1, n_jobs=None, state_path='.gmm_state.joblib'):
         """
         Sistema 4: Gaussian Mixture Models para scoring probabilístico
         
         Args:
-            n_components: Número de componentes gaussianas
+            n_components: Número de componentes gaussianas (si no hay n_components_range)
             visualize: Si mostrar gráficos
+            n_components_range: Componentes candidatos; se elige por BIC
+            covariance_types: Tipos de covarianza candidatos
+            n_init: Inicializaciones aleatorias por configuración sin estado previo
+            n_jobs: Procesos del barrido de candidatos (default: hasta el nº de CPUs)
+            state_path: Parámetros del último ajuste para arrancar en caliente (None = desactivado)
             
         Returns:
             Tuple (clusters, probabilidades)
         """
-        print("\n=== GAUSSIAN MIXTURE MODEL ===")
+        from gmm_engine import GMMSelector
         
-        gmm = GaussianMixture(n_components=n_components, covariance_type='full', random_state=42)
-        clusters = gmm.fit_predict(self.X_scaled)
+        selector = GMMSelector(
+            n_components_range=n_components_range or [n_components], covariance_types=covariance_types,
+            n_init=n_init, n_jobs=n_jobs, state_path=state_path,
+        )
+        gmm = selector.fit(self.X_scaled)
+        selector.report()
+        clusters = gmm.predict(self.X_scaled)
         probs = gmm.predict_proba(self.X_scaled)
         
         self.df['cluster_gmm'] = clusters
         
         # Asignar probabilidades de cada cluster
-        for i in range(n_components):
+        for i in range(gmm.n_components):
             self.df[f'prob_cluster_{i}'] = probs[:, i]
         
         # Identificar cluster de alto riesgo (el que tiene mayor índice de aislamiento)
@@ -234,39 +342,45 @@ class MultiLevelClusteringSystem:
         high_risk_cluster = cluster_profiles.idxmax()
         
         self.df['prob_alto_riesgo'] = probs[:, high_risk_cluster]
+        self.gmm_model = gmm
+        self.gmm_high_risk_cluster = high_risk_cluster
         
         print(f"Cluster de alto riesgo identificado: {high_risk_cluster}")
         print(f"\n--- Usuarios con mayor probabilidad de alto riesgo ---")
         print(self.df.nlargest(10, 'prob_alto_riesgo')[['user_id', 'prob_alto_riesgo', 'indice_aislamiento_social']])
         
-        # BIC y AIC para evaluación
-        print(f"\nBIC: {gmm.bic(self.X_scaled):.2f} (menor es mejor)")
-        print(f"AIC: {gmm.aic(self.X_scaled):.2f} (menor es mejor)")
+        # Métricas de calidad, BIC y AIC para evaluación
+        print()
+        self.report_quality('gmm', clusters, gmm=gmm)
         
         if visualize:
             self.visualize_probability_distribution(probs, high_risk_cluster)
         
         return clusters, probs
     
-    def ensemble_risk_score(self):
+    @instrumented('ensemble', message="\n=== ENSEMBLE RISK SCORING ===", inputs=lambda self: self.df)
+    def ensemble_risk_score(self, weights=None):
         """
         Combina resultados de todos los métodos de clustering
         en un score de riesgo unificado
+        
+        Args:
+            weights: Peso de cada score por método (default: scoring.ENSEMBLE_WEIGHTS);
+                se guardan en el bundle para puntuar igual a usuarios nuevos
         """
-        print("\n=== ENSEMBLE RISK SCORING ===")
+        # Mismos mapeos que el scoring de nuevos usuarios (scoring.py)
+        from scoring import (DBSCAN_MEMBER_SCORE, DBSCAN_OUTLIER_SCORE, ENSEMBLE_WEIGHTS, KMEANS_LEVEL_SCORES,
+                             combine_risk_scores)
+        
+        self.ensemble_weights = dict(weights or ENSEMBLE_WEIGHTS)
         
         # Normalizar índices de riesgo de cada método (0-1)
         # K-Means: asignar score basado en nivel de riesgo
-        risk_mapping_kmeans = {
-            'Bajo Riesgo': 0.1,
-            'Riesgo Moderado': 0.4,
-            'Alto Riesgo': 0.7,
-            'Riesgo Crítico': 1.0
-        }
-        self.df['risk_score_kmeans'] = self.df['nivel_riesgo_kmeans'].map(risk_mapping_kmeans)
+        self.df['risk_score_kmeans'] = self.df['nivel_riesgo_kmeans'].map(KMEANS_LEVEL_SCORES)
         
         # DBSCAN: outliers = alto riesgo
-        self.df['risk_score_dbscan'] = np.where(self.df['cluster_dbscan'] == -1, 1.0, 0.3)
+        self.df['risk_score_dbscan'] = np.where(self.df['cluster_dbscan'] == -1,
+                                                DBSCAN_OUTLIER_SCORE, DBSCAN_MEMBER_SCORE)
         
         # GMM: usar probabilidad directa
         self.df['risk_score_gmm'] = self.df['prob_alto_riesgo']
@@ -274,20 +388,8 @@ class MultiLevelClusteringSystem:
         # Índice de aislamiento normalizado
         self.df['risk_score_aislamiento'] = self.df['indice_aislamiento_social'] / 10
         
-        # Score combinado (media ponderada)
-        self.df['risk_score_final'] = (
-            self.df['risk_score_kmeans'] * 0.3 +
-            self.df['risk_score_dbscan'] * 0.2 +
-            self.df['risk_score_gmm'] * 0.3 +
-            self.df['risk_score_aislamiento'] * 0.2
-        )
-        
-        # Categorizar en niveles
-        self.df['nivel_riesgo_final'] = pd.cut(
-            self.df['risk_score_final'],
-            bins=[0, 0.3, 0.5, 0.7, 1.0],
-            labels=['Bajo', 'Moderado', 'Alto', 'Crítico']
-        )
+        # Score combinado (media ponderada) y categorización en niveles
+        combine_risk_scores(self.df, self.ensemble_weights)
         
         print("--- Distribución de Riesgo Final ---")
         print(self.df['nivel_riesgo_final'].value_counts().sort_index())
@@ -301,20 +403,40 @@ class MultiLevelClusteringSystem:
         
         return self.df['risk_score_final']
     
-    def visualize_clusters_pca(self, clusters, method_name):
-        """Visualiza clusters usando PCA para reducción a 2D"""
-        pca = PCA(n_components=2)
-        X_pca = pca.fit_transform(self.X_scaled)
-        
-        plt.figure(figsize=(12, 8))
-        scatter = plt.scatter(X_pca[:, 0], X_pca[:, 1], c=clusters, cmap='viridis', alpha=0.6)
-        plt.colorbar(scatter, label='Cluster')
-        plt.xlabel(f'PC1 ({pca.explained_variance_ratio_[0]:.2%} varianza)')
-        plt.ylabel(f'PC2 ({pca.explained_variance_ratio_[1]:.2%} varianza)')
-        plt.title(f'Visualización de Clusters - {method_name}')
-        plt.grid(True, alpha=0.3)
-        plt.savefig(f'clusters_{method_name.lower().replace(" ", "_")}.png')
-        print(f"Visualización guardada en 'clusters_{method_name.lower().replace(' ', '_')}.png'")
+    def report_quality(self, method, clusters, noise_label=None, gmm=None):
+        """Estima y muestra las métricas de calidad de una partición y las guarda en quality_metrics"""
+        from cluster_quality import ClusterQuality, print_quality
+        
+        if self.quality is None:
+            self.quality = ClusterQuality()
+        metrics = self.quality.evaluate(self.X_scaled, clusters, noise_label=noise_label, gmm=gmm)
+        self.quality_metrics[method] = metrics
+        print_quality(metrics, self.quality.confidence)
+        return metrics
+    
+    def visualize_clusters_pca(self, clusters, method_name, max_points=None, mode='auto'):
+        """
+        Visualiza clusters usando PCA para reducción a 2D
+        
+        Args:
+            max_points: Presupuesto de puntos (default: PLOT_MAX_POINTS)
+            mode: 'auto', 'scatter', 'decimate' o 'hexbin' (ver cluster_plots.scatter_clusters)
+        """
+        # Una sola proyección por matriz de features, compartida por todos los métodos
+        pca, X_pca = self.projections.get(self.X_scaled)
+        
+        fig, ax = plt.subplots(figsize=(12, 8))
+        artist, drawn = scatter_clusters(ax, X_pca, np.asarray(clusters),
+                                         max_points=max_points or self.PLOT_MAX_POINTS, mode=mode)
+        fig.colorbar(artist, ax=ax, label='Cluster')
+        ax.set_xlabel(f'PC1 ({pca.explained_variance_ratio_[0]:.2%} varianza)')
+        ax.set_ylabel(f'PC2 ({pca.explained_variance_ratio_[1]:.2%} varianza)')
+        ax.set_title(f'Visualización de Clusters - {method_name} ({drawn})')
+        ax.grid(True, alpha=0.3)
+        filename = f'clusters_{method_name.lower().replace(" ", "_")}.png'
+        fig.savefig(filename)
+        plt.close(fig)
+        print(f"Visualización guardada en '{filename}'")
     
     def visualize_probability_distribution(self, probs, high_risk_cluster):
         """Visualiza distribución de probabilidades de GMM"""
@@ -338,8 +460,106 @@ class MultiLevelClusteringSystem:
         
         plt.tight_layout()
         plt.savefig('gmm_probabilities.png')
+        plt.close()
         print("Distribución de probabilidades guardada en 'gmm_probabilities.png'")
     
+    def run_pipeline(self, stage_params=None, cache_dir='.pipeline_cache', stages=None):
+        """
+        Ejecuta las etapas de PIPELINE_STAGES con memoización en disco: solo se
+        recalculan las etapas cuyos datos de entrada, parámetros o código
+        cambiaron (y las que dependen de ellas)
+        
+        Args:
+            stage_params: {etapa: kwargs del método}, p. ej.
+                {'ensemble': {'weights': {...}}, 'gmm': {'visualize': False}}
+            cache_dir: Directorio de la caché de etapas (None = sin caché)
+            stages: Etapas a ejecutar (default: todas; se añaden sus dependencias)
+            
+        Returns:
+            Estadísticas de la caché (aciertos, fallos, tiempo ahorrado)
+        """
+        from cluster_quality import ClusterQuality
+        from pipeline_cache import StageCache, code_fingerprint, frame_fingerprint
+        
+        stage_params = stage_params or {}
+        if self.quality is None:
+            self.quality = ClusterQuality()
+        # Las métricas de calidad cacheadas dependen de la configuración de ClusterQuality
+        quality_settings = {key: value for key, value in vars(self.quality).items() if not key.startswith('_')}
+        selected = set(stages or self.PIPELINE_STAGES)
+        for name in reversed(list(self.PIPELINE_STAGES)):
+            if name in selected:
+                selected.update(self.PIPELINE_STAGES[name][1])
+        
+        cache = StageCache(cache_dir)
+        data_key = frame_fingerprint(self.df[['user_id'] + [col for col in self.FEATURE_COLS if col in self.df.columns]])
+        keys = {}
+        for name, (method, depends, columns, attrs, modules) in self.PIPELINE_STAGES.items():
+            if name not in selected:
+                continue
+            params = stage_params.get(name, {})
+            # visualize entra en la clave: un acierto no vuelve a generar los gráficos,
+            # así que pedirlos con visualize=True recalcula la etapa si no se generaron
+            measures_quality = any(attr.startswith('quality_metrics.') for attr in attrs)
+            if measures_quality:
+                key_params = {**params, 'quality': quality_settings}
+                code = code_fingerprint(getattr(type(self), method), type(self).report_quality, *modules)
+            else:
+                key_params = params
+                code = code_fingerprint(getattr(type(self), method), *modules)
+            
+            def compute(method=method, params=params, columns=columns, attrs=attrs):
+                getattr(self, method)(**params)
+                return self._stage_outputs(columns, attrs)
+            
+            keys[name], outputs = cache.run(name, compute, [keys[d] for d in depends] or [data_key],
+                                            key_params, code)
+            self._restore_stage_outputs(outputs)
+        
+        cache.report()
+        return cache.stats
+    
+    def _stage_outputs(self, columns, attrs):
+        """Columnas (admite patrones con *) y atributos producidos por una etapa"""
+        import fnmatch
+        
+        names = [col for pattern in columns for col in fnmatch.filter(self.df.columns, pattern)]
+        values = {}
+        for attr in attrs:
+            if '.' in attr:
+                container, item = attr.split('.')
+                if item in getattr(self, container):
+                    values[attr] = getattr(self, container)[item]
+            else:
+                values[attr] = getattr(self, attr)
+        return {'columns': self.df[names].copy(), 'attrs': values}
+    
+    def _restore_stage_outputs(self, outputs):
+        """Aplica al sistema el resultado (cacheado o recién calculado) de una etapa"""
+        for col, values in outputs['columns'].items():
+            # Series (no array) para conservar el tipo, p. ej. el categórico ordenado de los niveles
+            self.df[col] = values.set_axis(self.df.index)
+        for attr, value in outputs['attrs'].items():
+            if '.' in attr:
+                container, item = attr.split('.')
+                getattr(self, container)[item] = value
+            else:
+                setattr(self, attr, value)
+    
+    def save_model_bundle(self, root='modelos', contamination=0.05):
+        """
+        Guarda escalado, K-Means, núcleos de DBSCAN, GMM e Isolation Forest en una
+        versión nueva del bundle (requiere kmeans, dbscan y gmm ya ejecutados)
+        
+        Returns:
+            Versión guardada (model_bundle.score_users la usa por defecto)
+        """
+        from model_bundle import ModelBundle
+        
+        version = ModelBundle.from_system(self, contamination=contamination).save(root)
+        print(f"Bundle de modelos guardado: {root}/{version}")
+        return version
+    
     def save_results(self, filename='resultados_clustering.csv'):
         """Guarda resultados finales"""
         self.df.to_csv(filename, index=False)
@@ -368,31 +588,40 @@ class MultiLevelClusteringSystem:
             print(f"    - Amigos reales: {critical['amigos_reales'].mean():.1f}")
             print(f"    - Días de inactividad: {critical['dias_inactividad'].mean():.1f}")
             print(f"    - Índice de aislamiento: {critical['indice_aislamiento_social'].mean():.2f}/10")
-        
+
+        if self.quality_metrics:
+            from cluster_quality import ClusterQuality, print_quality
+            if self.quality is None:
+                self.quality = ClusterQuality()
+        for method, metrics in self.quality_metrics.items():
+            print(f"\n--- Calidad de Clustering: {method} ---")
+            print_quality(metrics, self.quality.confidence)
+
         print("\n" + "="*70)
 
 
 # Ejemplo de uso
 if __name__ == "__main__":
     # Inicializar sistema
-    clustering_system = MultiLevelClusteringSystem('features_riesgo_psicosocial.csv')
-    
-    # Preparar features
-    clustering_system.prepare_features()
+    clustering_system = MultiLevelClusteringSystem('feature_store')
     
-    # Ejecutar todos los métodos de clustering
+    # Preparar features, ejecutar todos los métodos de clustering y calcular el
+    # score de riesgo combinado; las etapas sin cambios salen de la caché
     print("\n🔍 Ejecutando análisis multi-nivel...")
     
-    clusters_kmeans = clustering_system.kmeans_clustering(n_clusters=4, visualize=True)
-    clusters_dbscan = clustering_system.dbscan_clustering(eps=0.8, min_samples=15, visualize=True)
-    clusters_hierarchical = clustering_system.hierarchical_clustering(n_clusters=4, visualize=True)
-    clusters_gmm, probs_gmm = clustering_system.gmm_clustering(n_components=4, visualize=True)
-    
-    # Calcular score de riesgo combinado
-    final_scores = clustering_system.ensemble_risk_score()
+    clustering_system.run_pipeline({
+        'kmeans': {'n_clusters': 4, 'visualize': True},
+        'dbscan': {'eps': 0.8, 'min_samples': 15, 'visualize': True, 'eps_grid': [0.6, 0.8, 1.0],
+                   'min_samples_grid': [10, 15, 20]},
+        'hierarchical': {'n_clusters': 4, 'visualize': True},
+        'gmm': {'visualize': True, 'n_components_range': range(2, 8), 'covariance_types': ('full', 'diag')},
+        'ensemble': {'weights': {'risk_score_kmeans': 0.3, 'risk_score_dbscan': 0.2,
+                                 'risk_score_gmm': 0.3, 'risk_score_aislamiento': 0.2}},
+    })
     
-    # Guardar resultados
+    # Guardar resultados y los modelos para puntuar sin reentrenar
     clustering_system.save_results()
+    clustering_system.save_model_bundle()
     
     # Generar reporte
     clustering_system.generate_report()
@@ -0,0 +1,223 @@
+"""
+Motor DBSCAN con Grafo de Vecinos Reutilizable y eps Automático
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+DBSCAN resuelve una consulta de radio por usuario en cada ejecución, así que
+probar varios eps/min_samples repite todo el trabajo espacial. Este motor:
+
+1. Calcula la curva k-distancia (distancia al k-ésimo vecino, índice KD/Ball
+   tree) y toma eps en su codo (punto de máxima distancia a la recta que une
+   sus extremos, como Kneedle).
+2. Construye una sola vez el grafo disperso de radio con el mayor eps pedido.
+3. Ejecuta DBSCAN con metric='precomputed' sobre ese grafo para cada
+   combinación de la rejilla: solo filtra aristas, sin volver a los puntos.
+
+Las etiquetas coinciden con DBSCAN sobre los puntos originales con el mismo eps.
+El grafo solo compensa si es disperso: si el grado medio estimado (consultas de
+radio sobre una muestra) supera max_avg_degree o su memoria estimada supera
+max_graph_mb (≈100 bytes de pico por arista al construirlo), no se materializa
+y cada combinación ejecuta DBSCAN sobre los puntos.
+
+Uso:
+    python dbscan_engine.py --data feature_store --min-samples 10 15 --eps-factors 0.75 1 1.25
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import DBSCAN
+from sklearn.neighbors import NearestNeighbors
+
+# Pico de memoria medido por arista al construir el grafo de radio (listas de
+# vecinos + distancias + CSR final)
+EDGE_BYTES = 100
+
+
+def knee_point(values):
+    """Índice del codo de una curva creciente (máxima distancia bajo la diagonal normalizada)"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 3 or values[-1] == values[0]:
+        return len(values) - 1
+    x = np.linspace(0.0, 1.0, len(values))
+    y = (values - values[0]) / (values[-1] - values[0])
+    return int(np.argmax(x - y))
+
+
+class DBSCANEngine:
+    """DBSCAN sobre un grafo de radio precalculado con selección automática de eps"""
+
+    def __init__(self, algorithm='auto', leaf_size=30, max_avg_degree=100, max_graph_mb=1024, n_jobs=None,
+                 random_state=42):
+        """
+        Args:
+            algorithm: Índice espacial de NearestNeighbors ('auto', 'kd_tree', 'ball_tree')
+            leaf_size: Tamaño de hoja del índice
+            max_avg_degree: Vecinos medios por usuario por encima de los cuales el
+                grafo se considera denso y no se construye
+            max_graph_mb: Memoria máxima estimada del grafo (EDGE_BYTES por arista)
+            n_jobs: Procesos de las consultas de vecinos
+            random_state: Semilla de la muestra con la que se estima el tamaño del grafo
+        """
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+        self.max_avg_degree = max_avg_degree
+        self.max_graph_mb = max_graph_mb
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.X = None
+        self.index_ = None
+        self.graph_ = None
+        self.graph_eps_ = 0.0
+        self.k_distances_ = {}
+        self.labels_ = {}
+        self.core_samples_ = {}
+        self.results = None
+
+    def fit(self, X):
+        """Construye el índice espacial (el grafo se crea bajo demanda)"""
+        self.X = np.asarray(X, dtype=np.float64)
+        self.index_ = NearestNeighbors(algorithm=self.algorithm, leaf_size=self.leaf_size,
+                                       n_jobs=self.n_jobs).fit(self.X)
+        self.graph_ = None
+        self.graph_eps_ = 0.0
+        self.k_distances_ = {}
+        self.labels_ = {}
+        self.core_samples_ = {}
+        return self
+
+    def k_distance(self, min_samples):
+        """
+        Distancia de cada usuario a su vecino número min_samples - 1 (sin contarse
+        a sí mismo), que es el eps mínimo para que sea punto núcleo
+        """
+        if min_samples not in self.k_distances_:
+            k = min(max(min_samples - 1, 1), len(self.X) - 1)
+            distances, _ = self.index_.kneighbors(n_neighbors=k)
+            self.k_distances_[min_samples] = distances[:, -1]
+        return self.k_distances_[min_samples]
+
+    def auto_eps(self, min_samples):
+        """eps en el codo de la curva k-distancia ordenada"""
+        curve = np.sort(self.k_distance(min_samples))
+        return float(curve[knee_point(curve)])
+
+    def estimate_edges(self, eps, sample_size=1000):
+        """Aristas esperadas del grafo de radio eps a partir de una muestra de usuarios"""
+        rng = np.random.default_rng(self.random_state)
+        sample = rng.choice(len(self.X), min(sample_size, len(self.X)), replace=False)
+        neighbors = self.index_.radius_neighbors(self.X[sample], radius=eps, return_distance=False)
+        return int(np.mean([len(row) for row in neighbors]) * len(self.X))
+
+    def graph_too_large(self, edges):
+        """El grafo no compensa: grado medio o memoria estimada por encima del límite"""
+        return (edges / len(self.X) > self.max_avg_degree
+                or edges * EDGE_BYTES > self.max_graph_mb * 1024**2)
+
+    def graph(self, eps):
+        """
+        Grafo de radio (CSR, distancias) con radio >= eps; se reutiliza si ya cubre eps
+
+        Returns:
+            Matriz dispersa, o None si sería densa (ver graph_too_large)
+        """
+        if self.graph_ is None or eps > self.graph_eps_:
+            if self.graph_too_large(self.estimate_edges(eps)):
+                return None
+            self.graph_ = self.index_.radius_neighbors_graph(radius=eps, mode='distance', sort_results=True)
+            self.graph_eps_ = eps
+        return self.graph_
+
+    def fit_predict(self, eps, min_samples):
+        """Etiquetas DBSCAN (-1 = outlier) para un eps/min_samples sobre el grafo cacheado"""
+        key = (round(float(eps), 10), int(min_samples))
+        if key not in self.labels_:
+            graph = self.graph(eps)
+            if graph is not None:
+                dbscan = DBSCAN(eps=eps, min_samples=min_samples, metric='precomputed', n_jobs=self.n_jobs)
+                self.labels_[key] = dbscan.fit_predict(graph)
+            else:
+                dbscan = DBSCAN(eps=eps, min_samples=min_samples, algorithm=self.algorithm,
+                                leaf_size=self.leaf_size, n_jobs=self.n_jobs)
+                self.labels_[key] = dbscan.fit_predict(self.X)
+            self.core_samples_[key] = dbscan.core_sample_indices_
+        return self.labels_[key]
+
+    def core_sample_indices(self, eps, min_samples):
+        """Índices de los puntos núcleo de una combinación (para asignar usuarios nuevos)"""
+        self.fit_predict(eps, min_samples)
+        return self.core_samples_[(round(float(eps), 10), int(min_samples))]
+
+    def grid(self, eps_values=None, min_samples_values=(10,), eps_factors=(0.75, 1.0, 1.25)):
+        """
+        Evalúa una rejilla de eps/min_samples con un único grafo de radio
+
+        Args:
+            eps_values: eps a probar; si es None, para cada min_samples se usa su
+                eps automático multiplicado por eps_factors
+
+        Returns:
+            DataFrame con eps, min_samples, clusters, outliers y tiempo de cada combinación
+        """
+        settings = []
+        for min_samples in min_samples_values:
+            if eps_values is None:
+                base = self.auto_eps(min_samples)
+                settings += [(base * factor, min_samples, factor == 1.0) for factor in eps_factors]
+            else:
+                settings += [(eps, min_samples, False) for eps in eps_values]
+
+        # Un solo grafo con el mayor radio; los demás eps solo filtran aristas
+        start = time.perf_counter()
+        self.graph(max(eps for eps, _, _ in settings))
+        graph_time = time.perf_counter() - start
+
+        rows = []
+        for eps, min_samples, is_auto in settings:
+            start = time.perf_counter()
+            labels = self.fit_predict(eps, min_samples)
+            n_outliers = int((labels == -1).sum())
+            rows.append({
+                'eps': round(eps, 4),
+                'min_samples': min_samples,
+                'auto': is_auto,
+                'clusters': len(np.unique(labels)) - (1 if n_outliers else 0),
+                'outliers': n_outliers,
+                'outliers_pct': round(100 * n_outliers / len(labels), 2),
+                'fit_time_s': round(time.perf_counter() - start, 4),
+            })
+        self.results = pd.DataFrame(rows)
+        self.results.attrs['graph_time_s'] = graph_time
+        self.results.attrs['graph_edges'] = int(self.graph_.nnz) if self.graph_ is not None else None
+        return self.results
+
+    def report(self):
+        """Muestra la rejilla evaluada y el tamaño del grafo reutilizado"""
+        if self.results is None:
+            return
+        if self.results.attrs['graph_edges'] is None:
+            print(f"\n--- Rejilla DBSCAN (sin grafo: más de {self.max_avg_degree} vecinos medios o "
+                  f"{self.max_graph_mb} MB estimados; DBSCAN sobre los puntos) ---")
+        else:
+            print(f"\n--- Rejilla DBSCAN (grafo de radio {self.graph_eps_:.3f}: "
+                  f"{self.results.attrs['graph_edges']} aristas en {self.results.attrs['graph_time_s']:.2f}s) ---")
+        print(self.results.to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rejilla DBSCAN sobre un grafo de vecinos reutilizable")
+    parser.add_argument('--data', default='feature_store', help="Almacén/CSV de features")
+    parser.add_argument('--min-samples', nargs='+', type=int, default=[10, 15], help="Valores de min_samples")
+    parser.add_argument('--eps', nargs='+', type=float, default=None, help="eps fijos (default: automático)")
+    parser.add_argument('--eps-factors', nargs='+', type=float, default=[0.75, 1.0, 1.25],
+                        help="Multiplicadores del eps automático")
+    args = parser.parse_args()
+
+    from clustering_system import MultiLevelClusteringSystem
+
+    system = MultiLevelClusteringSystem(args.data)
+    engine = DBSCANEngine().fit(system.prepare_features())
+    engine.grid(eps_values=args.eps, min_samples_values=args.min_samples, eps_factors=args.eps_factors)
+    engine.report()
@@ -0,0 +1,68 @@
+"""
+Esquema de Tipos de las Features de Riesgo Psicosocial
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Tipos compactos y explícitos de cada columna conocida, compartidos por la
+extracción (extract_features.py) y el almacén columnar (feature_store.py).
+"""
+
+from lazy_imports import lazy_module
+
+pd = lazy_module('pandas')
+
+# Esquema explícito de las columnas conocidas (las no listadas conservan su tipo)
+COUNT_COLUMNS = [
+    'followers_count', 'following_count', 'posts_count', 'dias_inactividad', 'edad',
+    'longitud_bio', 'amigos_reales', 'solicitudes_pendientes', 'rechazos', 'bloqueos',
+    'veces_bloqueado', 'num_comunidades', 'dias_desde_primera_union',
+    'dias_desde_ultima_union', 'total_posts', 'dias_desde_ultima_publicacion',
+    'posts_ultima_semana', 'posts_ultimo_mes', 'comentarios_realizados', 'posts_comentados',
+    'comentarios_recibidos', 'usuarios_comentadores', 'conversaciones_activas',
+    'conversaciones_archivadas', 'usuarios_bloqueados_msg', 'mensajes_enviados',
+    'num_preferencias', 'num_intereses', 'dias_con_actividad', 'dias_totales_en_plataforma',
+]
+FLAG_COLUMNS = ['is_verified', 'is_active']
+CATEGORY_COLUMNS = ['gender']
+DATETIME_COLUMNS = ['created_at']
+RATIO_COLUMNS = [
+    'tamano_promedio_comunidad', 'promedio_likes', 'promedio_comentarios', 'promedio_shares',
+    'engagement_promedio', 'ratio_posts_privados', 'variabilidad_publicacion',
+    'likes_promedio_en_comentarios', 'mensajes_sin_leer_promedio', 'dias_desde_ultimo_mensaje',
+    'longitud_promedio_mensaje', 'ratio_mensajes_editados', 'ratio_mensajes_eliminados',
+    'variabilidad_horaria', 'hora_promedio_actividad', 'ratio_actividad_nocturna',
+    'indice_aislamiento_social', 'ratio_reciprocidad_comentarios', 'ratio_decay_actividad',
+    'indice_conflicto_social', 'ratio_actividad_diaria',
+]
+
+FEATURE_DTYPES = {
+    **{col: 'int32' for col in COUNT_COLUMNS},
+    **{col: 'int8' for col in FLAG_COLUMNS},
+    **{col: 'category' for col in CATEGORY_COLUMNS},
+    **{col: 'datetime64[ns]' for col in DATETIME_COLUMNS},
+    **{col: 'float32' for col in RATIO_COLUMNS},
+}
+
+
+def apply_feature_dtypes(df, copy=True):
+    """
+    Convierte las columnas conocidas a su tipo compacto explícito
+    
+    Args:
+        df: DataFrame de features
+        copy: Si False, convierte las columnas sobre el mismo DataFrame
+    """
+    if copy:
+        df = df.copy()
+    for col, dtype in FEATURE_DTYPES.items():
+        if col not in df.columns:
+            continue
+        if dtype == 'datetime64[ns]':
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        elif dtype.startswith('int'):
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).round().astype(dtype)
+        elif dtype == 'category':
+            df[col] = df[col].astype('category')
+        else:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+    return df
@@ -0,0 +1,223 @@
+"""
+Almacén Columnar de Features (Parquet/Arrow)
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Sustituye el CSV intermedio entre extract_features.py y clustering_system.py
+por ficheros Parquet con tipos explícitos, compresión y particiones por fecha
+de extracción:
+
+    feature_store/
+    └── extraction_date=2025-11-28/
+        └── features.parquet
+
+Uso para convertir un CSV existente:
+    python feature_store.py features_riesgo_psicosocial.csv --date 2025-11-28
+"""
+
+import argparse
+import os
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from feature_schema import apply_feature_dtypes
+
+PARTITION_PREFIX = 'extraction_date='
+PARTITION_FILE = 'features.parquet'
+ROW_GROUP_SIZE = 100_000
+
+class FeatureStore:
+    """Lectura y escritura de features en Parquet particionado por fecha de extracción"""
+
+    def __init__(self, root='feature_store', compression='zstd', row_group_size=ROW_GROUP_SIZE):
+        """
+        Args:
+            root: Directorio raíz del almacén
+            compression: Códec Parquet (zstd, snappy, gzip...)
+            row_group_size: Filas por row group (unidad mínima de lectura por bloques)
+        """
+        self.root = root
+        self.compression = compression
+        self.row_group_size = row_group_size
+
+    def _partition_path(self, extraction_date):
+        return os.path.join(self.root, f"{PARTITION_PREFIX}{extraction_date}", PARTITION_FILE)
+
+    def partitions(self):
+        """Fechas de extracción disponibles, ordenadas de la más antigua a la más reciente"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name[len(PARTITION_PREFIX):]
+            for name in os.listdir(self.root)
+            if name.startswith(PARTITION_PREFIX)
+            and os.path.exists(os.path.join(self.root, name, PARTITION_FILE))
+        )
+
+    def write(self, df, extraction_date=None, verbose=True):
+        """
+        Guarda un DataFrame de features en la partición de su fecha
+
+        Args:
+            df: DataFrame con las features (una fila por user_id)
+            extraction_date: Fecha ISO de la partición (default: hoy)
+            verbose: Imprimir la ruta escrita
+
+        Returns:
+            Ruta del fichero escrito
+        """
+        extraction_date = str(extraction_date or date.today().isoformat())
+        path = self._partition_path(extraction_date)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        table = pa.Table.from_pandas(apply_feature_dtypes(df), preserve_index=False)
+        # Escribir en un temporal y renombrar para no dejar particiones a medias
+        tmp_path = path + '.tmp'
+        pq.write_table(table, tmp_path, compression=self.compression, row_group_size=self.row_group_size)
+        os.replace(tmp_path, path)
+
+        if verbose:
+            print(f"Features guardadas en: {path}")
+        return path
+
+    def open_writer(self, extraction_date=None, verbose=True):
+        """PartitionWriter que escribe la partición por bloques (un row group por bloque)"""
+        return PartitionWriter(self, str(extraction_date or date.today().isoformat()), verbose=verbose)
+
+    def latest_path(self):
+        """Fichero Parquet de la partición más reciente"""
+        available = self.partitions()
+        if not available:
+            raise FileNotFoundError(f"No hay particiones de features en '{self.root}'")
+        return self._partition_path(available[-1])
+
+    def read(self, columns=None, extraction_date=None):
+        """
+        Carga una partición leyendo solo las columnas pedidas
+
+        Args:
+            columns: Columnas a proyectar (None = todas); las que no existan se ignoran
+            extraction_date: Partición a leer (default: la más reciente)
+        """
+        path = self.latest_path() if extraction_date is None else self._partition_path(extraction_date)
+        return read_parquet_projected(path, columns)
+
+    def convert_csv(self, csv_path, extraction_date=None):
+        """
+        Convierte un CSV de features existente a una partición del almacén
+
+        Args:
+            csv_path: CSV generado por FeatureExtractor.save_to_csv
+            extraction_date: Fecha de la partición (default: fecha de modificación del CSV)
+        """
+        if extraction_date is None:
+            extraction_date = date.fromtimestamp(os.path.getmtime(csv_path)).isoformat()
+        return self.write(pd.read_csv(csv_path), extraction_date)
+
+
+class PartitionWriter:
+    """
+    Escritura de una partición por bloques sin reunir el DataFrame completo
+
+    El esquema lo fija el primer bloque; los siguientes se convierten a él. La
+    partición solo aparece (renombrado atómico) al cerrar el escritor sin errores.
+    """
+
+    def __init__(self, store, extraction_date, verbose=True):
+        self.store = store
+        self.path = store._partition_path(extraction_date)
+        self.tmp_path = self.path + '.tmp'
+        self.verbose = verbose
+        self.rows = 0
+        self._writer = None
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def write(self, df):
+        """Añade un bloque de features (se le aplican los tipos de feature_schema)"""
+        table = pa.Table.from_pandas(apply_feature_dtypes(df), preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.tmp_path, table.schema, compression=self.store.compression)
+        else:
+            table = table.cast(self._writer.schema)
+        self._writer.write_table(table, row_group_size=self.store.row_group_size)
+        self.rows += len(df)
+
+    def close(self):
+        """Cierra el fichero y publica la partición"""
+        if self._writer is None:
+            raise ValueError("No se ha escrito ningún bloque en la partición")
+        self._writer.close()
+        os.replace(self.tmp_path, self.path)
+        if self.verbose:
+            print(f"Features guardadas en: {self.path}")
+        return self.path
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_parquet_projected(path, columns=None):
+    """Lee un fichero Parquet mapeado en memoria, proyectando solo las columnas existentes"""
+    if columns is not None:
+        schema_names = set(pq.read_schema(path).names)
+        columns = [col for col in dict.fromkeys(columns) if col in schema_names]
+
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+
+def is_feature_store_path(path):
+    """Indica si una ruta apunta a un almacén Parquet en lugar de a un CSV"""
+    return os.path.isdir(path) or str(path).endswith('.parquet')
+
+
+def load_features(path, columns=None):
+    """Carga features desde un almacén (directorio) o un fichero Parquet suelto"""
+    if os.path.isdir(path):
+        return FeatureStore(path).read(columns)
+    return read_parquet_projected(path, columns)
+
+
+def iter_features(path, columns=None, batch_size=ROW_GROUP_SIZE):
+    """
+    Recorre las features por bloques de como máximo batch_size filas sin cargar
+    el fichero completo (almacén, Parquet suelto o CSV)
+
+    Yields:
+        DataFrame de cada bloque
+    """
+    if not is_feature_store_path(path):
+        yield from pd.read_csv(path, usecols=(lambda col: col in columns) if columns else None,
+                               chunksize=batch_size)
+        return
+    parquet_path = FeatureStore(path).latest_path() if os.path.isdir(path) else path
+    parquet_file = pq.ParquetFile(parquet_path, memory_map=True)
+    if columns is not None:
+        columns = [col for col in dict.fromkeys(columns) if col in parquet_file.schema_arrow.names]
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convierte un CSV de features al almacén Parquet")
+    parser.add_argument('csv_path', help="CSV de features existente")
+    parser.add_argument('--root', default='feature_store', help="Directorio del almacén")
+    parser.add_argument('--date', default=None, help="Fecha de extracción (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    FeatureStore(args.root).convert_csv(args.csv_path, args.date)
@@ -0,0 +1,172 @@
+"""
+Selección de Gaussian Mixture Models en Paralelo con Arranque en Caliente
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Ajusta en procesos paralelos (cada uno con un solo hilo de BLAS/OpenMP) todas
+las combinaciones de número de componentes, tipo de covarianza e
+inicialización, y elige la de menor BIC. Los parámetros del mejor ajuste de
+cada configuración (pesos, medias y precisiones) se guardan en disco: el
+siguiente reentrenamiento nocturno arranca desde ellos y converge en pocas
+iteraciones, y las componentes conservan su orden, de modo que la componente
+de alto riesgo no cambia de índice entre ejecuciones.
+
+Uso:
+    from gmm_engine import GMMSelector
+    selector = GMMSelector(n_components_range=range(2, 8), covariance_types=('full', 'diag'))
+    gmm = selector.fit(X_scaled)
+    selector.report()
+"""
+
+import os
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.mixture import GaussianMixture
+from threadpoolctl import threadpool_limits
+
+COVARIANCE_TYPES = ('full', 'tied', 'diag', 'spherical')
+
+
+def _fit_candidate(X, candidate, params):
+    """Ajusta un candidato (se ejecuta en un proceso del pool)"""
+    n_components, covariance_type, seed, warm = candidate
+    init = {}
+    if warm is not None:
+        init = {'weights_init': warm['weights'], 'means_init': warm['means'], 'precisions_init': warm['precisions']}
+    with threadpool_limits(limits=1), warnings.catch_warnings():
+        warnings.simplefilter('ignore', ConvergenceWarning)
+        start = time.perf_counter()
+        model = GaussianMixture(n_components=n_components, covariance_type=covariance_type,
+                                max_iter=params['max_iter'], tol=params['tol'], reg_covar=params['reg_covar'],
+                                random_state=seed, **init)
+        model.fit(X)
+        fit_time = time.perf_counter() - start
+        bic = float(model.bic(X))
+        aic = float(model.aic(X))
+    return model, {
+        'n_components': n_components,
+        'covariance_type': covariance_type,
+        'init': 'warm' if warm is not None else f'aleatoria ({seed})',
+        'bic': bic,
+        'aic': aic,
+        'log_likelihood': float(model.lower_bound_),
+        'n_iter': int(model.n_iter_),
+        'converged': bool(model.converged_),
+        'fit_time_s': fit_time,
+    }
+
+
+class GMMSelector:
+    """Barrido paralelo de GMM con selección por BIC y arranque en caliente"""
+
+    def __init__(self, n_components_range=range(2, 8), covariance_types=('full',), n_init=3,
+                 warm_n_init=0, max_iter=200, tol=1e-3, reg_covar=1e-6, random_state=42, n_jobs=None,
+                 state_path='.gmm_state.joblib'):
+        """
+        Args:
+            n_components_range: Números de componentes candidatos
+            covariance_types: Tipos de covarianza candidatos (ver COVARIANCE_TYPES)
+            n_init: Inicializaciones aleatorias por configuración sin estado previo
+            warm_n_init: Inicializaciones aleatorias adicionales cuando hay
+                estado previo (0 = solo el ajuste en caliente)
+            random_state: Semilla base; la inicialización i usa random_state + i
+            n_jobs: Procesos en paralelo (default: uno por candidato, hasta el nº de CPUs)
+            state_path: Fichero con los parámetros del último ajuste (None = sin
+                arranque en caliente)
+        """
+        unknown = set(covariance_types) - set(COVARIANCE_TYPES)
+        if unknown:
+            raise ValueError(f"Tipos de covarianza no soportados: {sorted(unknown)}")
+        self.n_components_range = sorted(set(int(k) for k in n_components_range))
+        self.covariance_types = tuple(covariance_types)
+        self.n_init = n_init
+        self.warm_n_init = warm_n_init
+        self.params = {'max_iter': max_iter, 'tol': tol, 'reg_covar': reg_covar}
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.state_path = state_path
+        self.best_model = None
+        self.best = None
+        self.results = None
+
+    def _load_state(self, n_features):
+        """Parámetros previos por configuración, descartados si cambió el nº de features"""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            state = joblib.load(self.state_path)
+        except (EOFError, ValueError):
+            return {}
+        if state.get('n_features') != n_features:
+            return {}
+        return state['configs']
+
+    def _save_state(self, n_features, configs):
+        if not self.state_path:
+            return
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        joblib.dump({'n_features': n_features, 'configs': configs}, tmp_path)
+        os.replace(tmp_path, self.state_path)
+
+    def candidates(self, n_features):
+        """Lista de (n_components, covariance_type, semilla, parámetros previos o None)"""
+        state = self._load_state(n_features)
+        candidates = []
+        for covariance_type in self.covariance_types:
+            for n_components in self.n_components_range:
+                warm = state.get((n_components, covariance_type))
+                if warm is not None:
+                    candidates.append((n_components, covariance_type, self.random_state, warm))
+                n_random = self.warm_n_init if warm is not None else self.n_init
+                candidates.extend((n_components, covariance_type, self.random_state + i, None)
+                                  for i in range(n_random))
+        return candidates
+
+    def fit(self, X):
+        """
+        Ajusta todos los candidatos y selecciona el de menor BIC
+
+        Returns:
+            GaussianMixture seleccionado
+        """
+        X = np.asarray(X, dtype=np.float64)
+        candidates = self.candidates(X.shape[1])
+        n_jobs = self.n_jobs or min(len(candidates), os.cpu_count() or 1)
+        fitted = Parallel(n_jobs=n_jobs)(delayed(_fit_candidate)(X, c, self.params) for c in candidates)
+
+        self.results = pd.DataFrame([metrics for _, metrics in fitted])
+        best_index = int(self.results['bic'].idxmin())
+        self.best_model = fitted[best_index][0]
+        self.best = self.results.loc[best_index].to_dict()
+
+        # Mejor ajuste de cada configuración como punto de partida del siguiente
+        configs = self._load_state(X.shape[1])
+        for (n_components, covariance_type), group in self.results.groupby(['n_components', 'covariance_type']):
+            model = fitted[int(group['bic'].idxmin())][0]
+            configs[(int(n_components), covariance_type)] = {
+                'weights': model.weights_, 'means': model.means_, 'precisions': model.precisions_,
+            }
+        self._save_state(X.shape[1], configs)
+        return self.best_model
+
+    def report(self):
+        """Muestra los candidatos ordenados por BIC con tiempos e iteraciones"""
+        if self.results is None:
+            return
+        print("\n--- Candidatos GMM (ordenados por BIC) ---")
+        columns = ['n_components', 'covariance_type', 'init', 'bic', 'aic', 'n_iter', 'converged', 'fit_time_s']
+        print(self.results.sort_values('bic')[columns].to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+        warm = self.results['init'] == 'warm'
+        for label, mask in (('En caliente', warm), ('Aleatorios', ~warm)):
+            if mask.any():
+                print(f"  {label}: {mask.sum()} ajustes, {self.results.loc[mask, 'n_iter'].mean():.1f} iteraciones "
+                      f"y {self.results.loc[mask, 'fit_time_s'].mean():.3f}s de media")
+        print(f"  Seleccionado: {self.best['n_components']} componentes, covarianza '{self.best['covariance_type']}' "
+              f"({self.best['init']}), BIC={self.best['bic']:.1f}")
+        print(f"  Tiempo total de ajuste: {self.results['fit_time_s'].sum():.2f}s en {len(self.results)} candidatos")
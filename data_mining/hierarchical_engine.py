@@ -0,0 +1,245 @@
+"""
+Clustering Jerárquico (Ward) Escalable con Micro-Clusters
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+El linkage de Ward exacto necesita la matriz de distancias completa (memoria
+O(n²)) y deja de ser viable a partir de unas decenas de miles de usuarios.
+Este módulo:
+
+1. Resume los datos en micro-clusters con BIRCH (sobre una muestra con semilla
+   si hay muchos usuarios) y asigna cada usuario a su micro-cluster más cercano.
+2. Ejecuta Ward ponderado sobre los micro-clusters (centroide + nº de usuarios),
+   que produce un linkage con el formato de scipy (dendrogram, fcluster).
+3. Corta el árbol en n_clusters y propaga la etiqueta a cada usuario a través
+   de su micro-cluster (asignación por centroide más cercano).
+
+Uso para comparar con Ward exacto en tamaños pequeños:
+    python hierarchical_engine.py --sizes 1000 2000 5000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import fcluster, linkage
+from sklearn.cluster import Birch, KMeans
+from sklearn.metrics import adjusted_mutual_info_score, adjusted_rand_score, pairwise_distances_argmin
+
+
+def weighted_ward_linkage(centers, weights):
+    """
+    Linkage de Ward sobre grupos ponderados
+
+    El coste de unir A y B es n_A·n_B/(n_A+n_B)·||c_A - c_B||², el mismo que
+    minimiza Ward sobre los puntos originales si cada grupo se trata como
+    indivisible. Con pesos 1 coincide con scipy.cluster.hierarchy.linkage(X, 'ward').
+
+    Args:
+        centers: Matriz (m, d) de centroides
+        weights: Número de usuarios de cada grupo
+
+    Returns:
+        Matriz de linkage (m-1, 4) con el formato de scipy (la cuarta columna
+        cuenta grupos, no usuarios, como exige scipy)
+    """
+    centers = np.asarray(centers, dtype=np.float64).copy()
+    weights = np.asarray(weights, dtype=np.float64).copy()
+    m = len(centers)
+    if m < 2:
+        return np.empty((0, 4))
+
+    def costs(i):
+        diff = centers - centers[i]
+        return weights * weights[i] / (weights + weights[i]) * np.einsum('ij,ij->i', diff, diff)
+
+    active = np.ones(m, dtype=bool)
+    cost = np.vstack([costs(i) for i in range(m)])
+    np.fill_diagonal(cost, np.inf)
+    # Mínimo de cada fila para no recorrer la matriz entera en cada unión
+    row_arg = cost.argmin(axis=1)
+    row_min = cost[np.arange(m), row_arg]
+    cluster_ids = np.arange(m)
+    leaves = np.ones(m)
+    Z = np.empty((m - 1, 4))
+
+    for step in range(m - 1):
+        i = int(np.argmin(row_min))
+        j = int(row_arg[i])
+        if j < i:
+            i, j = j, i
+        Z[step] = [
+            min(cluster_ids[i], cluster_ids[j]), max(cluster_ids[i], cluster_ids[j]),
+            np.sqrt(2.0 * cost[i, j]), leaves[i] + leaves[j],
+        ]
+
+        # El grupo unido ocupa la posición i; la posición j se desactiva
+        total = weights[i] + weights[j]
+        centers[i] = (centers[i] * weights[i] + centers[j] * weights[j]) / total
+        weights[i] = total
+        leaves[i] += leaves[j]
+        cluster_ids[i] = m + step
+        active[j] = False
+        cost[j, :] = np.inf
+        cost[:, j] = np.inf
+        row_min[j] = np.inf
+
+        new_costs = np.where(active, costs(i), np.inf)
+        new_costs[i] = np.inf
+        cost[i, :] = new_costs
+        cost[:, i] = new_costs
+        row_arg[i] = int(np.argmin(new_costs))
+        row_min[i] = new_costs[row_arg[i]]
+
+        # Filas cuyo mínimo apuntaba a i o j: se recalculan; el resto solo puede mejorar con i
+        stale = active & ((row_arg == i) | (row_arg == j))
+        stale[i] = False
+        for k in np.flatnonzero(stale):
+            row_arg[k] = int(np.argmin(cost[k]))
+            row_min[k] = cost[k, row_arg[k]]
+        better = active & (new_costs < row_min)
+        row_min[better] = new_costs[better]
+        row_arg[better] = i
+
+    return Z
+
+
+class ScalableWardClustering:
+    """Ward sobre micro-clusters BIRCH con asignación de cada usuario por centroide"""
+
+    def __init__(self, n_clusters=4, threshold=0.5, max_subclusters=1000,
+                 birch_sample=50_000, random_state=42):
+        """
+        Args:
+            n_clusters: Clusters finales
+            threshold: Radio máximo de un micro-cluster BIRCH (datos estandarizados)
+            max_subclusters: Micro-clusters máximos que entran en Ward; si BIRCH
+                produce más se compactan con K-Means ponderado
+            birch_sample: Usuarios con los que se construye el árbol BIRCH; el
+                resto solo se asigna a su micro-cluster más cercano
+            random_state: Semilla de la muestra y de la compactación
+        """
+        self.n_clusters = n_clusters
+        self.threshold = threshold
+        self.max_subclusters = max_subclusters
+        self.birch_sample = birch_sample
+        self.random_state = random_state
+        self.subcluster_centers_ = None
+        self.subcluster_sizes_ = None
+        self.subcluster_labels_ = None
+        self.linkage_ = None
+        self.labels_ = None
+
+    def _summarize(self, X):
+        """Centroides y tamaños de los micro-clusters, y el micro-cluster de cada usuario"""
+        rng = np.random.default_rng(self.random_state)
+        if len(X) > self.birch_sample:
+            sample = X[np.sort(rng.choice(len(X), self.birch_sample, replace=False))]
+        else:
+            sample = X
+        birch = Birch(threshold=self.threshold, n_clusters=None).fit(sample)
+        centers = birch.subcluster_centers_
+
+        if len(centers) > self.max_subclusters:
+            # Sin clustering global, labels_ es el micro-cluster de cada punto de la muestra
+            sizes = np.bincount(birch.labels_, minlength=len(centers))
+            kmeans = KMeans(n_clusters=self.max_subclusters, n_init=1, random_state=self.random_state)
+            centers = kmeans.fit(centers, sample_weight=sizes).cluster_centers_
+
+        assignment = pairwise_distances_argmin(X, centers)
+        sizes = np.bincount(assignment, minlength=len(centers))
+        # Centroides recalculados con todos los usuarios asignados; se descartan los vacíos
+        sums = np.zeros_like(centers)
+        np.add.at(sums, assignment, X)
+        used = sizes > 0
+        remap = np.cumsum(used) - 1
+        return sums[used] / sizes[used, None], sizes[used], remap[assignment]
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        centers, sizes, assignment = self._summarize(X)
+        self.subcluster_centers_ = centers
+        self.subcluster_sizes_ = sizes
+
+        self.linkage_ = weighted_ward_linkage(centers, sizes)
+        if len(centers) <= self.n_clusters:
+            self.subcluster_labels_ = np.arange(1, len(centers) + 1)
+        else:
+            self.subcluster_labels_ = fcluster(self.linkage_, t=self.n_clusters, criterion='maxclust')
+        self.labels_ = self.subcluster_labels_[assignment]
+        return self
+
+    def fit_predict(self, X):
+        return self.fit(X).labels_
+
+    def predict(self, X):
+        """Etiqueta de nuevos usuarios: la de su micro-cluster más cercano"""
+        return self.subcluster_labels_[pairwise_distances_argmin(np.asarray(X, dtype=np.float64),
+                                                                 self.subcluster_centers_)]
+
+
+def ward_inertia(X, labels):
+    """Suma de cuadrados intra-cluster (el objetivo que minimiza Ward)"""
+    X = np.asarray(X, dtype=np.float64)
+    return float(sum(((X[labels == k] - X[labels == k].mean(axis=0)) ** 2).sum() for k in np.unique(labels)))
+
+
+def compare_with_exact(X, n_clusters=4, sizes=(1000, 2000, 5000), random_state=42, **params):
+    """
+    Compara el modo escalable con Ward exacto sobre submuestras con semilla
+
+    Returns:
+        DataFrame con ARI, AMI, cociente de inercia (escalable / exacto) y tiempos
+    """
+    rng = np.random.default_rng(random_state)
+    rows = []
+    for size in sizes:
+        size = min(size, len(X))
+        X_sub = X[np.sort(rng.choice(len(X), size, replace=False))]
+
+        start = time.perf_counter()
+        exact = fcluster(linkage(X_sub, method='ward'), t=n_clusters, criterion='maxclust')
+        exact_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        model = ScalableWardClustering(n_clusters=n_clusters, random_state=random_state, **params).fit(X_sub)
+        scalable_time = time.perf_counter() - start
+
+        rows.append({
+            'usuarios': size,
+            'micro_clusters': len(model.subcluster_centers_),
+            'ari': round(adjusted_rand_score(exact, model.labels_), 4),
+            'ami': round(adjusted_mutual_info_score(exact, model.labels_), 4),
+            'inercia_relativa': round(ward_inertia(X_sub, model.labels_) / ward_inertia(X_sub, exact), 4),
+            'tiempo_exacto_s': round(exact_time, 3),
+            'tiempo_escalable_s': round(scalable_time, 3),
+        })
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara Ward escalable con Ward exacto")
+    parser.add_argument('--data', default=None, help="Almacén/CSV de features (default: datos sintéticos)")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 2000, 5000], help="Tamaños de muestra")
+    parser.add_argument('--clusters', type=int, default=4, help="Clusters finales")
+    parser.add_argument('--threshold', type=float, default=0.5, help="Radio de los micro-clusters BIRCH")
+    parser.add_argument('--seed', type=int, default=42, help="Semilla")
+    args = parser.parse_args()
+
+    from sklearn.preprocessing import StandardScaler
+
+    if args.data:
+        from clustering_system import MultiLevelClusteringSystem
+        system = MultiLevelClusteringSystem(args.data)
+        X = system.prepare_features()
+    else:
+        from sklearn.datasets import make_blobs
+        X, _ = make_blobs(n_samples=max(args.sizes), n_features=11, centers=6,
+                          cluster_std=2.0, random_state=args.seed)
+        X = StandardScaler().fit_transform(X)
+
+    report = compare_with_exact(X, n_clusters=args.clusters, sizes=args.sizes,
+                                random_state=args.seed, threshold=args.threshold)
+    print("\n=== WARD ESCALABLE VS. WARD EXACTO ===")
+    print(report.to_string(index=False))
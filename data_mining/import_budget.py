@@ -0,0 +1,102 @@
+"""
+Presupuesto de Tiempo de Importación de los Módulos de data_mining
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Importa cada módulo en un intérprete nuevo (varias veces, se toma el mínimo),
+mide el tiempo y comprueba que no haya cargado dependencias pesadas que solo
+deben importarse al usarse. Sale con código 1 si algún módulo supera su
+presupuesto, para usarlo como comprobación en CI o antes de desplegar workers.
+
+Uso:
+    python import_budget.py
+    python import_budget.py --repeats 5 --slack 1.5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Segundos máximos de `import <módulo>` en un intérprete nuevo
+IMPORT_BUDGETS = {
+    'scoring': 0.35,
+    'model_bundle': 0.35,
+    'clustering_system': 0.35,
+    'clustering_ensemble': 0.35,
+    'extract_features': 0.35,
+    'cluster_plots': 0.35,
+    'scoring_service': 0.35,
+    'streaming_anomaly': 0.35,
+    'sharded_scoring': 0.35,
+}
+
+# Dependencias que ninguno de esos módulos debe cargar al importarse
+HEAVY_MODULES = ('pandas', 'sqlalchemy', 'sklearn', 'scipy', 'matplotlib', 'seaborn', 'pyarrow')
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module, repeats=3, cwd=None):
+    """
+    Tiempo mínimo de importación de un módulo en intérpretes nuevos
+
+    Returns:
+        Diccionario con elapsed_s (mínimo de repeats) y loaded (pesados cargados)
+    """
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    code = _PROBE.format(module=module, heavy=HEAVY_MODULES)
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', code], cwd=cwd, capture_output=True,
+                                text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {'elapsed_s': min(run['elapsed'] for run in runs), 'loaded': runs[0]['loaded']}
+
+
+def check_import_budgets(budgets=None, repeats=3, slack=1.0):
+    """
+    Mide cada módulo frente a su presupuesto
+
+    Args:
+        budgets: {módulo: segundos} (default: IMPORT_BUDGETS)
+        slack: Multiplicador del presupuesto (máquinas lentas o CI compartido)
+
+    Returns:
+        Lista de resultados con module, elapsed_s, budget_s, loaded y ok
+    """
+    results = []
+    for module, budget in (budgets or IMPORT_BUDGETS).items():
+        measured = measure_import(module, repeats=repeats)
+        limit = budget * slack
+        results.append({
+            'module': module,
+            'elapsed_s': round(measured['elapsed_s'], 4),
+            'budget_s': round(limit, 4),
+            'loaded': measured['loaded'],
+            'ok': measured['elapsed_s'] <= limit and not measured['loaded'],
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Comprueba el presupuesto de tiempo de importación")
+    parser.add_argument('--repeats', type=int, default=3, help="Intérpretes por módulo (se toma el mínimo)")
+    parser.add_argument('--slack', type=float, default=1.0, help="Multiplicador de los presupuestos")
+    args = parser.parse_args()
+
+    results = check_import_budgets(repeats=args.repeats, slack=args.slack)
+    print("\n=== PRESUPUESTO DE IMPORTACIÓN ===")
+    for result in results:
+        status = '✅' if result['ok'] else '❌'
+        loaded = f"  carga: {', '.join(result['loaded'])}" if result['loaded'] else ''
+        print(f"  {status} {result['module']:<22} {result['elapsed_s']:>7.3f}s / {result['budget_s']:.3f}s{loaded}")
+    if not all(result['ok'] for result in results):
+        raise SystemExit(1)
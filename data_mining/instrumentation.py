@@ -0,0 +1,402 @@
+"""
+Instrumentación por Etapas: Tiempo, CPU, Memoria y Volumen de Datos
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Registra para cada etapa de FeatureExtractor, MultiLevelClusteringSystem y
+AuraRiskEnsemble:
+
+- Tiempo de pared, CPU del proceso y CPU del hilo que ejecuta la etapa
+- Pico de RSS (muestreado en un hilo) e incremento respecto al inicio
+- Filas de entrada y salida y bytes leídos (resultado de cada consulta SQL,
+  fichero de features o matriz escalada que consume el algoritmo)
+
+Cada registro se añade a un fichero JSON Lines (opcional) y se pasa a un
+renderizador: los mensajes de progreso de consola ("=== K-MEANS CLUSTERING
+===", "Extrayendo métricas sociales...") los muestra ConsoleRenderer a partir
+de esos eventos. profile_hook envuelve cada etapa con un perfilador:
+StackSampler (muestreo de pilas en formato plegado para flamegraph) o
+CProfileHook (cProfile por etapa).
+
+Uso:
+    from instrumentation import Instrumentation, StackSampler
+    inst = Instrumentation(jsonl_path='etapas.jsonl', profile_hook=StackSampler('pilas.folded'))
+    system = MultiLevelClusteringSystem('feature_store', instrumentation=inst)
+
+    python instrumentation.py etapas.jsonl      # resumen por etapa de un fichero
+"""
+
+import argparse
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+# Ruta de la etapa en curso (etapas anidadas: 'extract_all_features/social')
+_current_stage = contextvars.ContextVar('current_stage', default=None)
+
+
+def current_rss_bytes():
+    """RSS actual del proceso (Linux: /proc/self/statm)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # Sin /proc solo se dispone del pico del proceso completo
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if platform.system() == 'Darwin' else peak * 1024
+
+
+class PeakMemorySampler:
+    """Muestrea el RSS en un hilo para obtener el pico de una etapa concreta"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start_rss = 0
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start_rss = self.peak_rss = current_rss_bytes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, current_rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, current_rss_bytes())
+        return False
+
+
+def data_size(obj):
+    """Filas y bytes de un DataFrame, Series o array (de una tupla, su primer elemento)"""
+    if isinstance(obj, tuple):
+        obj = obj[0] if obj else None
+    if obj is None:
+        return None, None
+    if hasattr(obj, 'memory_usage'):
+        usage = obj.memory_usage(index=False)
+        return len(obj), int(usage.sum() if hasattr(usage, 'sum') else usage)
+    if hasattr(obj, 'nbytes'):
+        return (len(obj) if getattr(obj, 'ndim', 0) else 1), int(obj.nbytes)
+    return None, None
+
+
+def format_bytes(n_bytes):
+    """Tamaño legible (KB por debajo de 1 MB)"""
+    if n_bytes < 1024**2:
+        return f"{n_bytes / 1024:.1f} KB"
+    return f"{n_bytes / 1024**2:.1f} MB"
+
+
+class StageHandle:
+    """Datos que la etapa completa mientras se ejecuta (filas, bytes, campos extra)"""
+
+    def __init__(self, rows_in=None, bytes_read=None):
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.bytes_read = bytes_read
+        self.fields = {}
+
+    def set(self, **fields):
+        for key, value in fields.items():
+            if key in ('rows_in', 'rows_out', 'bytes_read'):
+                setattr(self, key, value)
+            else:
+                self.fields[key] = value
+
+
+class ConsoleRenderer:
+    """Muestra el mensaje de inicio de cada etapa y, al terminar, sus métricas"""
+
+    def __init__(self, metrics=True):
+        self.metrics = metrics
+
+    def start(self, stage, message):
+        if message:
+            print(message)
+
+    def end(self, record):
+        if not self.metrics:
+            return
+        line = f"  ⏱ {record['stage']}: {record['wall_s']:.2f}s | CPU {record['cpu_s']:.2f}s"
+        if record['peak_rss_mb'] is not None:
+            line += f" | pico RSS {record['peak_rss_mb']:.1f} MB (+{record['rss_delta_mb']:.1f})"
+        if record['rows_in'] is not None or record['rows_out'] is not None:
+            line += f" | filas {record['rows_in'] if record['rows_in'] is not None else '-'}"
+            line += f" -> {record['rows_out'] if record['rows_out'] is not None else '-'}"
+        if record['bytes_read']:
+            line += f" | leídos {format_bytes(record['bytes_read'])}"
+        if record['status'] != 'ok':
+            line += f" | {record['status']}"
+        print(line)
+
+
+class Instrumentation:
+    """Registro de métricas por etapa con salida JSON Lines, renderizador y perfilador"""
+
+    def __init__(self, jsonl_path=None, renderer='console', profile_hook=None, sample_memory=True,
+                 sample_interval=0.01, run_id=None):
+        """
+        Args:
+            jsonl_path: Fichero al que se añade un registro JSON por etapa (None = solo en memoria)
+            renderer: 'console' (ConsoleRenderer), un objeto con start/end o None (silencio)
+            profile_hook: Callable(etapa) -> context manager que envuelve cada etapa
+            sample_memory: Muestrear el RSS en un hilo (pico por etapa)
+            run_id: Identificador de la ejecución (default: aleatorio)
+        """
+        self.jsonl_path = jsonl_path
+        self.renderer = ConsoleRenderer() if renderer == 'console' else renderer
+        self.profile_hook = profile_hook
+        self.sample_memory = sample_memory
+        self.sample_interval = sample_interval
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.records = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name, message=None, component=None, rows_in=None, bytes_read=None, quiet=False):
+        """
+        Mide una etapa; el bloque recibe un StageHandle para indicar filas y bytes
+
+        Args:
+            message: Mensaje de progreso que muestra el renderizador al empezar
+            quiet: Registrar sin pasar la etapa al renderizador
+        """
+        parent = _current_stage.get()
+        path = name if parent is None else f"{parent}/{name}"
+        token = _current_stage.set(path)
+        handle = StageHandle(rows_in, bytes_read)
+        if self.renderer is not None and not quiet:
+            self.renderer.start(path, message)
+
+        started_at = datetime.now().isoformat(timespec='milliseconds')
+        memory = PeakMemorySampler(self.sample_interval) if self.sample_memory else None
+        hook = self.profile_hook(path) if self.profile_hook else contextlib.nullcontext()
+        status = 'ok'
+        wall = cpu = thread_cpu = 0.0
+        try:
+            with memory or contextlib.nullcontext(), hook:
+                wall_start, cpu_start, thread_start = time.perf_counter(), time.process_time(), time.thread_time()
+                try:
+                    yield handle
+                finally:
+                    wall = time.perf_counter() - wall_start
+                    cpu = time.process_time() - cpu_start
+                    thread_cpu = time.thread_time() - thread_start
+        except BaseException as exc:
+            status = f"error: {type(exc).__name__}"
+            raise
+        finally:
+            _current_stage.reset(token)
+            self._emit({
+                'run_id': self.run_id,
+                'timestamp': started_at,
+                'component': component,
+                'stage': path,
+                'wall_s': round(wall, 4),
+                'cpu_s': round(cpu, 4),
+                'thread_cpu_s': round(thread_cpu, 4),
+                'peak_rss_mb': round(memory.peak_rss / 1024**2, 1) if memory else None,
+                'rss_delta_mb': round((memory.peak_rss - memory.start_rss) / 1024**2, 1) if memory else None,
+                'rows_in': handle.rows_in,
+                'rows_out': handle.rows_out,
+                'bytes_read': handle.bytes_read,
+                'status': status,
+                **handle.fields,
+            }, quiet)
+
+    def record(self, name, wall_s, cpu_s, component=None, rows_in=None, rows_out=None, quiet=False, **fields):
+        """
+        Registra una etapa medida fuera de este proceso (p. ej. en un trabajador)
+        como hija de la etapa en curso
+        """
+        parent = _current_stage.get()
+        self._emit({
+            'run_id': self.run_id,
+            'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+            'component': component,
+            'stage': name if parent is None else f"{parent}/{name}",
+            'wall_s': round(wall_s, 4),
+            'cpu_s': round(cpu_s, 4),
+            'thread_cpu_s': None,
+            'peak_rss_mb': None,
+            'rss_delta_mb': None,
+            'rows_in': rows_in,
+            'rows_out': rows_out,
+            'bytes_read': None,
+            'status': 'ok',
+            **fields,
+        }, quiet)
+
+    def _emit(self, record, quiet):
+        with self._lock:
+            self.records.append(record)
+            if self.jsonl_path:
+                with open(self.jsonl_path, 'a') as f:
+                    f.write(json.dumps(record, default=str, ensure_ascii=False) + '\n')
+        if self.renderer is not None and not quiet:
+            self.renderer.end(record)
+
+    def summary(self):
+        """Registros de esta ejecución agregados por etapa"""
+        return summarize(self.records)
+
+
+def instrumented(name, message=None, inputs=None):
+    """
+    Decorador de métodos: ejecuta el método como etapa de self.instrumentation
+
+    Args:
+        message: Mensaje de progreso; admite campos de los argumentos del
+            método, p. ej. "Ejecutando K-Means con k={n_clusters}..."
+        inputs: Función(self) -> DataFrame/array que consume la etapa (filas
+            de entrada y bytes leídos)
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            instrumentation = getattr(self, 'instrumentation', None)
+            if instrumentation is None:
+                return method(self, *args, **kwargs)
+            text = message
+            if message and '{' in message:
+                bound = signature.bind(self, *args, **kwargs)
+                bound.apply_defaults()
+                text = message.format(**bound.arguments)
+            rows_in, bytes_read = data_size(inputs(self)) if inputs else (None, None)
+            with instrumentation.stage(name, message=text, component=type(self).__name__,
+                                       rows_in=rows_in, bytes_read=bytes_read) as stage:
+                result = method(self, *args, **kwargs)
+                stage.rows_out = data_size(result)[0]
+            return result
+        return wrapper
+    return decorator
+
+
+class StackSampler:
+    """
+    Perfilador por muestreo para profile_hook: cada interval segundos toma la
+    pila del hilo de la etapa y acumula pilas plegadas ('etapa;módulo:función;...
+    n') en path, el formato de entrada de flamegraph.pl y speedscope
+    """
+
+    def __init__(self, path='pilas.folded', interval=0.005):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def __call__(self, stage):
+        thread_id = threading.get_ident()
+        counts = Counter()
+        stop = threading.Event()
+
+        def sample():
+            while not stop.wait(self.interval):
+                frame = sys._current_frames().get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                counts[';'.join([stage.replace('/', ';')] + stack[::-1])] += 1
+
+        thread = threading.Thread(target=sample, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+            with self._lock, open(self.path, 'a') as f:
+                for stack, count in counts.items():
+                    f.write(f"{stack} {count}\n")
+
+
+class CProfileHook:
+    """
+    cProfile por etapa para profile_hook (un .prof por etapa en output_dir).
+    Solo perfila las etapas de primer nivel: cProfile no admite perfiles anidados
+    """
+
+    def __init__(self, output_dir='perfiles'):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+    @contextlib.contextmanager
+    def __call__(self, stage):
+        if '/' in stage:
+            yield
+            return
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(os.path.join(self.output_dir, f"{stage}.prof"))
+
+
+def summarize(records):
+    """Agrega registros por (componente, etapa): ejecuciones, tiempos, pico de RSS, filas y bytes"""
+    summary = {}
+    for record in records:
+        key = (record.get('component'), record['stage'])
+        entry = summary.setdefault(key, {'component': key[0], 'stage': key[1], 'runs': 0, 'wall_s': 0.0,
+                                         'cpu_s': 0.0, 'peak_rss_mb': None, 'rows_out': 0, 'bytes_read': 0})
+        entry['runs'] += 1
+        entry['wall_s'] += record['wall_s']
+        entry['cpu_s'] += record['cpu_s']
+        if record.get('peak_rss_mb') is not None:
+            entry['peak_rss_mb'] = max(entry['peak_rss_mb'] or 0, record['peak_rss_mb'])
+        entry['rows_out'] += record.get('rows_out') or 0
+        entry['bytes_read'] += record.get('bytes_read') or 0
+    return list(summary.values())
+
+
+def render_summary(records):
+    """Tabla por etapa con tiempo, CPU, pico de RSS, filas y MB leídos"""
+    entries = summarize(records)
+    labels = [f"{entry['component']}.{entry['stage']}" if entry['component'] else entry['stage'] for entry in entries]
+    width = max([len('Etapa')] + [len(label) for label in labels])
+    print(f"\n{'Etapa':<{width}} {'Ejec.':>5} {'Pared (s)':>10} {'CPU (s)':>9} {'Pico RSS':>10} "
+          f"{'Filas':>10} {'Leídos (MB)':>12}")
+    for label, entry in zip(labels, entries):
+        peak = f"{entry['peak_rss_mb']:.1f}" if entry['peak_rss_mb'] is not None else '-'
+        print(f"{label:<{width}} {entry['runs']:>5} {entry['wall_s']:>10.3f} {entry['cpu_s']:>9.3f} {peak:>10} "
+              f"{entry['rows_out']:>10} {entry['bytes_read'] / 1024**2:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumen por etapa de un fichero de instrumentación")
+    parser.add_argument('path', help="Fichero JSON Lines de Instrumentation")
+    parser.add_argument('--run-id', default=None, help="Solo esta ejecución (default: la última)")
+    args = parser.parse_args()
+
+    with open(args.path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    run_id = args.run_id or (records[-1]['run_id'] if records else None)
+    records = [record for record in records if record['run_id'] == run_id]
+    print(f"Ejecución {run_id}: {len(records)} etapas")
+    render_summary(records)
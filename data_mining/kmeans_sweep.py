@@ -0,0 +1,173 @@
+"""
+Barrido de K para K-Means en Paralelo y con Caché
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Ajusta los K candidatos del método del codo en procesos paralelos (uno por K,
+cada uno con un solo hilo de BLAS/OpenMP para no sobresuscribir los núcleos),
+con K-Means mini-batch para entradas grandes. Inercias, silhouettes (sobre una
+muestra con semilla) y modelos se guardan en disco con una clave que combina
+la huella de la matriz de features y los parámetros del ajuste, de modo que
+repetir el análisis o el gráfico del codo no vuelve a entrenar nada y el K
+elegido reutiliza el modelo del barrido.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from threadpoolctl import threadpool_limits
+
+
+def data_fingerprint(X):
+    """Huella de una matriz: forma, tipo y SHA-256 de su contenido"""
+    X = np.ascontiguousarray(X)
+    digest = hashlib.sha256(X.view(np.uint8)).hexdigest()
+    return f"{X.shape[0]}x{X.shape[1] if X.ndim > 1 else 1}-{X.dtype}-{digest[:32]}"
+
+
+def _fit_candidate(X, k, params, silhouette_sample):
+    """Ajusta un K (se ejecuta en un proceso del pool)"""
+    with threadpool_limits(limits=1):
+        start = time.perf_counter()
+        if params['algorithm'] == 'minibatch':
+            model = MiniBatchKMeans(n_clusters=k, n_init=params['n_init'], batch_size=params['batch_size'],
+                                    random_state=params['random_state'])
+        else:
+            model = KMeans(n_clusters=k, n_init=params['n_init'], random_state=params['random_state'])
+        model.fit(X)
+        fit_time = time.perf_counter() - start
+
+        silhouette = None
+        if len(np.unique(model.labels_)) > 1:
+            silhouette = float(silhouette_score(
+                X, model.labels_, sample_size=min(silhouette_sample, len(X)),
+                random_state=params['random_state'],
+            ))
+    return model, {'k': k, 'inertia': float(model.inertia_), 'silhouette': silhouette, 'fit_time_s': fit_time}
+
+
+class KMeansSweep:
+    """Ajusta, cachea y reutiliza modelos K-Means para varios K"""
+
+    def __init__(self, n_init=10, random_state=42, algorithm='auto', mini_batch_threshold=200_000,
+                 batch_size=4096, n_jobs=None, silhouette_sample=5000, cache_dir='.kmeans_cache'):
+        """
+        Args:
+            n_init: Inicializaciones por K (igual que KMeans)
+            random_state: Semilla de los ajustes y de la muestra de silhouette
+            algorithm: 'full' (KMeans), 'minibatch' (MiniBatchKMeans) o 'auto'
+                (mini-batch por encima de mini_batch_threshold usuarios)
+            batch_size: Tamaño de lote de MiniBatchKMeans
+            n_jobs: Procesos en paralelo (default: uno por K, hasta el nº de CPUs)
+            silhouette_sample: Usuarios muestreados para el silhouette de cada K
+            cache_dir: Directorio de la caché (None = sin caché en disco)
+        """
+        self.n_init = n_init
+        self.random_state = random_state
+        self.algorithm = algorithm
+        self.mini_batch_threshold = mini_batch_threshold
+        self.batch_size = batch_size
+        self.n_jobs = n_jobs
+        self.silhouette_sample = silhouette_sample
+        self.cache_dir = cache_dir
+        self.models = {}
+        self.results = None
+        self.stats = {'fitted': 0, 'cached': 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _params(self, n_samples):
+        algorithm = self.algorithm
+        if algorithm == 'auto':
+            algorithm = 'minibatch' if n_samples > self.mini_batch_threshold else 'full'
+        params = {'algorithm': algorithm, 'n_init': self.n_init, 'random_state': self.random_state,
+                  'silhouette_sample': self.silhouette_sample}
+        if algorithm == 'minibatch':
+            params['batch_size'] = self.batch_size
+        return params
+
+    def _cache_key(self, fingerprint, k, params):
+        payload = json.dumps({'data': fingerprint, 'k': k, **params}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def _load(self, key):
+        if not self.cache_dir:
+            return None
+        path = os.path.join(self.cache_dir, f"{key}.joblib")
+        try:
+            return joblib.load(path)
+        except (FileNotFoundError, EOFError):
+            return None
+
+    def _store(self, key, model, metrics):
+        if not self.cache_dir:
+            return
+        path = os.path.join(self.cache_dir, f"{key}.joblib")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump((model, metrics), tmp_path)
+        os.replace(tmp_path, path)
+
+    def run(self, X, k_values=range(2, 11)):
+        """
+        Ajusta (o recupera de la caché) cada K
+
+        Returns:
+            DataFrame con k, inercia, silhouette, tiempo de ajuste y si venía de caché
+        """
+        X = np.asarray(X)
+        params = self._params(len(X))
+        fingerprint = data_fingerprint(X)
+        k_values = sorted(set(int(k) for k in k_values))
+
+        rows = {}
+        pending = []
+        for k in k_values:
+            if k in self.models and self.models[k][0] == fingerprint:
+                rows[k] = {**self.models[k][2], 'from_cache': True}
+                continue
+            key = self._cache_key(fingerprint, k, params)
+            cached = self._load(key)
+            if cached is not None:
+                model, metrics = cached
+                self.models[k] = (fingerprint, model, metrics)
+                rows[k] = {**metrics, 'from_cache': True}
+                self.stats['cached'] += 1
+            else:
+                pending.append((k, key))
+
+        if pending:
+            n_jobs = self.n_jobs or min(len(pending), os.cpu_count() or 1)
+            fitted = Parallel(n_jobs=n_jobs)(
+                delayed(_fit_candidate)(X, k, params, self.silhouette_sample) for k, _ in pending
+            )
+            for (k, key), (model, metrics) in zip(pending, fitted):
+                self._store(key, model, metrics)
+                self.models[k] = (fingerprint, model, metrics)
+                rows[k] = {**metrics, 'from_cache': False}
+                self.stats['fitted'] += 1
+
+        self.results = pd.DataFrame([rows[k] for k in k_values])
+        return self.results
+
+    def model(self, X, k):
+        """Modelo ajustado para k: el del barrido si existe, si no se ajusta (y cachea) solo ese K"""
+        fingerprint = data_fingerprint(np.asarray(X))
+        if k not in self.models or self.models[k][0] != fingerprint:
+            self.run(X, [k])
+        return self.models[k][1]
+
+    def report(self):
+        """Muestra el resultado del barrido y cuántos K se ajustaron o vinieron de caché"""
+        if self.results is None:
+            return
+        print("\n--- Barrido de K ---")
+        print(self.results.to_string(index=False))
+        print(f"  Ajustados: {self.stats['fitted']} | Desde caché: {self.stats['cached']}")
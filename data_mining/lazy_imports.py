@@ -0,0 +1,55 @@
+"""
+Importación Diferida de Dependencias Pesadas
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+pandas, SQLAlchemy, scikit-learn o matplotlib tardan cientos de milisegundos
+en importarse. lazy_module devuelve un módulo sustituto que importa el real
+en el primer acceso a un atributo, de modo que importar un módulo de
+data_mining no paga dependencias que el proceso quizá nunca use.
+
+Uso:
+    from lazy_imports import lazy_module
+    pd = lazy_module('pandas')
+    df = pd.DataFrame()   # pandas se importa aquí
+"""
+
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Sustituto de un módulo que lo importa en el primer acceso"""
+
+    def __init__(self, name, before_load=None):
+        super().__init__(name)
+        self.__dict__['_lazy_target'] = name
+        self.__dict__['_lazy_before_load'] = before_load
+
+    def _load(self):
+        if self._lazy_before_load is not None:
+            self._lazy_before_load()
+        module = importlib.import_module(self._lazy_target)
+        # Tras la carga los atributos se leen directamente, sin __getattr__
+        self.__dict__.update(module.__dict__)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_module(name, before_load=None):
+    """
+    Módulo real si ya está importado; si no, un sustituto diferido
+
+    Args:
+        before_load: Función que se ejecuta justo antes de la importación real
+            (p. ej. elegir el backend de matplotlib antes de cargar pyplot)
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name, before_load)
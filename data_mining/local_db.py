@@ -0,0 +1,374 @@
+"""
+Base de Datos Local para Pruebas de la Extracción de Features
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Crea una base SQLite con el esquema de las tablas que lee FeatureExtractor
+(compatible con MySQL) y registra las funciones MySQL que usan las consultas
+(NOW, DATEDIFF, YEAR, HOUR, CHAR_LENGTH, JSON_LENGTH, DATE_SUB, STDDEV), de
+modo que las mismas consultas se pueden ejecutar y comparar sin acceso a las
+bases de datos de Aura.
+"""
+
+import json
+import math
+import random
+import re
+import sqlite3
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+# Esquema mínimo de las tablas de social-service y messaging-service que
+# usa la extracción. Los índices replican los de las migraciones.
+SCHEMA_DDL = [
+    """CREATE TABLE user_profiles (
+        user_id BIGINT PRIMARY KEY,
+        bio TEXT,
+        birth_date DATETIME,
+        gender VARCHAR(20),
+        is_verified BOOLEAN NOT NULL DEFAULT 0,
+        is_active BOOLEAN NOT NULL DEFAULT 1,
+        followers_count INTEGER NOT NULL DEFAULT 0,
+        following_count INTEGER NOT NULL DEFAULT 0,
+        posts_count INTEGER NOT NULL DEFAULT 0,
+        last_active_at DATETIME,
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL
+    )""",
+    "CREATE INDEX idx_user_profiles_is_active ON user_profiles (is_active)",
+    "CREATE INDEX idx_user_profiles_created_at ON user_profiles (created_at)",
+    """CREATE TABLE friendships (
+        id BIGINT PRIMARY KEY,
+        requester_id BIGINT NOT NULL,
+        addressee_id BIGINT NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        is_active BOOLEAN NOT NULL DEFAULT 1,
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL
+    )""",
+    "CREATE UNIQUE INDEX idx_friendships_pair ON friendships (requester_id, addressee_id)",
+    "CREATE INDEX idx_friendships_requester_id ON friendships (requester_id)",
+    "CREATE INDEX idx_friendships_addressee_id ON friendships (addressee_id)",
+    "CREATE INDEX idx_friendships_status ON friendships (status)",
+    """CREATE TABLE communities (
+        id BIGINT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        members_count INTEGER NOT NULL DEFAULT 0,
+        is_active BOOLEAN NOT NULL DEFAULT 1,
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL
+    )""",
+    "CREATE INDEX idx_communities_is_active ON communities (is_active)",
+    """CREATE TABLE community_members (
+        id BIGINT PRIMARY KEY,
+        community_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        joined_at DATETIME NOT NULL
+    )""",
+    "CREATE UNIQUE INDEX idx_community_members_pair ON community_members (community_id, user_id)",
+    "CREATE INDEX idx_community_members_user_id ON community_members (user_id)",
+    """CREATE TABLE posts (
+        id BIGINT PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        visibility VARCHAR(20) NOT NULL DEFAULT 'public',
+        likes_count INTEGER NOT NULL DEFAULT 0,
+        comments_count INTEGER NOT NULL DEFAULT 0,
+        shares_count INTEGER NOT NULL DEFAULT 0,
+        is_active BOOLEAN NOT NULL DEFAULT 1,
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL
+    )""",
+    "CREATE INDEX idx_posts_user_id ON posts (user_id)",
+    "CREATE INDEX idx_posts_created_at ON posts (created_at)",
+    "CREATE INDEX idx_posts_is_active ON posts (is_active)",
+    "CREATE INDEX idx_posts_user_visibility_active ON posts (user_id, visibility, is_active)",
+    """CREATE TABLE comments (
+        id BIGINT PRIMARY KEY,
+        post_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        likes_count INTEGER NOT NULL DEFAULT 0,
+        is_active BOOLEAN NOT NULL DEFAULT 1,
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL
+    )""",
+    "CREATE INDEX idx_comments_post_id ON comments (post_id)",
+    "CREATE INDEX idx_comments_user_id ON comments (user_id)",
+    "CREATE INDEX idx_comments_is_active ON comments (is_active)",
+    """CREATE TABLE conversations (
+        id BIGINT PRIMARY KEY,
+        participant1_profile_id BIGINT NOT NULL,
+        participant2_profile_id BIGINT NOT NULL,
+        participant1_status VARCHAR(20) NOT NULL DEFAULT 'active',
+        participant2_status VARCHAR(20) NOT NULL DEFAULT 'active',
+        unread_count_1 INTEGER NOT NULL DEFAULT 0,
+        unread_count_2 INTEGER NOT NULL DEFAULT 0,
+        last_message_at DATETIME,
+        created_at DATETIME NOT NULL
+    )""",
+    "CREATE INDEX idx_conversations_participant1 ON conversations (participant1_profile_id)",
+    "CREATE INDEX idx_conversations_participant2 ON conversations (participant2_profile_id)",
+    """CREATE TABLE messages (
+        id BIGINT PRIMARY KEY,
+        conversation_id BIGINT NOT NULL,
+        sender_profile_id BIGINT NOT NULL,
+        content TEXT,
+        is_edited BOOLEAN NOT NULL DEFAULT 0,
+        is_deleted BOOLEAN NOT NULL DEFAULT 0,
+        created_at DATETIME NOT NULL
+    )""",
+    "CREATE INDEX idx_messages_conversation_id ON messages (conversation_id)",
+    """CREATE TABLE user_preferences (
+        id BIGINT PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        preferences JSON,
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL
+    )""",
+    "CREATE UNIQUE INDEX idx_user_preferences_user_id ON user_preferences (user_id)",
+    """CREATE TABLE interests (
+        id BIGINT PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        created_at DATETIME NOT NULL
+    )""",
+    "CREATE INDEX idx_interests_user_id ON interests (user_id)",
+]
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _parse_datetime(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value)[:19])
+
+
+class _StdDev:
+    """STDDEV de MySQL (desviación típica poblacional)"""
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def step(self, value):
+        if value is not None:
+            value = float(value)
+            self.n += 1
+            self.total += value
+            self.total_sq += value * value
+
+    def finalize(self):
+        if self.n == 0:
+            return None
+        mean = self.total / self.n
+        return math.sqrt(max(self.total_sq / self.n - mean * mean, 0.0))
+
+
+def register_mysql_functions(dbapi_conn, now):
+    """Registra en una conexión SQLite las funciones MySQL de las consultas"""
+    now_text = now.strftime(TIMESTAMP_FORMAT)
+    dbapi_conn.create_function('NOW', 0, lambda: now_text)
+    dbapi_conn.create_function(
+        'DATEDIFF', 2,
+        lambda a, b: None if a is None or b is None
+        else (_parse_datetime(a).date() - _parse_datetime(b).date()).days,
+    )
+    dbapi_conn.create_function(
+        'DATE_SUB', 2,
+        lambda a, days: None if a is None
+        else (_parse_datetime(a) - timedelta(days=days)).strftime(TIMESTAMP_FORMAT),
+    )
+    dbapi_conn.create_function('YEAR', 1, lambda a: None if a is None else _parse_datetime(a).year)
+    dbapi_conn.create_function('HOUR', 1, lambda a: None if a is None else _parse_datetime(a).hour)
+    dbapi_conn.create_function('CHAR_LENGTH', 1, lambda a: None if a is None else len(a))
+    dbapi_conn.create_function('JSON_LENGTH', 1, lambda a: None if a is None else len(json.loads(a)))
+    dbapi_conn.create_aggregate('STDDEV', 1, _StdDev)
+
+
+def translate_mysql(statement):
+    """
+    Adapta al dialecto SQLite la sintaxis MySQL que no se puede registrar como función
+
+    - INTERVAL n DAY -> n (DATE_SUB recibe días)
+    - a / b -> a * 1.0 / b (MySQL divide en decimal, SQLite en entero)
+    """
+    statement = re.sub(r'INTERVAL\s+(\d+)\s+DAY', r'\1', statement, flags=re.IGNORECASE)
+    return re.sub(r'\s/\s', ' * 1.0 / ', statement)
+
+
+def create_local_engine(path=None, now=None):
+    """
+    Crea un engine SQLite que acepta las consultas MySQL de FeatureExtractor
+
+    Args:
+        path: Fichero de la base de datos (None = en memoria)
+        now: Instante que devuelve NOW() (default: ahora); fijarlo hace los
+            resultados reproducibles
+
+    Returns:
+        Engine de SQLAlchemy
+    """
+    now = now or datetime.now().replace(microsecond=0)
+    if path is None:
+        # BD en memoria con nombre y caché compartida: cada hilo usa su propia
+        # conexión (modo concurrente) y todas ven los mismos datos
+        database = f"file:aura_local_{uuid.uuid4().hex}?mode=memory&cache=shared"
+        keepalive = sqlite3.connect(database, uri=True, check_same_thread=False)
+        engine = create_engine(
+            'sqlite://',
+            creator=lambda: sqlite3.connect(database, uri=True, check_same_thread=False),
+            poolclass=QueuePool,
+        )
+        # La BD desaparece al cerrarse su última conexión
+        engine.local_db_keepalive = keepalive
+    else:
+        engine = create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False})
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_conn, _):
+        register_mysql_functions(dbapi_conn, now)
+
+    @event.listens_for(engine, 'before_cursor_execute', retval=True)
+    def _on_execute(conn, cursor, statement, parameters, context, executemany):
+        return translate_mysql(statement), parameters
+
+    return engine
+
+
+def create_schema(engine):
+    """Crea las tablas e índices del esquema local"""
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for ddl in SCHEMA_DDL:
+            cursor.execute(ddl)
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def insert_rows(engine, table, rows):
+    """Inserta filas (lista de diccionarios con las mismas claves) en bloque"""
+    if not rows:
+        return
+    columns = list(rows[0])
+    sql = (f"INSERT INTO {table} ({', '.join(columns)}) "
+           f"VALUES ({', '.join('?' for _ in columns)})")
+    raw = engine.raw_connection()
+    try:
+        raw.cursor().executemany(sql, [tuple(row[col] for col in columns) for row in rows])
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def seed_database(engine, n_users=500, seed=42, now=None):
+    """
+    Rellena el esquema local con un conjunto pequeño y reproducible de datos
+
+    Args:
+        engine: Engine creado con create_local_engine (con el esquema ya creado)
+        n_users: Número de perfiles
+        seed: Semilla del generador
+        now: Instante de referencia de los timestamps generados
+    """
+    rng = random.Random(seed)
+    now = now or datetime(2025, 11, 28, 12, 0, 0)
+
+    def ts(max_days=365):
+        return (now - timedelta(seconds=rng.randint(0, max_days * 86400))).strftime(TIMESTAMP_FORMAT)
+
+    users = range(1, n_users + 1)
+    profiles = []
+    for user_id in users:
+        created = ts()
+        profiles.append({
+            'user_id': user_id, 'bio': 'x' * rng.randint(0, 200),
+            'birth_date': f"{rng.randint(1995, 2010)}-0{rng.randint(1, 9)}-15 00:00:00",
+            'gender': rng.choice(['female', 'male', 'other']),
+            'is_verified': int(rng.random() < 0.1), 'is_active': int(rng.random() < 0.95),
+            'followers_count': rng.randint(0, 300), 'following_count': rng.randint(0, 300),
+            'posts_count': rng.randint(0, 50), 'last_active_at': ts(120),
+            'created_at': created, 'updated_at': created,
+        })
+    insert_rows(engine, 'user_profiles', profiles)
+
+    pairs = set()
+    while len(pairs) < n_users * 3:
+        pair = (rng.choice(users), rng.choice(users))
+        if pair[0] != pair[1]:
+            pairs.add(pair)
+    statuses = ['accepted'] * 6 + ['pending'] * 2 + ['rejected', 'blocked']
+    insert_rows(engine, 'friendships', [
+        {'id': i, 'requester_id': a, 'addressee_id': b, 'status': rng.choice(statuses),
+         'is_active': int(rng.random() < 0.95), 'created_at': ts(), 'updated_at': ts(30)}
+        for i, (a, b) in enumerate(sorted(pairs), start=1)
+    ])
+
+    n_communities = max(5, n_users // 50)
+    insert_rows(engine, 'communities', [
+        {'id': i, 'name': f'comunidad_{i}', 'members_count': rng.randint(5, 2000),
+         'is_active': int(rng.random() < 0.9), 'created_at': ts(), 'updated_at': ts(30)}
+        for i in range(1, n_communities + 1)
+    ])
+    members = {(rng.randint(1, n_communities), rng.choice(users)) for _ in range(n_users * 2)}
+    insert_rows(engine, 'community_members', [
+        {'id': i, 'community_id': c, 'user_id': u, 'joined_at': ts()}
+        for i, (c, u) in enumerate(sorted(members), start=1)
+    ])
+
+    n_posts = n_users * 4
+    posts = []
+    for post_id in range(1, n_posts + 1):
+        created = ts()
+        posts.append({
+            'id': post_id, 'user_id': rng.choice(users),
+            'visibility': rng.choice(['public', 'public', 'friends', 'private']),
+            'likes_count': rng.randint(0, 60), 'comments_count': rng.randint(0, 10),
+            'shares_count': rng.randint(0, 5), 'is_active': int(rng.random() < 0.95),
+            'created_at': created, 'updated_at': created,
+        })
+    insert_rows(engine, 'posts', posts)
+
+    insert_rows(engine, 'comments', [
+        {'id': i, 'post_id': rng.randint(1, n_posts), 'user_id': rng.choice(users),
+         'likes_count': rng.randint(0, 10), 'is_active': int(rng.random() < 0.9),
+         'created_at': ts(), 'updated_at': ts()}
+        for i in range(1, n_users * 6 + 1)
+    ])
+
+    n_conversations = n_users * 2
+    insert_rows(engine, 'conversations', [
+        {'id': i, 'participant1_profile_id': rng.choice(users),
+         'participant2_profile_id': rng.choice(users),
+         'participant1_status': rng.choice(['active', 'active', 'archived', 'blocked']),
+         'participant2_status': rng.choice(['active', 'active', 'archived']),
+         'unread_count_1': rng.randint(0, 20), 'unread_count_2': rng.randint(0, 20),
+         'last_message_at': ts(90), 'created_at': ts()}
+        for i in range(1, n_conversations + 1)
+    ])
+    insert_rows(engine, 'messages', [
+        {'id': i, 'conversation_id': rng.randint(1, n_conversations),
+         'sender_profile_id': rng.choice(users), 'content': 'hola ' * rng.randint(1, 40),
+         'is_edited': int(rng.random() < 0.05), 'is_deleted': int(rng.random() < 0.03),
+         'created_at': ts(90)}
+        for i in range(1, n_users * 10 + 1)
+    ])
+
+    insert_rows(engine, 'user_preferences', [
+        {'id': i, 'user_id': user_id,
+         'preferences': json.dumps({f'pref_{k}': True for k in range(rng.randint(0, 6))}),
+         'created_at': ts(), 'updated_at': ts(30)}
+        for i, user_id in enumerate((u for u in users if rng.random() < 0.7), start=1)
+    ])
+    insert_rows(engine, 'interests', [
+        {'id': i, 'user_id': rng.choice(users), 'name': f'interes_{rng.randint(1, 40)}',
+         'created_at': ts()}
+        for i in range(1, n_users * 2 + 1)
+    ])
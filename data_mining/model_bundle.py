@@ -0,0 +1,270 @@
+"""
+Bundle Versionado de Modelos de Riesgo y API score_users
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Guarda los modelos ajustados por MultiLevelClusteringSystem para puntuar
+usuarios nuevos o modificados sin reentrenar:
+
+- Escalado (media y desviación) y columnas de features
+- Centroides de K-Means y nivel de riesgo de cada cluster
+- Puntos núcleo de DBSCAN con su eps: un usuario nuevo es outlier si no tiene
+  ningún punto núcleo a distancia <= eps (misma regla que DBSCAN)
+- GaussianMixture y el índice de su componente de alto riesgo
+- IsolationForest y el rango de su score en el entrenamiento (para el ASI)
+
+Estructura en disco (cada versión es inmutable; LATEST apunta a la vigente):
+    modelos/
+    ├── LATEST
+    └── v20251128-120000-1a2b3c4d/
+        ├── manifest.json
+        ├── arrays.npz
+        ├── gmm.joblib
+        └── isolation_forest.joblib
+
+Uso:
+    from model_bundle import score_users
+    scores = score_users(df_nuevos_usuarios)   # bundle más reciente de 'modelos'
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import warnings
+from datetime import datetime
+
+import numpy as np
+
+from lazy_imports import lazy_module
+from scoring import (
+    DBSCAN_MEMBER_SCORE, DBSCAN_OUTLIER_SCORE, ENSEMBLE_WEIGHTS, KMEANS_LEVEL_SCORES,
+    anomaly_severity, combine_risk_scores, nearest_centroid,
+)
+
+pd = lazy_module('pandas')
+joblib = lazy_module('joblib')
+
+MODELS_ROOT = 'modelos'
+MANIFEST_FILE = 'manifest.json'
+ARRAYS_FILE = 'arrays.npz'
+LATEST_FILE = 'LATEST'
+BUNDLE_FORMAT = 1
+
+
+class ModelBundle:
+    """Modelos ajustados y metadatos de una versión"""
+
+    ARRAY_KEYS = ('scaler_mean', 'scaler_scale', 'kmeans_centers', 'kmeans_levels',
+                  'dbscan_core_samples', 'iso_score_range')
+
+    def __init__(self, feature_columns, arrays, gmm, isolation_forest, params, version=None, metadata=None):
+        """
+        Args:
+            feature_columns: Columnas en el orden del escalado
+            arrays: Diccionario con ARRAY_KEYS
+            gmm: GaussianMixture ajustado sobre las features escaladas
+            isolation_forest: IsolationForest ajustado sobre las features escaladas
+            params: dbscan_eps, dbscan_min_samples, gmm_high_risk_cluster,
+                ensemble_weights, ...
+            version: Identificador (se asigna al guardar)
+            metadata: Datos informativos del manifiesto (fecha, usuarios, versiones)
+        """
+        self.feature_columns = list(feature_columns)
+        self.arrays = arrays
+        self.gmm = gmm
+        self.isolation_forest = isolation_forest
+        self.params = params
+        self.version = version
+        self.metadata = metadata or {}
+        self._core_tree = None
+
+    @classmethod
+    def from_system(cls, system, contamination=0.05, random_state=42):
+        """
+        Construye el bundle desde un MultiLevelClusteringSystem que ya ejecutó
+        kmeans_clustering, dbscan_clustering y gmm_clustering. El IsolationForest
+        se ajusta aquí sobre las mismas features escaladas.
+        """
+        from sklearn.ensemble import IsolationForest
+
+        if system.kmeans_model is None or system.gmm_model is None or system.dbscan_params is None:
+            raise ValueError("Ejecuta kmeans_clustering, dbscan_clustering y gmm_clustering antes de guardar")
+
+        isolation_forest = IsolationForest(contamination=contamination, random_state=random_state)
+        isolation_forest.fit(system.X_scaled)
+        iso_scores = isolation_forest.decision_function(system.X_scaled)
+
+        eps, min_samples = system.dbscan_params['eps'], system.dbscan_params['min_samples']
+        core = system.dbscan_params['core_sample_indices']
+        centers = system.kmeans_model.cluster_centers_
+        arrays = {
+            'scaler_mean': system.scaler.mean_,
+            'scaler_scale': system.scaler.scale_,
+            'kmeans_centers': centers,
+            'kmeans_levels': np.asarray([system.kmeans_risk_mapping[k] for k in range(len(centers))], dtype=str),
+            'dbscan_core_samples': system.X_scaled[core],
+            'iso_score_range': np.array([iso_scores.min(), iso_scores.max()]),
+        }
+        params = {
+            'dbscan_eps': float(eps),
+            'dbscan_min_samples': int(min_samples),
+            'gmm_high_risk_cluster': int(system.gmm_high_risk_cluster),
+            'isolation_contamination': contamination,
+            'ensemble_weights': dict(system.ensemble_weights or ENSEMBLE_WEIGHTS),
+        }
+        return cls(system.scaler.feature_names_in_, arrays, system.gmm_model, isolation_forest, params,
+                   metadata={'training_users': int(len(system.X_scaled))})
+
+    def save(self, root=MODELS_ROOT, make_latest=True):
+        """
+        Escribe una versión nueva e inmutable y, si make_latest, la marca como vigente
+
+        Returns:
+            Identificador de la versión
+        """
+        import sklearn
+
+        digest = hashlib.sha256()
+        for key in self.ARRAY_KEYS:
+            digest.update(np.ascontiguousarray(self.arrays[key]).tobytes())
+        digest.update(json.dumps(self.params, sort_keys=True).encode('utf-8'))
+        created_at = datetime.now()
+        self.version = f"v{created_at:%Y%m%d-%H%M%S}-{digest.hexdigest()[:8]}"
+        self.metadata.update({
+            'created_at': created_at.isoformat(timespec='seconds'),
+            'sklearn_version': sklearn.__version__,
+            'numpy_version': np.__version__,
+        })
+
+        os.makedirs(root, exist_ok=True)
+        tmp_dir = os.path.join(root, f'.tmp-{self.version}')
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        np.savez(os.path.join(tmp_dir, ARRAYS_FILE), **self.arrays)
+        joblib.dump(self.gmm, os.path.join(tmp_dir, 'gmm.joblib'))
+        joblib.dump(self.isolation_forest, os.path.join(tmp_dir, 'isolation_forest.joblib'))
+        manifest = {
+            'format': BUNDLE_FORMAT,
+            'version': self.version,
+            'feature_columns': self.feature_columns,
+            'params': self.params,
+            **self.metadata,
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_dir, os.path.join(root, self.version))
+
+        if make_latest:
+            tmp_latest = os.path.join(root, f'.{LATEST_FILE}.tmp')
+            with open(tmp_latest, 'w') as f:
+                f.write(self.version + '\n')
+            os.replace(tmp_latest, os.path.join(root, LATEST_FILE))
+        return self.version
+
+    @staticmethod
+    def latest_version(root=MODELS_ROOT):
+        """Versión marcada como vigente en root"""
+        with open(os.path.join(root, LATEST_FILE)) as f:
+            return f.read().strip()
+
+    @classmethod
+    def load(cls, root=MODELS_ROOT, version=None):
+        """Carga una versión (default: la vigente)"""
+        version = version or cls.latest_version(root)
+        path = os.path.join(root, version)
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != BUNDLE_FORMAT:
+            raise ValueError(f"Formato de bundle no soportado: {manifest.get('format')}")
+
+        import sklearn
+        if manifest.get('sklearn_version') != sklearn.__version__:
+            warnings.warn(f"Bundle {version} creado con scikit-learn {manifest.get('sklearn_version')}; "
+                          f"instalado {sklearn.__version__}")
+
+        with np.load(os.path.join(path, ARRAYS_FILE), allow_pickle=False) as data:
+            arrays = {key: data[key] for key in data.files}
+        metadata = {key: value for key, value in manifest.items()
+                    if key not in ('format', 'version', 'feature_columns', 'params')}
+        return cls(
+            manifest['feature_columns'], arrays,
+            joblib.load(os.path.join(path, 'gmm.joblib')),
+            joblib.load(os.path.join(path, 'isolation_forest.joblib')),
+            manifest['params'], version=version, metadata=metadata,
+        )
+
+    def _dbscan_outliers(self, X):
+        """Outlier si ningún punto núcleo del entrenamiento está a distancia <= eps"""
+        core = self.arrays['dbscan_core_samples']
+        if len(core) == 0:
+            return np.ones(len(X), dtype=bool)
+        if self._core_tree is None:
+            from sklearn.neighbors import KDTree
+            self._core_tree = KDTree(core)
+        distances, _ = self._core_tree.query(X, k=1)
+        return distances[:, 0] > self.params['dbscan_eps']
+
+    def score_users(self, df):
+        """
+        Puntúa usuarios con los modelos del bundle, sin reentrenar
+
+        Args:
+            df: DataFrame con user_id y las columnas de feature_columns (las que
+                falten se tratan como 0, igual que en el entrenamiento)
+
+        Returns:
+            DataFrame con los scores de cada método, risk_score_final,
+            nivel_riesgo_final, anomaly_severity_index y model_version
+        """
+        raw = df.reindex(columns=self.feature_columns).fillna(0).to_numpy(dtype=np.float64)
+        X = (raw - self.arrays['scaler_mean']) / self.arrays['scaler_scale']
+
+        clusters = nearest_centroid(X, self.arrays['kmeans_centers'])
+        levels = self.arrays['kmeans_levels'][clusters]
+        outliers = self._dbscan_outliers(X)
+        prob_high_risk = self.gmm.predict_proba(X)[:, self.params['gmm_high_risk_cluster']]
+        iso_scores = self.isolation_forest.decision_function(X)
+
+        result = pd.DataFrame({
+            'user_id': df['user_id'].to_numpy() if 'user_id' in df.columns else np.arange(len(df)),
+            'cluster_kmeans': clusters,
+            'nivel_riesgo_kmeans': levels,
+            'risk_score_kmeans': np.array([KMEANS_LEVEL_SCORES[level] for level in levels]),
+            'dbscan_outlier': outliers,
+            'risk_score_dbscan': np.where(outliers, DBSCAN_OUTLIER_SCORE, DBSCAN_MEMBER_SCORE),
+            'prob_alto_riesgo': prob_high_risk,
+            'risk_score_gmm': prob_high_risk,
+        })
+        if 'indice_aislamiento_social' in self.feature_columns:
+            result['risk_score_aislamiento'] = raw[:, self.feature_columns.index('indice_aislamiento_social')] / 10
+        else:
+            result['risk_score_aislamiento'] = 0.0
+        combine_risk_scores(result, self.params.get('ensemble_weights'))
+
+        score_min, score_max = self.arrays['iso_score_range']
+        result['iso_score'] = iso_scores
+        result['anomaly_severity_index'] = anomaly_severity(iso_scores, score_min, score_max, outliers)
+        result['model_version'] = self.version
+        return result
+
+
+# Último bundle cargado de cada directorio: {root: (versión, bundle)}
+_loaded_bundles = {}
+
+
+def score_users(df, root=MODELS_ROOT, version=None):
+    """
+    Puntúa usuarios con el bundle indicado (default: el vigente en root)
+
+    Se mantiene en memoria solo el último bundle cargado de cada root; si
+    LATEST cambia, la siguiente llamada carga la nueva versión y libera la
+    anterior.
+    """
+    version = version or ModelBundle.latest_version(root)
+    root = os.path.abspath(root)
+    if _loaded_bundles.get(root, (None,))[0] != version:
+        # Soltar la versión anterior antes de cargar, para no tener dos en memoria
+        _loaded_bundles.pop(root, None)
+        _loaded_bundles[root] = (version, ModelBundle.load(root, version))
+    return _loaded_bundles[root][1].score_users(df)
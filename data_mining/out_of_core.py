@@ -0,0 +1,483 @@
+"""
+Entrenamiento Fuera de Memoria (Out-of-Core) del Pipeline de Clustering
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Entrena sin cargar la matriz de features completa: el almacén se recorre por
+bloques (row groups de Parquet o trozos de CSV) y en memoria solo hay un
+bloque y una muestra reservorio de tamaño fijo.
+
+- Pasada 1: StandardScaler.partial_fit y muestra reservorio uniforme.
+- Pasadas siguientes: MiniBatchKMeans.partial_fit por lotes (centros
+  iniciales de K-Means sobre la muestra) y EM por bloques de un GMM de
+  covarianza diagonal: cada pasada acumula los estadísticos suficientes de
+  todos los bloques y hace una actualización M, igual que el EM en memoria.
+- Refinado de K-Means: iteraciones de Lloyd completas (una pasada por
+  iteración: suma y cuenta por centro) desde los centros del mini-batch y
+  desde cada uno de los n_init arranques de K-Means sobre la muestra, todas en
+  las mismas pasadas; se queda la de menor inercia sobre todos los datos, como
+  n_init en memoria. El mini-batch solo deja los centros cerca de un óptimo
+  local y el mejor arranque de la muestra no siempre es el mejor en los datos.
+- IsolationForest sobre la muestra reservorio (cada árbol usa 256 usuarios).
+- Pasada final: etiquetas y scores por usuario escritos en Parquet por bloques.
+
+check_tolerances compara el resultado con el entrenamiento en memoria sobre
+los mismos datos frente a las tolerancias de TOLERANCES. El GMM se compara con
+el EM en memoria desde los mismos parámetros iniciales: la verosimilitud de
+los GMM de estos datos varía mucho entre semillas (varios óptimos locales), de
+modo que lo que se garantiza es que el EM por bloques es el mismo algoritmo.
+Si la muestra reservorio contiene todos los usuarios, el GMM y el Isolation
+Forest se ajustan sobre los mismos datos que en memoria y sus comprobaciones
+no miden nada: se marcan como omitidas (use --reservoir menor que los datos).
+
+Uso:
+    python out_of_core.py --data feature_store --output etiquetas_out_of_core.parquet
+    python out_of_core.py --data feature_store --chunk-size 50000 --check
+"""
+
+import argparse
+import itertools
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy.special import logsumexp
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.ensemble import IsolationForest
+from sklearn.mixture import GaussianMixture
+from sklearn.preprocessing import StandardScaler
+
+from clustering_system import MultiLevelClusteringSystem
+from feature_store import iter_features
+from scoring import KMEANS_LEVEL_SCORES
+
+FEATURE_COLS = MultiLevelClusteringSystem.FEATURE_COLS
+RISK_FEATURE = 'indice_aislamiento_social'
+
+# Tolerancias frente al entrenamiento en memoria (check_tolerances). El ARI solo
+# es estable si los datos tienen estructura de clusters: en datos uniformes hay
+# particiones de inercia casi igual y muy distintas entre sí
+TOLERANCES = {
+    'scaler_max_rel_error': 1e-6,       # media y desviación, relativas a la desviación
+    'kmeans_ari_min': 0.8,              # acuerdo de etiquetas K-Means (ARI)
+    'kmeans_inertia_ratio_max': 1.05,   # inercia fuera de memoria / en memoria
+    'gmm_em_loglik_gap_max': 1e-6,      # log-verosimilitud media frente al EM en memoria
+    'iso_spearman_min': 0.9,            # correlación de rangos del score de aislamiento
+}
+
+
+class Reservoir:
+    """Muestra uniforme de tamaño fijo de un flujo de filas (algoritmo R por bloques)"""
+
+    def __init__(self, size, n_features, random_state=42):
+        self.size = size
+        self.sample = np.empty((size, n_features))
+        self.seen = 0
+        self.rng = np.random.default_rng(random_state)
+
+    def update(self, X):
+        fill = min(max(self.size - self.seen, 0), len(X))
+        self.sample[self.seen:self.seen + fill] = X[:fill]
+        rest = X[fill:]
+        if len(rest):
+            positions = self.seen + fill + np.arange(len(rest))
+            slots = self.rng.integers(0, positions + 1)
+            rows = np.flatnonzero(slots < self.size)
+            slots = slots[rows]
+            # Si varias filas caen en la misma posición gana la última, como en el algoritmo secuencial
+            _, last = np.unique(slots[::-1], return_index=True)
+            last = len(slots) - 1 - last
+            self.sample[slots[last]] = rest[rows[last]]
+        self.seen += len(X)
+
+    def values(self):
+        return self.sample[:min(self.seen, self.size)]
+
+
+class StreamingDiagonalGMM:
+    """GMM de covarianza diagonal ajustado por EM con una pasada por bloques por iteración"""
+
+    def __init__(self, n_components=4, max_iter=100, tol=1e-3, reg_covar=1e-6, n_init=3, random_state=42):
+        self.n_components = n_components
+        self.n_init = n_init
+        self.max_iter = max_iter
+        self.tol = tol
+        self.reg_covar = reg_covar
+        self.random_state = random_state
+        self.n_iter = 0
+        self.converged = False
+        self.lower_bound = -np.inf
+
+    def initialize(self, sample):
+        """Parámetros iniciales: mejor de n_init GMM diagonales ajustados sobre la muestra"""
+        gmm = GaussianMixture(n_components=self.n_components, covariance_type='diag', reg_covar=self.reg_covar,
+                              n_init=self.n_init, random_state=self.random_state).fit(sample)
+        self.weights, self.means, self.covariances = gmm.weights_, gmm.means_, gmm.covariances_
+        self.initial_params = {'weights': self.weights, 'means': self.means, 'covariances': self.covariances}
+
+    def log_resp(self, X):
+        """Log-responsabilidades y log-verosimilitud de cada fila"""
+        precisions = 1 / self.covariances
+        log_prob = -0.5 * (
+            X.shape[1] * np.log(2 * np.pi) + np.log(self.covariances).sum(axis=1)
+            + (X**2) @ precisions.T - 2 * X @ (self.means * precisions).T
+            + (self.means**2 * precisions).sum(axis=1)
+        )
+        weighted = log_prob + np.log(self.weights)
+        log_norm = logsumexp(weighted, axis=1)
+        return weighted - log_norm[:, None], log_norm
+
+    def begin_pass(self, n_features):
+        self._stats = {
+            'n': 0, 'log_likelihood': 0.0, 'nk': np.zeros(self.n_components),
+            'sum_x': np.zeros((self.n_components, n_features)),
+            'sum_x2': np.zeros((self.n_components, n_features)),
+        }
+
+    def accumulate(self, X):
+        """Paso E de un bloque: suma sus estadísticos suficientes"""
+        log_resp, log_norm = self.log_resp(X)
+        resp = np.exp(log_resp)
+        self._stats['n'] += len(X)
+        self._stats['log_likelihood'] += log_norm.sum()
+        self._stats['nk'] += resp.sum(axis=0)
+        self._stats['sum_x'] += resp.T @ X
+        self._stats['sum_x2'] += resp.T @ X**2
+
+    def end_pass(self):
+        """Paso M con los estadísticos de toda la pasada y comprobación de convergencia"""
+        stats = self._stats
+        nk = stats['nk'] + 10 * np.finfo(np.float64).eps
+        self.weights = nk / nk.sum()
+        self.means = stats['sum_x'] / nk[:, None]
+        self.covariances = stats['sum_x2'] / nk[:, None] - self.means**2 + self.reg_covar
+        lower_bound = stats['log_likelihood'] / stats['n']
+        self.n_iter += 1
+        self.converged = abs(lower_bound - self.lower_bound) < self.tol
+        self.lower_bound = lower_bound
+
+    @property
+    def done(self):
+        return self.converged or self.n_iter >= self.max_iter
+
+    def to_sklearn(self):
+        """GaussianMixture equivalente (predict_proba, score, bic...)"""
+        gmm = GaussianMixture(n_components=self.n_components, covariance_type='diag',
+                              reg_covar=self.reg_covar, random_state=self.random_state)
+        gmm.weights_ = self.weights
+        gmm.means_ = self.means
+        gmm.covariances_ = self.covariances
+        gmm.precisions_ = 1 / self.covariances
+        gmm.precisions_cholesky_ = 1 / np.sqrt(self.covariances)
+        gmm.converged_ = self.converged
+        gmm.n_iter_ = self.n_iter
+        gmm.lower_bound_ = self.lower_bound
+        gmm.n_features_in_ = self.means.shape[1]
+        return gmm
+
+
+class StreamingLloyd:
+    """Iteraciones de Lloyd de K-Means con una pasada por bloques por iteración"""
+
+    def __init__(self, centers, max_iter=100, tol=1e-4):
+        self.centers = np.array(centers, dtype=np.float64)
+        self.max_iter = max_iter
+        self.tol = tol
+        self.n_iter = 0
+        self.converged = False
+        self.inertia = np.inf
+
+    def begin_pass(self):
+        self._sums = np.zeros_like(self.centers)
+        self._counts = np.zeros(len(self.centers))
+        self._inertia = 0.0
+
+    def accumulate(self, X):
+        """Asigna las filas del bloque al centro más cercano y suma sus coordenadas"""
+        distances = (X**2).sum(axis=1)[:, None] - 2 * X @ self.centers.T + (self.centers**2).sum(axis=1)
+        labels = distances.argmin(axis=1)
+        np.add.at(self._sums, labels, X)
+        self._counts += np.bincount(labels, minlength=len(self.centers))
+        self._inertia += np.maximum(distances[np.arange(len(X)), labels], 0).sum()
+
+    def end_pass(self):
+        """Mueve cada centro a la media de sus filas (los centros vacíos no se mueven)"""
+        filled = self._counts > 0
+        centers = self.centers.copy()
+        centers[filled] = self._sums[filled] / self._counts[filled, None]
+        shift = ((centers - self.centers)**2).sum()
+        self.centers = centers
+        self.inertia = self._inertia
+        self.n_iter += 1
+        self.converged = shift <= self.tol
+
+    @property
+    def done(self):
+        return self.converged or self.n_iter >= self.max_iter
+
+
+class OutOfCoreTrainer:
+    """Escalado, K-Means, GMM e Isolation Forest entrenados por bloques"""
+
+    def __init__(self, chunk_size=100_000, batch_size=4096, kmeans_epochs=3, kmeans_n_init=10,
+                 kmeans_refine_iter=100, kmeans_tol=1e-4, n_components=4, gmm_max_iter=100, gmm_tol=1e-3, reservoir_size=100_000,
+                 contamination=0.05, random_state=42):
+        """
+        Args:
+            chunk_size: Filas leídas del almacén por bloque
+            batch_size: Filas por llamada a MiniBatchKMeans.partial_fit
+            kmeans_epochs: Pasadas de mini-batch K-Means sobre todos los datos (>= 1)
+            kmeans_n_init: Arranques de K-Means sobre la muestra que se refinan con todos los datos
+            kmeans_refine_iter: Iteraciones de Lloyd máximas tras el mini-batch (0 = centros del mini-batch)
+            kmeans_tol: Desplazamiento total de los centros (escalados) por debajo del cual se para
+            n_components: Componentes del GMM diagonal
+            gmm_max_iter: Pasadas EM máximas (una pasada = una iteración)
+            reservoir_size: Usuarios de la muestra para inicializar y para Isolation Forest
+        """
+        if kmeans_epochs < 1:
+            raise ValueError("kmeans_epochs debe ser al menos 1")
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.kmeans_epochs = kmeans_epochs
+        self.kmeans_n_init = kmeans_n_init
+        self.kmeans_refine_iter = kmeans_refine_iter
+        self.kmeans_tol = kmeans_tol
+        self.n_components = n_components
+        self.gmm_max_iter = gmm_max_iter
+        self.gmm_tol = gmm_tol
+        self.reservoir_size = reservoir_size
+        self.contamination = contamination
+        self.random_state = random_state
+        self.feature_cols = None
+        self.scaler = StandardScaler()
+        self.kmeans = None
+        self.gmm = None
+        self.gmm_initial_params = None
+        self.isolation_forest = None
+        self.kmeans_risk_mapping = None
+        self.gmm_high_risk_cluster = None
+        self.stats = {'rows': 0, 'chunks': 0, 'passes': 0, 'fit_time_s': 0.0, 'peak_chunk_rows': 0}
+
+    def _chunks(self, path):
+        for chunk in iter_features(path, columns=['user_id'] + FEATURE_COLS, batch_size=self.chunk_size):
+            if self.feature_cols is None:
+                self.feature_cols = [col for col in FEATURE_COLS if col in chunk.columns]
+            yield chunk, chunk[self.feature_cols].fillna(0).to_numpy(dtype=np.float64)
+
+    def fit(self, path):
+        """Entrena todos los modelos recorriendo el almacén por bloques"""
+        start = time.perf_counter()
+        n_clusters = len(KMEANS_LEVEL_SCORES)
+
+        # Pasada 1: escalado incremental y muestra reservorio
+        reservoir = None
+        for _, X in self._chunks(path):
+            if reservoir is None:
+                reservoir = Reservoir(self.reservoir_size, X.shape[1], self.random_state)
+            self.scaler.partial_fit(X)
+            reservoir.update(X)
+            self.stats['rows'] += len(X)
+            self.stats['chunks'] += 1
+            self.stats['peak_chunk_rows'] = max(self.stats['peak_chunk_rows'], len(X))
+        self.stats['passes'] = 1
+        sample = self.scaler.transform(reservoir.values())
+
+        rng = np.random.RandomState(self.random_state)
+        starts = [KMeans(n_clusters=n_clusters, n_init=1, random_state=rng.randint(2**31)).fit(sample)
+                  for _ in range(self.kmeans_n_init)]
+        centers = min(starts, key=lambda model: model.inertia_).cluster_centers_
+        self.kmeans = MiniBatchKMeans(n_clusters=n_clusters, init=centers, n_init=1, batch_size=self.batch_size,
+                                      random_state=self.random_state)
+        gmm = StreamingDiagonalGMM(self.n_components, max_iter=self.gmm_max_iter, tol=self.gmm_tol,
+                                   random_state=self.random_state)
+        gmm.initialize(sample)
+        refiners = None
+
+        # Pasadas siguientes: épocas de mini-batch K-Means, después iteraciones de Lloyd, e iteraciones EM
+        for epoch in itertools.count():
+            train_kmeans = epoch < self.kmeans_epochs
+            if not train_kmeans and refiners is None:
+                refiners = [StreamingLloyd(start, max_iter=self.kmeans_refine_iter, tol=self.kmeans_tol)
+                            for start in [self.kmeans.cluster_centers_] + [m.cluster_centers_ for m in starts]]
+            refining = [lloyd for lloyd in refiners or [] if not lloyd.done]
+            train_gmm = not gmm.done
+            if not (train_kmeans or refining or train_gmm):
+                break
+            for lloyd in refining:
+                lloyd.begin_pass()
+            if train_gmm:
+                gmm.begin_pass(len(self.feature_cols))
+            for _, X in self._chunks(path):
+                X = self.scaler.transform(X)
+                if train_kmeans:
+                    for offset in range(0, len(X), self.batch_size):
+                        self.kmeans.partial_fit(X[offset:offset + self.batch_size])
+                for lloyd in refining:
+                    lloyd.accumulate(X)
+                if train_gmm:
+                    gmm.accumulate(X)
+            for lloyd in refining:
+                lloyd.end_pass()
+            if train_gmm:
+                gmm.end_pass()
+            self.stats['passes'] += 1
+        lloyd = min(refiners, key=lambda refiner: refiner.inertia)
+        self.kmeans.cluster_centers_ = lloyd.centers
+        self.gmm = gmm.to_sklearn()
+        self.gmm_initial_params = gmm.initial_params
+
+        self.isolation_forest = IsolationForest(contamination=self.contamination, random_state=self.random_state)
+        self.isolation_forest.fit(sample)
+
+        # Niveles de riesgo por el índice de aislamiento medio de cada centro/componente
+        risk_index = self.feature_cols.index(RISK_FEATURE)
+        center_risk = self.scaler.inverse_transform(self.kmeans.cluster_centers_)[:, risk_index]
+        self.kmeans_risk_mapping = {int(cluster): level
+                                    for cluster, level in zip(np.argsort(center_risk), KMEANS_LEVEL_SCORES)}
+        self.gmm_high_risk_cluster = int(np.argmax(self.scaler.inverse_transform(self.gmm.means_)[:, risk_index]))
+        self.stats['kmeans_lloyd_iterations'] = lloyd.n_iter
+        self.stats['kmeans_converged'] = lloyd.converged
+        self.stats['gmm_iterations'] = gmm.n_iter
+        self.stats['gmm_converged'] = gmm.converged
+        self.stats['reservoir_rows'] = len(sample)
+        self.stats['fit_time_s'] = time.perf_counter() - start
+        return self
+
+    def iter_labels(self, path):
+        """Etiquetas y scores por usuario, un DataFrame por bloque"""
+        levels = np.array([self.kmeans_risk_mapping[k] for k in range(self.kmeans.n_clusters)])
+        for chunk, X in self._chunks(path):
+            X = self.scaler.transform(X)
+            clusters = self.kmeans.predict(X)
+            probs = self.gmm.predict_proba(X)
+            yield pd.DataFrame({
+                'user_id': chunk['user_id'].to_numpy(),
+                'cluster_kmeans': clusters,
+                'nivel_riesgo_kmeans': levels[clusters],
+                'cluster_gmm': probs.argmax(axis=1),
+                'prob_alto_riesgo': probs[:, self.gmm_high_risk_cluster],
+                'iso_score': self.isolation_forest.decision_function(X),
+            })
+
+    def write_labels(self, path, output='etiquetas_out_of_core.parquet'):
+        """Escribe las etiquetas en Parquet bloque a bloque (sin reunir el resultado en memoria)"""
+        tmp_path = output + '.tmp'
+        writer = None
+        rows = 0
+        try:
+            for labels in self.iter_labels(path):
+                table = pa.Table.from_pandas(labels, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema, compression='zstd')
+                writer.write_table(table)
+                rows += len(labels)
+        finally:
+            if writer is not None:
+                writer.close()
+        os.replace(tmp_path, output)
+        print(f"Etiquetas de {rows} usuarios guardadas en: {output}")
+        return output
+
+    def report(self):
+        stats = self.stats
+        print("\n=== ENTRENAMIENTO FUERA DE MEMORIA ===")
+        print(f"  Usuarios: {stats['rows']} en {stats['chunks']} bloques (máx. {stats['peak_chunk_rows']} filas)")
+        print(f"  Pasadas sobre los datos: {stats['passes']} | Muestra reservorio: {stats['reservoir_rows']}")
+        print(f"  K-Means: {self.kmeans_epochs} épocas de mini-batch + {stats['kmeans_lloyd_iterations']} "
+              f"iteraciones de Lloyd del mejor de {self.kmeans_n_init + 1} arranques "
+              f"({'convergido' if stats['kmeans_converged'] else 'sin converger'})")
+        print(f"  GMM diagonal: {stats['gmm_iterations']} iteraciones EM "
+              f"({'convergido' if stats['gmm_converged'] else 'sin converger'}), "
+              f"componente de alto riesgo {self.gmm_high_risk_cluster}")
+        print(f"  Tiempo de entrenamiento: {stats['fit_time_s']:.2f}s")
+
+
+def check_tolerances(path, trainer, tolerances=None):
+    """
+    Compara un OutOfCoreTrainer ya entrenado con el entrenamiento en memoria
+    (mismos algoritmos y semilla sobre la matriz completa)
+
+    Returns:
+        Lista de resultados con metric, value, tolerance y ok (None si se omite
+        porque la muestra reservorio contiene todos los usuarios)
+    """
+    from scipy.stats import spearmanr
+    from sklearn.metrics import adjusted_rand_score
+
+    from feature_store import is_feature_store_path, load_features
+
+    tolerances = {**TOLERANCES, **(tolerances or {})}
+    columns = ['user_id'] + trainer.feature_cols
+    df = load_features(path, columns=columns) if is_feature_store_path(path) else pd.read_csv(path, usecols=columns)
+    X = df[trainer.feature_cols].fillna(0).to_numpy(dtype=np.float64)
+    scaler = StandardScaler().fit(X)
+    X_memory = scaler.transform(X)
+    X_stream = trainer.scaler.transform(X)
+    labels = pd.concat(trainer.iter_labels(path), ignore_index=True)
+
+    kmeans = KMeans(n_clusters=trainer.kmeans.n_clusters, n_init=10, random_state=trainer.random_state).fit(X_memory)
+
+    scaler_error = max(np.max(np.abs(trainer.scaler.mean_ - scaler.mean_) / scaler.scale_),
+                       np.max(np.abs(trainer.scaler.scale_ - scaler.scale_) / scaler.scale_))
+    measured = {
+        'scaler_max_rel_error': scaler_error,
+        'kmeans_ari_min': adjusted_rand_score(kmeans.labels_, labels['cluster_kmeans']),
+        'kmeans_inertia_ratio_max': -trainer.kmeans.score(X_stream) / kmeans.inertia_,
+    }
+    # Con la muestra completa el GMM se inicializa y el Isolation Forest se ajusta sobre los mismos datos
+    sample_is_complete = trainer.stats['reservoir_rows'] >= len(X)
+    if sample_is_complete:
+        measured.update({'gmm_em_loglik_gap_max': None, 'iso_spearman_min': None})
+    else:
+        init = trainer.gmm_initial_params
+        gmm = GaussianMixture(n_components=trainer.n_components, covariance_type='diag', tol=trainer.gmm_tol,
+                              max_iter=trainer.gmm_max_iter, weights_init=init['weights'], means_init=init['means'],
+                              precisions_init=1 / init['covariances']).fit(X_stream)
+        iso = IsolationForest(contamination=trainer.contamination, random_state=trainer.random_state).fit(X_memory)
+        measured.update({
+            'gmm_em_loglik_gap_max': abs(gmm.score(X_stream) - trainer.gmm.score(X_stream)),
+            'iso_spearman_min': spearmanr(iso.decision_function(X_memory), labels['iso_score']).statistic,
+        })
+
+    results = []
+    for metric, value in measured.items():
+        limit = tolerances[metric]
+        if value is None:
+            results.append({'metric': metric, 'value': None, 'tolerance': limit, 'ok': None})
+            continue
+        ok = value >= limit if metric.endswith('_min') else value <= limit
+        results.append({'metric': metric, 'value': float(value), 'tolerance': limit, 'ok': bool(ok)})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entrenamiento por bloques sin cargar todas las features")
+    parser.add_argument('--data', default='feature_store', help="Almacén/Parquet/CSV de features")
+    parser.add_argument('--output', default='etiquetas_out_of_core.parquet', help="Parquet de etiquetas")
+    parser.add_argument('--chunk-size', type=int, default=100_000, help="Filas por bloque")
+    parser.add_argument('--reservoir', type=int, default=100_000, help="Tamaño de la muestra reservorio")
+    parser.add_argument('--kmeans-epochs', type=int, default=3, help="Pasadas de mini-batch K-Means")
+    parser.add_argument('--check', action='store_true',
+                        help="Comparar con el entrenamiento en memoria (requiere que los datos quepan)")
+    args = parser.parse_args()
+
+    trainer = OutOfCoreTrainer(chunk_size=args.chunk_size, reservoir_size=args.reservoir,
+                               kmeans_epochs=args.kmeans_epochs).fit(args.data)
+    trainer.report()
+    trainer.write_labels(args.data, args.output)
+
+    if args.check:
+        results = check_tolerances(args.data, trainer)
+        print("\n=== TOLERANCIAS FRENTE AL ENTRENAMIENTO EN MEMORIA ===")
+        for result in results:
+            if result['ok'] is None:
+                print(f"  ⚠️ {result['metric']:<26} omitida: la muestra reservorio contiene todos los usuarios "
+                      f"(use --reservoir menor)")
+                continue
+            status = '✅' if result['ok'] else '❌'
+            print(f"  {status} {result['metric']:<26} {result['value']:>10.6f} (tolerancia {result['tolerance']})")
+        if any(result['ok'] is False for result in results):
+            raise SystemExit(1)
@@ -0,0 +1,128 @@
+"""
+Memoización por Etapas del Pipeline de Clustering
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Guarda en disco el resultado de cada etapa del pipeline con una clave que
+combina:
+
+- Entradas: la huella de los datos de features (primera etapa) o las claves
+  de las etapas de las que depende, de modo que invalidar una etapa invalida
+  todas las posteriores.
+- Parámetros de la etapa.
+- Versión del código: hash del código fuente del método de la etapa y de los
+  módulos que usa.
+
+Al reejecutar solo se recalculan las etapas invalidadas (p. ej. cambiar los
+pesos del ensemble solo recalcula 'ensemble'); aciertos, fallos y tiempo
+ahorrado se registran por etapa.
+
+Uso:
+    clustering_system.run_pipeline({'ensemble': {'weights': {...}}})
+"""
+
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import time
+
+from lazy_imports import lazy_module
+
+joblib = lazy_module('joblib')
+pd = lazy_module('pandas')
+
+
+def frame_fingerprint(df):
+    """Huella de un DataFrame: columnas, tipos y hash de todas sus filas"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return f"{len(df)}x{df.shape[1]}-{digest.hexdigest()[:32]}"
+
+
+def code_fingerprint(*objects):
+    """
+    Hash del código fuente de funciones/clases y de módulos (por nombre, sin
+    importarlos)
+    """
+    digest = hashlib.sha256()
+    for obj in objects:
+        if isinstance(obj, str):
+            with open(importlib.util.find_spec(obj).origin, 'rb') as f:
+                digest.update(f.read())
+        else:
+            digest.update(inspect.getsource(obj).encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+
+class StageCache:
+    """Resultados de etapas en disco por (entradas, parámetros, código)"""
+
+    def __init__(self, cache_dir='.pipeline_cache'):
+        """
+        Args:
+            cache_dir: Directorio de la caché (None = calcular siempre, solo registra tiempos)
+        """
+        self.cache_dir = cache_dir
+        self.log = []
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, stage, inputs, params, code):
+        payload = json.dumps({'stage': stage, 'inputs': list(inputs), 'params': params, 'code': code},
+                             sort_keys=True, default=repr)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def _path(self, stage, key):
+        return os.path.join(self.cache_dir, f"{stage}-{key}.joblib")
+
+    def run(self, stage, compute, inputs, params, code):
+        """
+        Devuelve el resultado cacheado de la etapa o lo calcula con compute()
+
+        Returns:
+            Tupla (clave de la etapa, resultado)
+        """
+        key = self.key(stage, inputs, params, code)
+        if self.cache_dir:
+            try:
+                outputs, compute_time = joblib.load(self._path(stage, key))
+            except (FileNotFoundError, EOFError):
+                pass
+            else:
+                self.log.append({'stage': stage, 'hit': True, 'time_s': compute_time})
+                print(f"[caché] {stage}: acierto ({key[:8]}), ahorrados {compute_time:.2f}s")
+                return key, outputs
+
+        start = time.perf_counter()
+        outputs = compute()
+        compute_time = time.perf_counter() - start
+        if self.cache_dir:
+            path = self._path(stage, key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            joblib.dump((outputs, compute_time), tmp_path)
+            os.replace(tmp_path, path)
+        self.log.append({'stage': stage, 'hit': False, 'time_s': compute_time})
+        print(f"[caché] {stage}: fallo ({key[:8]}), calculada en {compute_time:.2f}s")
+        return key, outputs
+
+    @property
+    def stats(self):
+        hits = [entry for entry in self.log if entry['hit']]
+        return {
+            'hits': len(hits),
+            'misses': len(self.log) - len(hits),
+            'saved_s': round(sum(entry['time_s'] for entry in hits), 3),
+            'computed_s': round(sum(entry['time_s'] for entry in self.log if not entry['hit']), 3),
+            'recomputed': [entry['stage'] for entry in self.log if not entry['hit']],
+        }
+
+    def report(self):
+        stats = self.stats
+        print("\n--- Caché de Etapas del Pipeline ---")
+        print(f"  Aciertos: {stats['hits']} | Fallos: {stats['misses']} | "
+              f"Tiempo ahorrado: {stats['saved_s']:.2f}s | Calculado: {stats['computed_s']:.2f}s")
+        if stats['recomputed']:
+            print(f"  Recalculadas: {', '.join(stats['recomputed'])}")
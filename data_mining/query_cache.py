@@ -0,0 +1,141 @@
+"""
+Caché Local de Resultados de Consultas para FeatureExtractor
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Guarda en disco el resultado de cada consulta de extracción en formato Arrow
+IPC (Feather sin compresión), de modo que un acierto se carga mapeado en
+memoria sin parsear texto. La clave combina el SQL, sus parámetros y una
+huella barata de la versión de cada tabla consultada (número de filas,
+timestamp máximo y, en tablas sin updated_at, la suma de sus columnas
+mutables), así que cualquier escritura en esas tablas invalida la entrada.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pyarrow.feather as feather
+
+
+class QueryCache:
+    """Caché en disco de DataFrames con expiración (TTL) y límite de tamaño"""
+
+    def __init__(self, cache_dir='.query_cache', ttl_seconds=24 * 3600, max_bytes=2 * 1024**3):
+        """
+        Args:
+            cache_dir: Directorio de la caché
+            ttl_seconds: Antigüedad máxima de una entrada
+            max_bytes: Tamaño máximo total; se expulsan primero las entradas menos usadas
+        """
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(query, params, table_versions):
+        """Clave de una consulta: SQL + parámetros + versión de las tablas que lee"""
+        payload = json.dumps(
+            {'sql': ' '.join(query.split()), 'params': params, 'tables': table_versions},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.arrow")
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get(self, key):
+        """Devuelve el DataFrame cacheado o None si no existe o ha expirado"""
+        path = self._path(key)
+        try:
+            written_at = os.path.getmtime(path)
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+
+        now = time.time()
+        if now - written_at > self.ttl_seconds:
+            self._remove(path)
+            self._count('expired')
+            self._count('misses')
+            return None
+
+        df = feather.read_table(path, memory_map=True).to_pandas()
+        # El atime marca el último uso (para la expulsión LRU); el mtime conserva la escritura
+        os.utime(path, (now, written_at))
+        self._count('hits')
+        return df
+
+    def put(self, key, df):
+        """Guarda un DataFrame y aplica el límite de tamaño"""
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        feather.write_feather(df.reset_index(drop=True), tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Elimina entradas expiradas y, si se supera max_bytes, las menos usadas"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.arrow'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.ttl_seconds:
+                self._remove(path)
+                self._count('expired')
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            self._count('evictions')
+            total -= size
+
+    def clear(self):
+        """Vacía la caché"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.arrow'):
+                self._remove(os.path.join(self.cache_dir, name))
+
+    def size_bytes(self):
+        return sum(
+            os.path.getsize(os.path.join(self.cache_dir, name))
+            for name in os.listdir(self.cache_dir)
+            if name.endswith('.arrow')
+        )
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def report(self):
+        """Muestra aciertos, fallos y ocupación de la caché"""
+        lookups = self.stats['hits'] + self.stats['misses']
+        hit_rate = self.stats['hits'] / lookups if lookups else 0.0
+        print("\n--- Caché de Consultas ---")
+        print(f"  Aciertos: {self.stats['hits']} | Fallos: {self.stats['misses']} "
+              f"| Tasa de acierto: {hit_rate:.1%}")
+        print(f"  Expiradas: {self.stats['expired']} | Expulsadas por tamaño: {self.stats['evictions']}")
+        print(f"  Ocupación: {self.size_bytes() / 1024**2:.1f} MB de {self.max_bytes / 1024**2:.0f} MB")
@@ -0,0 +1,117 @@
+"""
+Scoring Ligero de Riesgo (sin reentrenar)
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Cálculo compartido del score de riesgo combinado y del Índice de Severidad de
+Anomalía (ASI): lo usan el entrenamiento (clustering_system,
+clustering_ensemble) y el scoring de nuevos usuarios con un bundle de modelos
+versionado (model_bundle.py), de modo que ambos producen los mismos valores.
+Al importarse solo carga numpy; pandas y scikit-learn se cargan al puntuar.
+
+Uso:
+    python scoring.py --models modelos --data feature_store --output scores_riesgo.csv
+    python scoring.py --models modelos --version v20251128-120000-1a2b3c4d --data nuevos.csv
+"""
+
+import argparse
+
+import numpy as np
+
+from lazy_imports import lazy_module
+
+pd = lazy_module('pandas')
+
+# Score de cada nivel de K-Means
+KMEANS_LEVEL_SCORES = {
+    'Bajo Riesgo': 0.1,
+    'Riesgo Moderado': 0.4,
+    'Alto Riesgo': 0.7,
+    'Riesgo Crítico': 1.0,
+}
+
+# Score de DBSCAN: outliers = alto riesgo
+DBSCAN_OUTLIER_SCORE = 1.0
+DBSCAN_MEMBER_SCORE = 0.3
+
+# Media ponderada del score final
+ENSEMBLE_WEIGHTS = {
+    'risk_score_kmeans': 0.3,
+    'risk_score_dbscan': 0.2,
+    'risk_score_gmm': 0.3,
+    'risk_score_aislamiento': 0.2,
+}
+RISK_BINS = [0, 0.3, 0.5, 0.7, 1.0]
+RISK_LABELS = ['Bajo', 'Moderado', 'Alto', 'Crítico']
+
+
+def nearest_centroid(X, centers):
+    """Índice del centroide más cercano de cada fila (distancia euclídea)"""
+    distances = (X**2).sum(axis=1)[:, None] - 2 * X @ centers.T + (centers**2).sum(axis=1)[None, :]
+    return distances.argmin(axis=1)
+
+
+def combine_risk_scores(df, weights=None):
+    """
+    Añade risk_score_final y nivel_riesgo_final a partir de los scores de cada
+    método (columnas de weights; default: ENSEMBLE_WEIGHTS)
+    """
+    weights = weights or ENSEMBLE_WEIGHTS
+    df['risk_score_final'] = sum(df[column] * weight for column, weight in weights.items())
+    df['nivel_riesgo_final'] = pd.cut(df['risk_score_final'], bins=RISK_BINS, labels=RISK_LABELS)
+    return df
+
+
+def anomaly_severity(iso_scores, score_min, score_max, dbscan_outlier):
+    """
+    Índice de Severidad de Anomalía (0-100)
+
+    Normalización min-max invertida del score de Isolation Forest (más negativo
+    = más severo) con el rango del entrenamiento; +20% si DBSCAN también lo
+    marca como outlier.
+    """
+    iso_scores = np.asarray(iso_scores, dtype=np.float64)
+    if score_max == score_min:
+        severity = np.zeros(len(iso_scores))
+    else:
+        severity = 100 * (1 - (iso_scores - score_min) / (score_max - score_min))
+    severity = np.where(np.asarray(dbscan_outlier, dtype=bool), severity * 1.2, severity)
+    return np.clip(severity, 0, 100)
+
+
+def quantile_severity(scores, sketch, dbscan_outlier=None):
+    """
+    Índice de Severidad de Anomalía (0-100) por percentil
+
+    Fracción de la distribución de referencia (QuantileSketch) con un score
+    mayor (más normal); no depende del resto del lote. +20% si DBSCAN también
+    lo marca como outlier.
+    """
+    severity = 100 * (1 - sketch.rank(np.asarray(scores, dtype=np.float64)))
+    if dbscan_outlier is not None:
+        severity = np.where(np.asarray(dbscan_outlier, dtype=bool), severity * 1.2, severity)
+    return np.clip(severity, 0, 100)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scoring de riesgo con un bundle de modelos (sin reentrenar)")
+    parser.add_argument('--models', default='modelos', help="Directorio de bundles de modelos")
+    parser.add_argument('--version', default=None, help="Versión del bundle (default: la más reciente)")
+    parser.add_argument('--data', default='feature_store', help="Almacén/CSV de features")
+    parser.add_argument('--output', default='scores_riesgo.csv', help="CSV de salida")
+    args = parser.parse_args()
+
+    from model_bundle import ModelBundle
+
+    bundle = ModelBundle.load(args.models, args.version)
+    columns = ['user_id'] + bundle.feature_columns
+    if args.data.endswith('.csv'):
+        features = pd.read_csv(args.data, usecols=lambda col: col in columns)
+    else:
+        from feature_store import load_features
+        features = load_features(args.data, columns=columns)
+
+    scores = bundle.score_users(features)
+    scores.to_csv(args.output, index=False)
+    print(f"✅ {len(scores)} usuarios puntuados con el bundle {bundle.version} en: {args.output}")
+    print(scores['nivel_riesgo_final'].value_counts().sort_index())
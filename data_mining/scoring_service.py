@@ -0,0 +1,403 @@
+"""
+Servicio HTTP Local de Scoring de Riesgo con Micro-Batching
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Sirve los scores del bundle de modelos vigente (model_bundle.py) sobre un
+almacén de features local:
+
+- Micro-batching: las peticiones concurrentes se agrupan (hasta max_batch_size
+  usuarios o max_wait_ms de espera) en una sola llamada vectorizada a
+  ModelBundle.score_users, ejecutada fuera del event loop.
+- Caché LRU de los scores recientes por usuario; se vacía al cargar una
+  versión nueva del bundle (se comprueba LATEST antes de cada lote).
+- Latencias p50/p95/p99 por endpoint y estadísticas de lotes en /metrics.
+
+Endpoints:
+    GET  /health
+    GET  /users/{user_id}/risk
+    POST /risk/batch          {"user_ids": [1, 2, 3]}
+    GET  /metrics
+    POST /admin/reload
+
+Requiere las dependencias opcionales fastapi, uvicorn y pydantic.
+
+Uso:
+    python scoring_service.py --data feature_store --models modelos --port 8000
+    python scoring_service.py --demo --demo-users 10000   # base sintética + entrenamiento local
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from lazy_imports import lazy_module
+from model_bundle import LATEST_FILE, MODELS_ROOT, ModelBundle
+
+pd = lazy_module('pandas')
+
+# Columnas que devuelve el servicio por usuario
+RESPONSE_COLUMNS = [
+    'risk_score_final', 'nivel_riesgo_final', 'anomaly_severity_index', 'risk_score_kmeans',
+    'risk_score_dbscan', 'risk_score_gmm', 'risk_score_aislamiento', 'nivel_riesgo_kmeans',
+    'dbscan_outlier',
+]
+
+
+class FeatureSource:
+    """Features por user_id desde un almacén Parquet o un CSV, indexadas en memoria"""
+
+    def __init__(self, path, columns=None):
+        self.path = path
+        if str(path).endswith('.csv'):
+            df = pd.read_csv(path, usecols=(lambda col: col in columns) if columns else None)
+        else:
+            from feature_store import load_features
+            df = load_features(path, columns=columns)
+        self.df = df.set_index('user_id', drop=False)
+
+    def get(self, user_ids):
+        """Filas de los usuarios existentes (en el orden pedido) y lista de los que faltan"""
+        user_ids = list(user_ids)
+        present = self.df.index.intersection(user_ids)
+        missing = [user_id for user_id in user_ids if user_id not in present]
+        return self.df.loc[[user_id for user_id in user_ids if user_id in present]], missing
+
+
+class ScoreCache:
+    """LRU de scores por usuario ligada a una versión del modelo"""
+
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self.version = None
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self, version):
+        """Vacía la caché al cambiar de versión de modelo"""
+        self.version = version
+        self._entries.clear()
+
+    def get_many(self, user_ids):
+        found = {}
+        for user_id in user_ids:
+            if user_id in self._entries:
+                self._entries.move_to_end(user_id)
+                found[user_id] = self._entries[user_id]
+        self.hits += len(found)
+        self.misses += len(user_ids) - len(found)
+        return found
+
+    def put_many(self, scores, version):
+        if version != self.version:
+            return
+        for user_id, score in scores.items():
+            self._entries[user_id] = score
+            self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else None}
+
+
+class LatencyTracker:
+    """Ventana de latencias recientes por endpoint"""
+
+    def __init__(self, window=10_000):
+        self.window = window
+        self._samples = {}
+
+    def record(self, endpoint, seconds):
+        self._samples.setdefault(endpoint, deque(maxlen=self.window)).append(seconds)
+
+    def percentiles(self):
+        report = {}
+        for endpoint, samples in self._samples.items():
+            values = np.fromiter(samples, dtype=np.float64) * 1000
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            report[endpoint] = {'count': len(values), 'p50_ms': round(float(p50), 3),
+                                'p95_ms': round(float(p95), 3), 'p99_ms': round(float(p99), 3),
+                                'max_ms': round(float(values.max()), 3)}
+        return report
+
+
+class MicroBatcher:
+    """Agrupa peticiones concurrentes de scoring en lotes vectorizados"""
+
+    def __init__(self, score_batch, max_batch_size=512, max_wait_ms=5.0):
+        """
+        Args:
+            score_batch: Función síncrona lista de user_ids -> {user_id: score}
+            max_batch_size: Usuarios máximos por lote
+            max_wait_ms: Espera máxima desde la primera petición del lote
+        """
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = None
+        self._worker = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scoring')
+        self.batches = 0
+        self.batched_users = 0
+        self.batched_requests = 0
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, user_ids):
+        """Encola una petición y espera sus scores"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((list(user_ids), future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self._queue.get()]
+            size = len(requests[0][0])
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            user_ids = list(dict.fromkeys(user_id for ids, _ in requests for user_id in ids))
+            try:
+                scores = await loop.run_in_executor(self.executor, self.score_batch, user_ids)
+            except Exception as exc:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            self.batches += 1
+            self.batched_users += len(user_ids)
+            self.batched_requests += len(requests)
+            for ids, future in requests:
+                if not future.done():
+                    future.set_result({user_id: scores.get(user_id) for user_id in ids})
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'requests': self.batched_requests,
+            'users': self.batched_users,
+            'avg_requests_per_batch': round(self.batched_requests / self.batches, 2) if self.batches else None,
+            'avg_users_per_batch': round(self.batched_users / self.batches, 2) if self.batches else None,
+        }
+
+
+class ScoringService:
+    """Scoring con bundle recargable, caché por usuario y micro-batching"""
+
+    def __init__(self, source, models_root=MODELS_ROOT, max_batch_size=512, max_wait_ms=5.0,
+                 cache_size=100_000):
+        self.source = source
+        self.models_root = models_root
+        self.bundle = None
+        self._latest_mtime = None
+        self.cache = ScoreCache(cache_size)
+        self.latency = LatencyTracker()
+        self.batcher = MicroBatcher(self._score_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+        self.reload()
+
+    def latest_changed(self):
+        """True si LATEST se modificó desde la última carga (un stat, sin leer el bundle)"""
+        return os.stat(os.path.join(self.models_root, LATEST_FILE)).st_mtime_ns != self._latest_mtime
+
+    def reload(self, force=False):
+        """Carga la versión marcada en LATEST si cambió (o siempre con force)"""
+        if not force and not self.latest_changed():
+            return False
+        mtime = os.stat(os.path.join(self.models_root, LATEST_FILE)).st_mtime_ns
+        version = ModelBundle.latest_version(self.models_root)
+        self._latest_mtime = mtime
+        if not force and self.bundle is not None and version == self.bundle.version:
+            return False
+        self.bundle = ModelBundle.load(self.models_root, version)
+        self.cache.reset(version)
+        return True
+
+    def _score_batch(self, user_ids):
+        """Lote síncrono (hilo del executor): features, scoring vectorizado y caché"""
+        bundle = self.bundle
+        features, _ = self.source.get(user_ids)
+        if features.empty:
+            return {}
+        scored = bundle.score_users(features)
+        scored['nivel_riesgo_final'] = scored['nivel_riesgo_final'].astype(str)
+        scored['nivel_riesgo_kmeans'] = scored['nivel_riesgo_kmeans'].astype(str)
+        records = scored[RESPONSE_COLUMNS].to_dict(orient='records')
+        scores = {user_id: {**record, 'model_version': bundle.version}
+                  for user_id, record in zip(scored['user_id'].tolist(), records)}
+        self.cache.put_many(scores, bundle.version)
+        return scores
+
+    async def score(self, user_ids):
+        """
+        Scores de varios usuarios: caché primero y el resto por micro-batching
+
+        Returns:
+            Tupla ({user_id: score}, [user_ids sin features])
+        """
+        if self.latest_changed():
+            # Versión nueva: se carga fuera del event loop y vacía la caché
+            await asyncio.get_running_loop().run_in_executor(self.batcher.executor, self.reload)
+        user_ids = list(dict.fromkeys(user_ids))
+        found = self.cache.get_many(user_ids)
+        pending = [user_id for user_id in user_ids if user_id not in found]
+        if pending:
+            found.update({k: v for k, v in (await self.batcher.submit(pending)).items() if v is not None})
+        missing = [user_id for user_id in user_ids if user_id not in found]
+        return {user_id: found[user_id] for user_id in user_ids if user_id in found}, missing
+
+    def metrics(self):
+        return {
+            'model_version': self.bundle.version,
+            'latency': self.latency.percentiles(),
+            'cache': self.cache.stats(),
+            'batching': self.batcher.stats(),
+        }
+
+
+def create_app(service):
+    """Aplicación FastAPI sobre un ScoringService"""
+    from contextlib import asynccontextmanager
+
+    from fastapi import FastAPI, HTTPException, Request
+    from pydantic import BaseModel
+
+    class BatchRequest(BaseModel):
+        user_ids: list[int]
+
+    @asynccontextmanager
+    async def lifespan(app):
+        service.batcher.start()
+        yield
+        await service.batcher.stop()
+
+    app = FastAPI(title="Aura - Scoring de Riesgo", lifespan=lifespan)
+
+    @app.middleware('http')
+    async def track_latency(request: Request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+        route = request.scope.get('route')
+        service.latency.record(getattr(route, 'path', request.url.path), time.perf_counter() - start)
+        return response
+
+    @app.get('/health')
+    async def health():
+        return {'status': 'ok', 'model_version': service.bundle.version}
+
+    @app.get('/users/{user_id}/risk')
+    async def user_risk(user_id: int):
+        scores, _ = await service.score([user_id])
+        if user_id not in scores:
+            raise HTTPException(status_code=404, detail=f"Usuario {user_id} sin features")
+        return {'user_id': user_id, **scores[user_id]}
+
+    @app.post('/risk/batch')
+    async def batch_risk(request: BatchRequest):
+        scores, missing = await service.score(request.user_ids)
+        return {'scores': [{'user_id': user_id, **score} for user_id, score in scores.items()],
+                'missing': missing}
+
+    @app.get('/metrics')
+    async def metrics():
+        return service.metrics()
+
+    @app.post('/admin/reload')
+    async def reload():
+        # Cargar el bundle (joblib) fuera del event loop para no bloquear las peticiones en curso
+        changed = await asyncio.get_running_loop().run_in_executor(service.batcher.executor,
+                                                                   lambda: service.reload(force=True))
+        return {'reloaded': changed, 'model_version': service.bundle.version}
+
+    return app
+
+
+def prepare_demo(workdir='scoring_demo', n_users=10_000, seed=42):
+    """
+    Base sintética, almacén de features y bundle de modelos locales para
+    ejecutar el servicio sin bases de datos reales
+
+    Returns:
+        Tupla (ruta del almacén, ruta de los modelos)
+    """
+    import contextlib
+    import io
+
+    from clustering_system import MultiLevelClusteringSystem
+    from extract_features import FeatureExtractor
+    from synthetic_data import generate_database
+
+    store_root = os.path.join(workdir, 'feature_store')
+    models_root = os.path.join(workdir, 'modelos')
+    if os.path.exists(os.path.join(models_root, LATEST_FILE)):
+        return store_root, models_root
+
+    os.makedirs(workdir, exist_ok=True)
+    print(f"Preparando demo local con {n_users} usuarios sintéticos en {workdir}/ ...")
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine, _ = generate_database(n_users, seed=seed, verbose=False)
+        extractor = FeatureExtractor(engine, None)
+        extractor.save_to_store(extractor.extract_all_features(), root=store_root)
+        engine.dispose()
+
+        system = MultiLevelClusteringSystem(store_root)
+        system.prepare_features()
+        system.kmeans_clustering(visualize=False, cache_dir=None)
+        system.dbscan_clustering(visualize=False)
+        system.gmm_clustering(visualize=False, state_path=None)
+        system.save_model_bundle(models_root)
+    return store_root, models_root
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servicio HTTP de scoring de riesgo")
+    parser.add_argument('--data', default='feature_store', help="Almacén/CSV de features")
+    parser.add_argument('--models', default=MODELS_ROOT, help="Directorio de bundles de modelos")
+    parser.add_argument('--host', default='127.0.0.1', help="Interfaz de escucha")
+    parser.add_argument('--port', type=int, default=8000, help="Puerto")
+    parser.add_argument('--max-batch-size', type=int, default=512, help="Usuarios máximos por lote")
+    parser.add_argument('--max-wait-ms', type=float, default=5.0, help="Espera máxima para completar un lote")
+    parser.add_argument('--cache-size', type=int, default=100_000, help="Usuarios en la caché LRU")
+    parser.add_argument('--demo', action='store_true', help="Generar datos sintéticos y modelos locales")
+    parser.add_argument('--demo-users', type=int, default=10_000, help="Usuarios de la demo")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    data, models = (prepare_demo(n_users=args.demo_users) if args.demo else (args.data, args.models))
+    bundle_columns = ModelBundle.load(models).feature_columns
+    service = ScoringService(
+        FeatureSource(data, columns=['user_id'] + bundle_columns), models_root=models,
+        max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms, cache_size=args.cache_size,
+    )
+    print(f"Modelo {service.bundle.version} | {len(service.source.df)} usuarios con features")
+    uvicorn.run(create_app(service), host=args.host, port=args.port)
@@ -0,0 +1,309 @@
+"""
+Scoring por Shards en Procesos Paralelos o en Otros Nodos
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Reparte los usuarios en shards por hash de user_id (estable entre procesos y
+máquinas), envía los modelos una sola vez a cada trabajador y une los
+resultados en una única salida con el orden de entrada. Cada shard solo
+devuelve sus columnas de scores, no las features ni columnas intermedias.
+
+Dos modos de ejecución:
+
+- Procesos locales (ShardedScorer): cada trabajador carga el modelo una vez al
+  arrancar y puntúa los shards que recibe.
+- Spool en directorio compartido: 'split' escribe el modelo y un Parquet por
+  shard en pending/; cualquier nodo que monte el directorio ejecuta 'worker',
+  que reclama shards con un rename atómico (pending/ -> claimed/) y deja el
+  resultado en done/; 'merge' los une.
+
+El modelo es cualquier objeto con score_users(df): un ModelBundle de
+MultiLevelClusteringSystem o el modelo de AuraRiskEnsemble.scoring_model().
+
+Uso:
+    python sharded_scoring.py --mode bench --models modelos --data feature_store --workers 1 2 4
+    python sharded_scoring.py --mode score --models modelos --data feature_store --workers 4 --output scores.csv
+    python sharded_scoring.py --mode split --models modelos --data feature_store --shards 16 --spool /mnt/aura/spool
+    python sharded_scoring.py --mode worker --spool /mnt/aura/spool        # en cada nodo
+    python sharded_scoring.py --mode merge --spool /mnt/aura/spool --output scores.csv
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import socket
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from lazy_imports import lazy_module
+
+pd = lazy_module('pandas')
+joblib = lazy_module('joblib')
+
+MODEL_FILE = 'model.joblib'
+SPOOL_DIRS = ('pending', 'claimed', 'done')
+
+# Modelo y límites de hilos de cada proceso trabajador (se cargan una vez)
+_worker_model = None
+_worker_limits = None
+
+
+def shard_ids(user_ids, n_shards):
+    """Shard de cada user_id: hash estable (no depende de PYTHONHASHSEED ni de la máquina)"""
+    hashes = pd.util.hash_array(np.asarray(user_ids))
+    return (hashes % np.uint64(n_shards)).astype(np.int64)
+
+
+def split_shards(df, n_shards):
+    """Lista de (nº de shard, filas del shard) con el índice original de df"""
+    ids = shard_ids(df['user_id'].to_numpy(), n_shards)
+    return [(int(shard), part) for shard, part in df.groupby(ids, sort=True)]
+
+
+def broadcast_model(model, directory):
+    """Escribe el modelo una sola vez para que lo carguen los trabajadores"""
+    path = os.path.join(directory, MODEL_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _init_worker(model_path):
+    global _worker_model, _worker_limits
+    from threadpoolctl import threadpool_limits
+    # Un hilo de BLAS/OpenMP por proceso: el paralelismo lo dan los shards
+    _worker_limits = threadpool_limits(limits=1)
+    _worker_model = joblib.load(model_path)
+
+
+def _score_shard(shard, part):
+    start = time.perf_counter()
+    result = _worker_model.score_users(part)
+    result.index = part.index
+    return shard, result, time.perf_counter() - start, os.getpid()
+
+
+class ShardedScorer:
+    """Scoring por shards de user_id en un pool de procesos con el modelo difundido una vez"""
+
+    def __init__(self, model, workers=None, n_shards=None, work_dir=None):
+        """
+        Args:
+            model: Objeto con score_users(df) (ModelBundle, EnsembleScoringModel)
+            workers: Procesos trabajadores (default: nº de CPUs)
+            n_shards: Shards por llamada (default: uno por trabajador)
+            work_dir: Directorio donde se deja el modelo para los trabajadores
+                (default: temporal, se borra al cerrar)
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.n_shards = n_shards or self.workers
+        self._own_dir = work_dir is None
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='aura_shards_')
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.model_path = broadcast_model(model, self.work_dir)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(self.model_path,))
+        self.last_run = None
+
+    def score(self, df):
+        """
+        Puntúa df por shards y une los resultados en el orden de entrada
+
+        Returns:
+            DataFrame con las columnas de score_users del modelo
+        """
+        start = time.perf_counter()
+        futures = [self.executor.submit(_score_shard, shard, part) for shard, part in split_shards(df, self.n_shards)]
+        results, shards = [], []
+        for future in futures:
+            shard, result, seconds, pid = future.result()
+            results.append(result)
+            shards.append({'shard': shard, 'rows': len(result), 'seconds': seconds, 'worker_pid': pid})
+        merged = pd.concat(results).reindex(df.index)
+        self.last_run = {'rows': len(df), 'seconds': time.perf_counter() - start, 'shards': shards}
+        return merged.reset_index(drop=True)
+
+    def close(self):
+        self.executor.shutdown()
+        if self._own_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def spool_shards(df, model, spool_dir, n_shards):
+    """Escribe el modelo y un Parquet por shard en spool_dir/pending (el spool debe estar vacío)"""
+    for name in SPOOL_DIRS:
+        os.makedirs(os.path.join(spool_dir, name), exist_ok=True)
+        if os.listdir(os.path.join(spool_dir, name)):
+            raise FileExistsError(f"El spool {spool_dir} ya tiene shards en {name}/")
+    broadcast_model(model, spool_dir)
+    shards = split_shards(df, n_shards)
+    for shard, part in shards:
+        path = os.path.join(spool_dir, 'pending', f"shard-{shard:05d}.parquet")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        part.to_parquet(tmp_path, index=True)
+        os.replace(tmp_path, path)
+    return len(shards)
+
+
+def run_spool_worker(spool_dir):
+    """
+    Reclama y puntúa shards pendientes hasta que no quede ninguno; varios
+    trabajadores (en este u otros nodos) pueden ejecutarse a la vez
+
+    Returns:
+        Número de shards puntuados por este trabajador
+    """
+    model = joblib.load(os.path.join(spool_dir, MODEL_FILE))
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    scored = 0
+    for pending in sorted(glob.glob(os.path.join(spool_dir, 'pending', 'shard-*.parquet'))):
+        name = os.path.basename(pending)
+        claimed = os.path.join(spool_dir, 'claimed', f"{name}.{worker}")
+        try:
+            os.rename(pending, claimed)
+        except FileNotFoundError:
+            continue  # otro trabajador lo reclamó antes
+        part = pd.read_parquet(claimed)
+        result = model.score_users(part)
+        result.index = part.index
+        done = os.path.join(spool_dir, 'done', name)
+        tmp_path = f"{done}.{worker}.tmp"
+        result.to_parquet(tmp_path, index=True)
+        os.replace(tmp_path, done)
+        os.remove(claimed)
+        scored += 1
+        print(f"  -> {name}: {len(part)} usuarios ({worker})")
+    return scored
+
+
+def merge_spool(spool_dir):
+    """Une los resultados de done/ en el orden de entrada; falla si quedan shards sin puntuar"""
+    unfinished = (glob.glob(os.path.join(spool_dir, 'pending', 'shard-*.parquet'))
+                  + glob.glob(os.path.join(spool_dir, 'claimed', 'shard-*')))
+    if unfinished:
+        raise RuntimeError(f"Quedan {len(unfinished)} shards sin puntuar en {spool_dir}")
+    paths = sorted(glob.glob(os.path.join(spool_dir, 'done', 'shard-*.parquet')))
+    if not paths:
+        raise FileNotFoundError(f"No hay resultados en {os.path.join(spool_dir, 'done')}")
+    return pd.concat([pd.read_parquet(path) for path in paths]).sort_index().reset_index(drop=True)
+
+
+def benchmark_sharding(model, df, workers_list=(1, 2, 4), repeats=3):
+    """
+    Throughput del scoring en un proceso frente a ShardedScorer con distinto nº
+    de trabajadores (mejor de repeats, tras una pasada de calentamiento) y
+    comprobación de que la salida unida es idéntica
+
+    Returns:
+        DataFrame con filas/s, aceleración respecto a un proceso y eficiencia
+        (aceleración / trabajadores) por nº de trabajadores
+    """
+    def best_time(function):
+        function()
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    expected = model.score_users(df)
+    rows = [{'workers': 'un proceso', 'seconds': best_time(lambda: model.score_users(df)), 'identical': True}]
+    for workers in workers_list:
+        with ShardedScorer(model, workers=workers) as scorer:
+            seconds = best_time(lambda: scorer.score(df))
+            try:
+                pd.testing.assert_frame_equal(scorer.score(df), expected)
+                identical = True
+            except AssertionError:
+                identical = False
+        rows.append({'workers': workers, 'seconds': seconds, 'identical': identical})
+
+    results = pd.DataFrame(rows)
+    results['rows_per_s'] = len(df) / results['seconds']
+    sharded = results['workers'] != 'un proceso'
+    results.loc[sharded, 'speedup'] = results['seconds'].iloc[0] / results.loc[sharded, 'seconds']
+    results.loc[sharded, 'efficiency'] = results.loc[sharded, 'speedup'] / results.loc[sharded, 'workers'].astype(float)
+
+    print(f"\n=== SCORING POR SHARDS: {len(df)} usuarios, {os.cpu_count()} CPUs ===")
+    print(results.to_string(index=False, float_format=lambda v: f"{v:,.3f}"))
+    if not results['identical'].all():
+        print("❌ La salida por shards no coincide con la de un proceso")
+    return results
+
+
+def _load_model(args, features):
+    if args.ensemble:
+        from clustering_ensemble import AuraRiskEnsemble
+        from instrumentation import Instrumentation
+        system = AuraRiskEnsemble(features, instrumentation=Instrumentation(renderer=None))
+        system.preprocess()
+        system.run_kmeans()
+        system.run_dbscan()
+        system.run_isolation_forest()
+        return system.scoring_model()
+    from model_bundle import ModelBundle
+    return ModelBundle.load(args.models, args.version)
+
+
+def _load_data(path, rows=None, seed=42):
+    if path.endswith('.csv'):
+        features = pd.read_csv(path)
+    else:
+        from feature_store import load_features
+        features = load_features(path)
+    if rows:
+        # Muestra con reemplazo y user_id nuevos para medir a más escala
+        features = features.sample(rows, replace=rows > len(features), random_state=seed).reset_index(drop=True)
+        features['user_id'] = np.arange(rows)
+    return features
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scoring por shards de user_id en procesos o nodos")
+    parser.add_argument('--mode', choices=['bench', 'score', 'split', 'worker', 'merge'], default='bench')
+    parser.add_argument('--models', default='modelos', help="Directorio de bundles de modelos")
+    parser.add_argument('--version', default=None, help="Versión del bundle (default: la vigente)")
+    parser.add_argument('--ensemble', action='store_true',
+                        help="Usar AuraRiskEnsemble (ajustado sobre --data) en lugar del bundle")
+    parser.add_argument('--data', default='feature_store', help="Almacén/CSV de features")
+    parser.add_argument('--rows', type=int, default=None, help="Remuestrear los datos a este nº de usuarios")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help="Procesos trabajadores")
+    parser.add_argument('--shards', type=int, default=None, help="Nº de shards (default: uno por trabajador)")
+    parser.add_argument('--spool', default='spool_scoring', help="Directorio compartido de shards")
+    parser.add_argument('--output', default=None, help="CSV de salida (score / merge)")
+    args = parser.parse_args()
+
+    if args.mode == 'worker':
+        print(f"✅ {run_spool_worker(args.spool)} shards puntuados")
+    elif args.mode == 'merge':
+        scores = merge_spool(args.spool)
+        output = args.output or 'scores_shards.csv'
+        scores.to_csv(output, index=False)
+        print(f"✅ {len(scores)} usuarios unidos en: {output}")
+    else:
+        features = _load_data(args.data, args.rows)
+        model = _load_model(args, features)
+        if args.mode == 'bench':
+            benchmark_sharding(model, features, args.workers)
+        elif args.mode == 'split':
+            n_shards = spool_shards(features, model, args.spool, args.shards or 16)
+            print(f"✅ {n_shards} shards de {len(features)} usuarios en: {os.path.join(args.spool, 'pending')}")
+        else:
+            with ShardedScorer(model, workers=args.workers[0], n_shards=args.shards) as scorer:
+                scores = scorer.score(features)
+            output = args.output or 'scores_shards.csv'
+            scores.to_csv(output, index=False)
+            print(f"✅ {len(scores)} usuarios puntuados en {scorer.last_run['seconds']:.2f}s "
+                  f"con {scorer.workers} procesos: {output}")
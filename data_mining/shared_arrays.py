@@ -0,0 +1,77 @@
+"""
+Matrices Compartidas entre Procesos sin Copias
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Copia una sola vez un array de numpy a un bloque de memoria compartida
+(multiprocessing.shared_memory). Los procesos trabajadores reciben solo su
+descriptor (nombre, forma y tipo) y lo abren como vista de solo lectura, en
+lugar de recibir el array serializado con pickle en cada tarea.
+
+Uso:
+    from shared_arrays import SharedArray, attach
+
+    with SharedArray(X) as shared:
+        executor.submit(tarea, shared.spec)      # en el trabajador: X = attach(spec)
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Bloques abiertos en este proceso (un trabajador reutiliza la vista entre tareas)
+_attached = {}
+
+
+class SharedArray:
+    """Copia de un array en memoria compartida; se libera al salir del bloque"""
+
+    def __init__(self, array):
+        array = np.ascontiguousarray(array)
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        self.shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+        self.array[...] = array
+
+    @property
+    def spec(self):
+        """Descriptor serializable (nombre, forma, tipo) que se envía a los trabajadores"""
+        return (self.shm.name, self.shape, self.dtype)
+
+    def close(self):
+        if self.shm is None:
+            return
+        self.array = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _release_others(name):
+    """Cierra los bloques de ejecuciones anteriores que ya no se usan"""
+    for other in [key for key in _attached if key != name]:
+        shm = _attached.pop(other)[0]
+        try:
+            shm.close()
+        except BufferError:
+            # Aún hay vistas vivas; se libera al terminar el proceso
+            pass
+
+
+def attach(spec):
+    """Vista de solo lectura de un SharedArray a partir de su descriptor"""
+    name, shape, dtype = spec
+    if name not in _attached:
+        _release_others(name)
+        shm = shared_memory.SharedMemory(name=name)
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        array.flags.writeable = False
+        _attached[name] = (shm, array)
+    return _attached[name][1]
@@ -0,0 +1,474 @@
+"""
+Generador Sintético de la Base de Datos de Aura a Gran Escala
+Autor: Sistema Aura - Análisis de Datos
+Fecha: 2025-11-28
+
+Rellena el esquema de local_db (SQLite o MySQL) con datos reproducibles a
+10k / 100k / 1M usuarios. A diferencia de seed_database, la actividad no es
+uniforme: cada usuario tiene una actividad y una popularidad con cola pesada
+(log-normal), las comunidades siguen una ley de Zipf y un grupo de usuarios en
+riesgo publica de madrugada, bloquea más y lleva más tiempo inactivo. Los datos
+se generan por bloques de usuarios, así que la memoria no crece con la escala.
+
+Uso:
+    python synthetic_data.py --scale 100k --db aura_100k.db
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from local_db import SCHEMA_DDL, create_local_engine
+
+SCALES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+
+# Media de filas por usuario (ponderada por actividad) de cada tabla
+ROWS_PER_USER = {
+    'friendships': 3,
+    'community_members': 2,
+    'posts': 4,
+    'comments': 6,
+    'conversations': 2,
+    'interests': 2,
+}
+MESSAGES_PER_CONVERSATION = 5
+PREFERENCES_SHARE = 0.7
+
+FRIENDSHIP_STATUSES = ['accepted', 'pending', 'rejected', 'blocked']
+FRIENDSHIP_PROBS = [0.6, 0.2, 0.1, 0.1]
+FRIENDSHIP_PROBS_AT_RISK = [0.35, 0.2, 0.15, 0.3]
+
+MESSAGE_CONTENTS = ['hola ' * k for k in range(1, 41)]
+PREFERENCE_DOCS = [json.dumps({f'pref_{k}': True for k in range(n)}) for n in range(7)]
+
+
+def scale_users(scale):
+    """Número de usuarios de una escala ('10k', '100k', '1m') o de un entero"""
+    if str(scale).lower() in SCALES:
+        return SCALES[str(scale).lower()]
+    return int(scale)
+
+
+def _weights(rng, n, sigma):
+    """Pesos log-normales con media 1 (cola pesada: pocos usuarios concentran la actividad)"""
+    weights = rng.lognormal(mean=0.0, sigma=sigma, size=n)
+    return weights / weights.mean()
+
+
+def _sample(rng, cdf, size):
+    """Índices muestreados según una CDF acumulada (normalizada a 1)"""
+    return np.minimum(np.searchsorted(cdf, rng.random(size), side='right'), len(cdf) - 1)
+
+
+class SyntheticAuraGenerator:
+    """Genera y carga por bloques una base sintética de Aura con actividad sesgada"""
+
+    def __init__(self, n_users, seed=42, now=None, block_size=50_000, at_risk_share=0.08):
+        """
+        Args:
+            n_users: Número de perfiles (ver SCALES)
+            seed: Semilla; la misma semilla y escala producen la misma base
+            now: Instante de referencia de los timestamps (default: 2025-11-28 12:00)
+            block_size: Usuarios generados e insertados a la vez
+            at_risk_share: Proporción de usuarios con patrón de riesgo
+        """
+        self.n_users = int(n_users)
+        self.seed = seed
+        self.now = now or datetime(2025, 11, 28, 12, 0, 0)
+        self.block_size = block_size
+        self.at_risk_share = at_risk_share
+        self.row_counts = {}
+
+    # ------------------------------------------------------------------
+    # Rasgos por usuario
+    # ------------------------------------------------------------------
+
+    def _user_traits(self, rng):
+        n = self.n_users
+        at_risk = rng.random(n) < self.at_risk_share
+        activity = _weights(rng, n, sigma=1.0)
+        # Los usuarios en riesgo participan menos pero no desaparecen
+        activity[at_risk] *= 0.3
+        popularity = _weights(rng, n, sigma=1.3)
+        popularity[at_risk] *= 0.2
+
+        n_posts = rng.poisson(ROWS_PER_USER['posts'] * activity)
+        post_start = np.concatenate([[1], 1 + np.cumsum(n_posts)[:-1]])
+
+        authors = np.flatnonzero(n_posts)
+        author_cdf = np.cumsum(popularity[authors])
+        author_cdf /= author_cdf[-1]
+        popularity_cdf = np.cumsum(popularity)
+        popularity_cdf /= popularity_cdf[-1]
+
+        n_communities = max(5, n // 50)
+        community_weights = 1.0 / np.arange(1, n_communities + 1) ** 1.1
+        community_cdf = np.cumsum(community_weights) / community_weights.sum()
+
+        return {
+            'at_risk': at_risk,
+            'activity': activity,
+            'popularity': popularity,
+            'popularity_cdf': popularity_cdf,
+            'n_posts': n_posts,
+            'post_start': post_start,
+            'authors': authors,
+            'author_cdf': author_cdf,
+            'n_communities': n_communities,
+            'community_cdf': community_cdf,
+        }
+
+    # ------------------------------------------------------------------
+    # Timestamps
+    # ------------------------------------------------------------------
+
+    def _seconds_ago(self, rng, size, scale_days, max_days):
+        """Antigüedad en segundos: exponencial (lo reciente abunda), acotada a max_days"""
+        days = np.minimum(rng.exponential(scale_days, size), max_days)
+        return (days * 86400).astype(np.int64)
+
+    def _timestamps(self, rng, seconds_ago, night=None):
+        """
+        Convierte antigüedades a texto 'YYYY-MM-DD HH:MM:SS'
+
+        Args:
+            night: Máscara de filas que se mueven a una hora entre 0 y 5
+        """
+        moments = np.datetime64(self.now, 's') - seconds_ago.astype('timedelta64[s]')
+        if night is not None and night.any():
+            days = moments[night].astype('datetime64[D]').astype('datetime64[s]')
+            offsets = rng.integers(0, 6 * 3600, int(night.sum())).astype('timedelta64[s]')
+            moments[night] = np.minimum(days + offsets, np.datetime64(self.now, 's'))
+        return np.char.replace(np.datetime_as_string(moments, unit='s'), 'T', ' ')
+
+    # ------------------------------------------------------------------
+    # Tablas de un bloque de usuarios
+    # ------------------------------------------------------------------
+
+    def _profiles(self, rng, users, traits):
+        idx = users - 1
+        n = len(users)
+        at_risk = traits['at_risk'][idx]
+        created_ago = self._seconds_ago(rng, n, 250, 730)
+        # Los usuarios en riesgo llevan más tiempo sin entrar
+        inactive_ago = self._seconds_ago(rng, n, np.where(at_risk, 60, 7), 365)
+        inactive_ago = np.minimum(inactive_ago, created_ago)
+        created = self._timestamps(rng, created_ago)
+        years = rng.integers(1995, 2011, n)
+        months = rng.integers(1, 13, n)
+        return pd.DataFrame({
+            'user_id': users,
+            'bio': np.array(['x' * k for k in range(201)])[rng.integers(0, 201, n)],
+            'birth_date': [f"{y}-{m:02d}-15 00:00:00" for y, m in zip(years, months)],
+            'gender': np.array(['female', 'male', 'other'])[_sample(rng, np.array([0.48, 0.96, 1.0]), n)],
+            'is_verified': (rng.random(n) < 0.1 * np.minimum(traits['popularity'][idx], 5)).astype(int),
+            'is_active': (rng.random(n) < 0.95).astype(int),
+            'followers_count': rng.poisson(50 * traits['popularity'][idx]),
+            'following_count': rng.poisson(50 * traits['activity'][idx]),
+            'posts_count': traits['n_posts'][idx],
+            'last_active_at': self._timestamps(rng, inactive_ago),
+            'created_at': created,
+            'updated_at': created,
+        })
+
+    def _friendships(self, rng, users, traits):
+        idx = users - 1
+        counts = rng.poisson(ROWS_PER_USER['friendships'] * traits['activity'][idx])
+        requesters = np.repeat(users, counts)
+        addressees = _sample(rng, traits['popularity_cdf'], len(requesters)) + 1
+        df = pd.DataFrame({'requester_id': requesters, 'addressee_id': addressees})
+        df = df[df['requester_id'] != df['addressee_id']].drop_duplicates()
+
+        n = len(df)
+        risky = traits['at_risk'][df['requester_id'].to_numpy() - 1]
+        status = np.where(
+            risky,
+            np.array(FRIENDSHIP_STATUSES)[_sample(rng, np.cumsum(FRIENDSHIP_PROBS_AT_RISK), n)],
+            np.array(FRIENDSHIP_STATUSES)[_sample(rng, np.cumsum(FRIENDSHIP_PROBS), n)],
+        )
+        created_ago = self._seconds_ago(rng, n, 120, 730)
+        updated_ago = (created_ago * rng.random(n)).astype(np.int64)
+        return df.assign(
+            status=status,
+            is_active=(rng.random(n) < 0.95).astype(int),
+            created_at=self._timestamps(rng, created_ago),
+            updated_at=self._timestamps(rng, updated_ago),
+        )
+
+    def _community_members(self, rng, users, traits):
+        idx = users - 1
+        counts = np.minimum(
+            rng.poisson(ROWS_PER_USER['community_members'] * traits['activity'][idx]),
+            traits['n_communities'],
+        )
+        df = pd.DataFrame({
+            'community_id': _sample(rng, traits['community_cdf'], int(counts.sum())) + 1,
+            'user_id': np.repeat(users, counts),
+        }).drop_duplicates()
+        return df.assign(joined_at=self._timestamps(rng, self._seconds_ago(rng, len(df), 150, 730)))
+
+    def _posts(self, rng, users, traits):
+        idx = users - 1
+        counts = traits['n_posts'][idx]
+        authors = np.repeat(users, counts)
+        n = len(authors)
+        ids = np.repeat(traits['post_start'][idx], counts) + (
+            np.arange(n) - np.repeat(np.cumsum(counts) - counts, counts)
+        )
+        popularity = traits['popularity'][authors - 1]
+        night = traits['at_risk'][authors - 1] & (rng.random(n) < 0.6)
+        created = self._timestamps(rng, self._seconds_ago(rng, n, 60, 365), night=night)
+        return pd.DataFrame({
+            'id': ids,
+            'user_id': authors,
+            'visibility': np.array(['public', 'friends', 'private'])[_sample(rng, np.array([0.5, 0.8, 1.0]), n)],
+            'likes_count': rng.poisson(10 * popularity),
+            'comments_count': rng.poisson(2 * popularity),
+            'shares_count': rng.poisson(popularity),
+            'is_active': (rng.random(n) < 0.95).astype(int),
+            'created_at': created,
+            'updated_at': created,
+        })
+
+    def _comments(self, rng, users, traits, first_id):
+        idx = users - 1
+        counts = rng.poisson(ROWS_PER_USER['comments'] * traits['activity'][idx])
+        commenters = np.repeat(users, counts)
+        n = len(commenters)
+        # Se comentan sobre todo las publicaciones de los usuarios populares
+        owners = traits['authors'][_sample(rng, traits['author_cdf'], n)]
+        post_ids = traits['post_start'][owners] + (rng.random(n) * traits['n_posts'][owners]).astype(np.int64)
+        created_ago = self._seconds_ago(rng, n, 45, 365)
+        return pd.DataFrame({
+            'id': np.arange(first_id, first_id + n),
+            'post_id': post_ids,
+            'user_id': commenters,
+            'likes_count': rng.poisson(2, n),
+            'is_active': (rng.random(n) < 0.9).astype(int),
+            'created_at': self._timestamps(rng, created_ago),
+            'updated_at': self._timestamps(rng, (created_ago * rng.random(n)).astype(np.int64)),
+        })
+
+    def _conversations_and_messages(self, rng, users, traits, first_conversation, first_message):
+        idx = users - 1
+        counts = rng.poisson(ROWS_PER_USER['conversations'] * traits['activity'][idx])
+        first = np.repeat(users, counts)
+        n = len(first)
+        second = _sample(rng, traits['popularity_cdf'], n) + 1
+        second = np.where(second == first, second % self.n_users + 1, second)
+        conversation_ids = np.arange(first_conversation, first_conversation + n)
+
+        activity = (traits['activity'][first - 1] + traits['activity'][second - 1]) / 2
+        n_messages = rng.poisson(MESSAGES_PER_CONVERSATION * activity)
+        m = int(n_messages.sum())
+        message_conversation = np.repeat(conversation_ids, n_messages)
+        from_first = rng.random(m) < 0.5
+        senders = np.where(from_first, np.repeat(first, n_messages), np.repeat(second, n_messages))
+        message_ago = self._seconds_ago(rng, m, 20, 90)
+        night = traits['at_risk'][senders - 1] & (rng.random(m) < 0.6)
+
+        # last_message_at es el mensaje más reciente; sin mensajes, la creación
+        created_ago = self._seconds_ago(rng, n, 90, 365)
+        last_ago = created_ago.copy()
+        has_messages = n_messages > 0
+        if m:
+            starts = np.concatenate([[0], np.cumsum(n_messages)[:-1]])[has_messages]
+            last_ago[has_messages] = np.minimum.reduceat(message_ago, starts)
+
+        status_1 = np.where(
+            traits['at_risk'][first - 1],
+            np.array(['active', 'archived', 'blocked'])[_sample(rng, np.array([0.4, 0.7, 1.0]), n)],
+            np.array(['active', 'archived', 'blocked'])[_sample(rng, np.array([0.7, 0.9, 1.0]), n)],
+        )
+        conversations = pd.DataFrame({
+            'id': conversation_ids,
+            'participant1_profile_id': first,
+            'participant2_profile_id': second,
+            'participant1_status': status_1,
+            'participant2_status': np.array(['active', 'archived'])[_sample(rng, np.array([0.75, 1.0]), n)],
+            'unread_count_1': rng.poisson(np.where(traits['at_risk'][first - 1], 12, 3)),
+            'unread_count_2': rng.poisson(3, n),
+            'last_message_at': self._timestamps(rng, last_ago),
+            'created_at': self._timestamps(rng, created_ago),
+        })
+        messages = pd.DataFrame({
+            'id': np.arange(first_message, first_message + m),
+            'conversation_id': message_conversation,
+            'sender_profile_id': senders,
+            'content': np.array(MESSAGE_CONTENTS)[rng.integers(0, len(MESSAGE_CONTENTS), m)],
+            'is_edited': (rng.random(m) < 0.05).astype(int),
+            'is_deleted': (rng.random(m) < 0.03).astype(int),
+            'created_at': self._timestamps(rng, message_ago, night=night),
+        })
+        return conversations, messages
+
+    def _preferences(self, rng, users, first_id):
+        owners = users[rng.random(len(users)) < PREFERENCES_SHARE]
+        n = len(owners)
+        created_ago = self._seconds_ago(rng, n, 200, 730)
+        return pd.DataFrame({
+            'id': np.arange(first_id, first_id + n),
+            'user_id': owners,
+            'preferences': np.array(PREFERENCE_DOCS)[rng.integers(0, len(PREFERENCE_DOCS), n)],
+            'created_at': self._timestamps(rng, created_ago),
+            'updated_at': self._timestamps(rng, (created_ago * rng.random(n)).astype(np.int64)),
+        })
+
+    def _interests(self, rng, users, first_id):
+        counts = rng.poisson(ROWS_PER_USER['interests'], len(users))
+        n = int(counts.sum())
+        return pd.DataFrame({
+            'id': np.arange(first_id, first_id + n),
+            'user_id': np.repeat(users, counts),
+            'name': np.array([f'interes_{k}' for k in range(1, 41)])[_sample(
+                rng, np.cumsum(1.0 / np.arange(1, 41)) / np.sum(1.0 / np.arange(1, 41)), n)],
+            'created_at': self._timestamps(rng, self._seconds_ago(rng, n, 200, 730)),
+        })
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+
+    def _insert(self, conn, paramstyle, table, df):
+        if df.empty:
+            return
+        df = df.reset_index(drop=True)
+        if 'id' not in df.columns and table in ('friendships', 'community_members'):
+            start = self.row_counts.get(table, 0) + 1
+            df.insert(0, 'id', np.arange(start, start + len(df)))
+        columns = list(df.columns)
+        marker = '?' if paramstyle == 'qmark' else '%s'
+        sql = (f"INSERT INTO {table} ({', '.join(columns)}) "
+               f"VALUES ({', '.join(marker for _ in columns)})")
+        # tolist() devuelve tipos nativos de Python, que aceptan todos los drivers
+        rows = list(zip(*(df[col].to_numpy().tolist() for col in columns)))
+        conn.cursor().executemany(sql, rows)
+        self.row_counts[table] = self.row_counts.get(table, 0) + len(df)
+
+    def generate(self, engine, create_schema=True, verbose=True):
+        """
+        Genera la base completa
+
+        Con create_schema las tablas se crean antes de cargar y los índices
+        después, que es bastante más rápido que mantenerlos durante la carga.
+
+        Returns:
+            Diccionario tabla -> filas insertadas
+        """
+        rng = np.random.default_rng(self.seed)
+        traits = self._user_traits(rng)
+        self.row_counts = {}
+        start = time.perf_counter()
+
+        tables_ddl = [ddl for ddl in SCHEMA_DDL if ddl.lstrip().upper().startswith('CREATE TABLE')]
+        index_ddl = [ddl for ddl in SCHEMA_DDL if ddl not in tables_ddl]
+
+        raw = engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            paramstyle = engine.dialect.paramstyle
+            if engine.dialect.name == 'sqlite':
+                cursor.execute("PRAGMA synchronous = OFF")
+                cursor.execute("PRAGMA journal_mode = MEMORY")
+            if create_schema:
+                for ddl in tables_ddl:
+                    cursor.execute(ddl)
+
+            membership_counts = np.zeros(traits['n_communities'], dtype=np.int64)
+            for lo in range(1, self.n_users + 1, self.block_size):
+                users = np.arange(lo, min(lo + self.block_size, self.n_users + 1))
+                # Un generador por bloque, derivado de la semilla y del primer usuario
+                block_rng = np.random.default_rng([self.seed, lo])
+
+                self._insert(raw, paramstyle, 'user_profiles', self._profiles(block_rng, users, traits))
+                self._insert(raw, paramstyle, 'friendships', self._friendships(block_rng, users, traits))
+                members = self._community_members(block_rng, users, traits)
+                membership_counts += np.bincount(members['community_id'] - 1, minlength=len(membership_counts))
+                self._insert(raw, paramstyle, 'community_members', members)
+                self._insert(raw, paramstyle, 'posts', self._posts(block_rng, users, traits))
+                self._insert(raw, paramstyle, 'comments', self._comments(
+                    block_rng, users, traits, self.row_counts.get('comments', 0) + 1))
+                conversations, messages = self._conversations_and_messages(
+                    block_rng, users, traits,
+                    self.row_counts.get('conversations', 0) + 1, self.row_counts.get('messages', 0) + 1)
+                self._insert(raw, paramstyle, 'conversations', conversations)
+                self._insert(raw, paramstyle, 'messages', messages)
+                self._insert(raw, paramstyle, 'user_preferences', self._preferences(
+                    block_rng, users, self.row_counts.get('user_preferences', 0) + 1))
+                self._insert(raw, paramstyle, 'interests', self._interests(
+                    block_rng, users, self.row_counts.get('interests', 0) + 1))
+                raw.commit()
+                if verbose:
+                    print(f"  Usuarios generados: {users[-1]}/{self.n_users} "
+                          f"({time.perf_counter() - start:.1f}s)")
+
+            n = traits['n_communities']
+            created_ago = self._seconds_ago(rng, n, 300, 730)
+            self._insert(raw, paramstyle, 'communities', pd.DataFrame({
+                'id': np.arange(1, n + 1),
+                'name': [f'comunidad_{i}' for i in range(1, n + 1)],
+                'members_count': membership_counts,
+                'is_active': (rng.random(n) < 0.9).astype(int),
+                'created_at': self._timestamps(rng, created_ago),
+                'updated_at': self._timestamps(rng, (created_ago * rng.random(n)).astype(np.int64)),
+            }))
+
+            if create_schema:
+                if verbose:
+                    print("  Creando índices...")
+                for ddl in index_ddl:
+                    cursor.execute(ddl)
+            raw.commit()
+        finally:
+            raw.close()
+
+        if verbose:
+            print(f"✅ Base sintética generada en {time.perf_counter() - start:.1f}s")
+            for table, rows in sorted(self.row_counts.items()):
+                print(f"  {table}: {rows} filas")
+        return dict(self.row_counts)
+
+
+def generate_database(scale='10k', path=None, seed=42, now=None, block_size=50_000, verbose=True):
+    """
+    Crea un engine local (create_local_engine) y lo rellena a la escala indicada
+
+    Args:
+        scale: '10k', '100k', '1m' o un número de usuarios
+        path: Fichero SQLite (None = en memoria)
+
+    Returns:
+        Tupla (engine, filas por tabla)
+    """
+    generator = SyntheticAuraGenerator(scale_users(scale), seed=seed, now=now, block_size=block_size)
+    engine = create_local_engine(path, now=generator.now)
+    row_counts = generator.generate(engine, verbose=verbose)
+    return engine, row_counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera una base sintética de Aura")
+    parser.add_argument('--scale', default='10k', help="10k, 100k, 1m o número de usuarios")
+    parser.add_argument('--db', default=None, help="Fichero SQLite de destino")
+    parser.add_argument('--uri', default=None, help="Base MySQL vacía de destino (en lugar de SQLite)")
+    parser.add_argument('--seed', type=int, default=42, help="Semilla del generador")
+    parser.add_argument('--block-size', type=int, default=50_000, help="Usuarios por bloque de carga")
+    args = parser.parse_args()
+
+    if args.uri:
+        from sqlalchemy import create_engine
+        SyntheticAuraGenerator(
+            scale_users(args.scale), seed=args.seed, block_size=args.block_size,
+        ).generate(create_engine(args.uri))
+    else:
+        if args.db is None:
+            parser.error("indica --db (fichero SQLite) o --uri")
+        generate_database(args.scale, args.db, seed=args.seed, block_size=args.block_size)
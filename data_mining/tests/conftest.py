@@ -0,0 +1,33 @@
+"""
+Fixtures comunes de las pruebas de data_mining
+
+Los módulos de data_mining se importan por nombre (sin paquete), así que se
+añade su directorio al path. Los datos salen de la base sintética de
+synthetic_data (con grupos de usuarios en riesgo, a diferencia de la siembra
+uniforme de local_db.seed_database).
+"""
+
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+NOW = datetime(2025, 11, 28, 12, 0, 0)
+
+
+@pytest.fixture(scope='session')
+def feature_store(tmp_path_factory):
+    """Almacén de features extraídas de una base sintética de 3000 usuarios"""
+    from extract_features import FeatureExtractor
+    from feature_store import FeatureStore
+    from instrumentation import Instrumentation
+    from synthetic_data import generate_database
+
+    engine, _ = generate_database(3000, now=NOW, verbose=False)
+    extractor = FeatureExtractor(engine, None, as_of=NOW, instrumentation=Instrumentation(renderer=None))
+    root = str(tmp_path_factory.mktemp('data') / 'feature_store')
+    FeatureStore(root).write(extractor.extract_all_features(), extraction_date=NOW.date().isoformat())
+    return root
@@ -0,0 +1,18 @@
+"""Presupuesto de importación: cada módulo en un intérprete nuevo (import_budget.py)"""
+
+import os
+
+import pytest
+
+from import_budget import IMPORT_BUDGETS, check_import_budgets
+
+# Multiplicador de los presupuestos en máquinas lentas o CI compartido
+SLACK = float(os.environ.get('IMPORT_BUDGET_SLACK', '1.0'))
+
+
+@pytest.mark.parametrize('module', sorted(IMPORT_BUDGETS))
+def test_import_within_budget(module):
+    [result] = check_import_budgets({module: IMPORT_BUDGETS[module]}, slack=SLACK)
+
+    assert not result['loaded'], f"{module} carga al importarse: {', '.join(result['loaded'])}"
+    assert result['ok'], f"{module}: {result['elapsed_s']:.3f}s > {result['budget_s']:.3f}s"
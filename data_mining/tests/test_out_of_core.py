@@ -0,0 +1,21 @@
+"""Entrenamiento fuera de memoria frente al entrenamiento en memoria (check_tolerances)"""
+
+from out_of_core import OutOfCoreTrainer, check_tolerances
+
+
+def test_check_tolerances_with_reservoir_smaller_than_data(feature_store):
+    trainer = OutOfCoreTrainer(chunk_size=400, batch_size=256, reservoir_size=500).fit(feature_store)
+
+    assert trainer.stats['rows'] > trainer.stats['reservoir_rows'] == 500
+    results = check_tolerances(feature_store, trainer)
+    failed = [result for result in results if not result['ok']]
+    assert not failed, failed
+
+
+def test_check_tolerances_skips_sample_models_with_complete_reservoir(feature_store):
+    trainer = OutOfCoreTrainer(chunk_size=400, batch_size=256).fit(feature_store)
+
+    results = {result['metric']: result for result in check_tolerances(feature_store, trainer)}
+    assert results['gmm_em_loglik_gap_max']['ok'] is None
+    assert results['iso_spearman_min']['ok'] is None
+    assert results['kmeans_ari_min']['ok'] and results['kmeans_inertia_ratio_max']['ok']